@@ -1,23 +1,66 @@
 #!/usr/bin/env python3
-import json, subprocess, shutil
+import os, json, time, subprocess, shutil
 from pathlib import Path
 from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+from knowledge_io import find_knowledge, open_knowledge
+from chunk_store import ChunkStore
+from perf_history import update_history, summarize, fmt_value
 
 ROOT = Path('/workspace')
-ME = ROOT / 'me'
+ME = Path(os.getenv('KN_ME_ROOT', str(ROOT / 'me')))
 AI = ME / 'ai'
 AI.mkdir(parents=True, exist_ok=True)
 UTC = timezone.utc
-
-
-def sh(cmd: str) -> str:
+PROBE_CACHE = ME / '.probe_cache.json'
+PROBE_TIMEOUT = float(os.getenv('KN_PROBE_TIMEOUT', '5'))
+PROBE_RETRY_SECS = 300
+# name -> (command, seconds a result stays valid); hardware and tool versions rarely change
+PROBES = {
+    'lscpu': ('lscpu', 86400),
+    'free': ('free -h', 60),
+    'uname': ('uname -a', 86400),
+    'python': ('python3 -V', 86400),
+    'openssl': ('openssl version', 86400),
+    'php': ('php -v | head -n 2', 86400),
+    'composer': ('composer -V', 86400),
+}
+_probe_cache = None
+
+
+def sh(cmd: str, timeout: float | None = None) -> str:
     try:
-        out = subprocess.check_output(cmd, shell=True, stderr=subprocess.DEVNULL)
+        out = subprocess.check_output(cmd, shell=True, stderr=subprocess.DEVNULL, timeout=timeout)
         return out.decode('utf-8', errors='replace').strip()
     except Exception:
         return ''
 
 
+def probe_all() -> dict:
+    """Outputs of PROBES, re-running only expired ones, concurrently and with a timeout.
+
+    Results persist in me/.probe_cache.json (and in memory for the daemon); a probe
+    that failed or timed out is retried after PROBE_RETRY_SECS.
+    """
+    global _probe_cache
+    if _probe_cache is None:
+        _probe_cache = read_json(PROBE_CACHE)
+    now = time.time()
+    stale = []
+    for name, (_, ttl) in PROBES.items():
+        entry = _probe_cache.get(name)
+        if not entry or now - entry['at'] >= (ttl if entry['out'] else min(ttl, PROBE_RETRY_SECS)):
+            stale.append(name)
+    if stale:
+        with ThreadPoolExecutor(max_workers=len(stale)) as pool:
+            outs = pool.map(lambda name: sh(PROBES[name][0], PROBE_TIMEOUT), stale)
+            for name, out in zip(stale, outs):
+                _probe_cache[name] = {'at': now, 'out': out}
+        write(PROBE_CACHE, json.dumps(_probe_cache, ensure_ascii=False))
+    return {name: _probe_cache[name]['out'] for name in PROBES}
+
+
 def read_json(p: Path):
     try:
         return json.loads(p.read_text())
@@ -33,26 +76,21 @@ def section(title: str) -> str:
     return f"### {title}\n\n"
 
 
-def build_environment_md() -> str:
+def build_environment_md(probes: dict | None = None) -> str:
+    probes = probes or probe_all()
     lines = []
     lines.append(section('البيئة'))
-    lscpu = sh('lscpu')
-    free = sh('free -h')
-    uname = sh('uname -a')
-    lines.append('````\n' + lscpu + '\n````\n')
-    lines.append('````\n' + free + '\n````\n')
-    lines.append('````\n' + uname + '\n````\n')
+    lines.append('````\n' + probes['lscpu'] + '\n````\n')
+    lines.append('````\n' + probes['free'] + '\n````\n')
+    lines.append('````\n' + probes['uname'] + '\n````\n')
     return '\n'.join(lines)
 
 
-def build_tools_md() -> str:
+def build_tools_md(probes: dict | None = None) -> str:
+    probes = probes or probe_all()
     lines = []
     lines.append(section('الأدوات'))
-    py = sh('python3 -V')
-    ossl = sh('openssl version')
-    php = sh('php -v | head -n 2')
-    comp = sh('composer -V')
-    lines.append('````\n' + '\n'.join([py, ossl, php, comp]) + '\n````\n')
+    lines.append('````\n' + '\n'.join([probes['python'], probes['openssl'], probes['php'], probes['composer']]) + '\n````\n')
     return '\n'.join(lines)
 
 
@@ -62,7 +100,8 @@ def build_learning_engine_md(knowledge):
     lines.append(section('محرّك التعلّم'))
     lines.append('- نمط: inotify (إن فُعّل) أو polling قابل للضبط\n')
     lines.append('- كتابة شرطية + Cache للبصمات + تحديث انتقائي\n')
-    lines.append('- المخرجات: `me/knowledge.json`, `me/INDEX.md`, `me/SUMMARY.md`\n')
+    lines.append('- بحث نصي (BM25) في `tran/`: `python3 bin/text_index.py [-n 10] <كلمات>` (فهرس `me/.knowledge_fts/`)\n')
+    lines.append('- المخرجات: `me/knowledge.json` (أو `me/knowledge.jsonl` مع `KN_OUTPUT_FORMAT=jsonl`), `me/INDEX.md`, `me/SUMMARY.md`\n')
     lines.append(section('إحصاءات'))
     lines.append(f"- عدد الملفات: {knowledge.get('file_count','?')}\n")
     lines.append(f"- آخر توليد: {knowledge.get('generated_at_utc','?')}\n")
@@ -80,10 +119,20 @@ def build_learning_engine_md(knowledge):
 def build_performance_md() -> str:
     lines = []
     lines.append(section('أداء مرجعي'))
-    lines.append('- CPU (OpenSSL): SHA-256 ≈ 7.28 GB/s, AES-256-CBC ≈ 5.55 GB/s, RSA-2048 (sign≈16k/s, verify≈264k/s)\n')
-    lines.append('- Disk: write ≈ 474 MB/s, read ≈ 722 MB/s\n')
-    lines.append('- Network: 100MB ≈ 0.325s (~2.6 Gbps)\n')
-    lines.append('- FS small files: create 5k ≈ 0.181s, read ≈ 0.033s\n')
+    history = update_history()
+    rows = summarize(history)
+    if not rows:
+        lines.append('- لا توجد تقارير أداء في `reports/` بعد\n')
+    else:
+        hosts = sorted({r['host'] for r in rows})
+        lines.append(f"- من {len(history['parsed'])} تقرير في `reports/perf-*` (المضيف: {', '.join(hosts)})\n")
+        lines.append('| المقياس | آخر قيمة | الوسيط السابق | التغيّر | عدد القياسات | الحالة |\n|---|---:|---:|---:|---:|---|')
+        for r in rows:
+            delta = '-' if r['delta_pct'] is None else f"{r['delta_pct']:+.1f}%"
+            status = '⚠️ تراجع' if r['regressed'] else '✅'
+            lines.append(f"| {r['metric']} | {fmt_value(r['latest'], r['unit'])} | {fmt_value(r['median'], r['unit'])} "
+                         f"| {delta} | {r['runs']} | {status} |")
+        lines.append('')
     lines.append('- التقرير الشامل عبر: `bin/measure_all.sh`\n')
     return '\n'.join(lines)
 
@@ -91,20 +140,45 @@ def build_performance_md() -> str:
 def build_api_md(knowledge):
     lines = []
     lines.append(section('API'))
-    lines.append('- وثيقة: `tran/api/openapi.yaml`\n')
-    lines.append('- مسارات عامة: `/api/{model}`, `/api/{model}/{id}`\n')
+    specs = read_json(ME / 'openapi_index.json').get('specs', {})
+    if not specs:
+        lines.append('- لا توجد وثيقة OpenAPI مفهرسة في `tran/api/`\n')
+    for rel, spec in sorted(specs.items()):
+        if 'error' in spec:
+            lines.append(f"- وثيقة: `{rel}` (خطأ في التحليل: {spec['error']})\n")
+            continue
+        lines.append(f"- وثيقة: `{rel}` — {spec.get('title')} {spec.get('version')} "
+                     f"({spec.get('paths', 0)} مسار، {len(spec.get('operations', []))} عملية)\n")
+        lines.append('| الطريقة | المسار | operationId | الوصف |\n|---|---|---|---|')
+        for op in spec.get('operations', []):
+            lines.append(f"| {op['method']} | `{op['path']}` | {op.get('operationId') or '-'} | {op.get('summary') or ''} |")
+        lines.append('')
     return '\n'.join(lines)
 
 
 def build_datasets_md():
     lines = []
     lines.append(section('البيانات'))
-    lines.append('- `tran/datasets/sample_posts.csv`: 3 أعمدة، 2 صف\n')
+    datasets = read_json(ME / 'datasets.json').get('datasets', {})
+    if not datasets:
+        lines.append('- لا توجد ملفات CSV مفهرسة في `tran/datasets/`\n')
+    for rel, prof in sorted(datasets.items()):
+        if 'error' in prof:
+            lines.append(f"- `{rel}`: خطأ في القراءة ({prof['error']})\n")
+            continue
+        approx = '' if prof.get('rows_exact') else ' (تقريبي)'
+        lines.append(f"- `{rel}`: {prof.get('columns')} أعمدة، {prof.get('rows')} صف{approx}، {prof.get('size')} بايت\n")
+        cols = prof.get('column_stats')
+        if cols:
+            lines.append('| العمود | النوع | القيم الفارغة | الأدنى | الأعلى | القيم المميزة |\n|---|---|---:|---|---|---:|')
+            for c in cols:
+                distinct = f"≈{c['distinct']}" if c.get('distinct_approx') else c['distinct']
+                lines.append(f"| {c['name']} | {c['type']} | {c['nulls']} | {c['min']} | {c['max']} | {distinct} |")
+            lines.append('')
     return '\n'.join(lines)
 
 
-def main():
-    knowledge = read_json(ME / 'knowledge.json')
+def export(knowledge: dict):
     now = datetime.now(UTC).strftime('%Y-%m-%dT%H:%M:%SZ')
 
     # INDEX
@@ -118,31 +192,35 @@ def main():
 - API.md: نقاط API المتاحة
 - DATASETS.md: مصادر البيانات
 - KNOWLEDGE_SUMMARY.md: خلاصة المعرفة الحالية
+- chunks.pack + chunks.json: مقاطع نصية متداخلة مفهرسة بـ sha256 + الإزاحة (`bin/chunk_store.py get <المسار>`)
+- vectors.npy: متجهات المقاطع للبحث بالتشابه (`KN_AI_VECTORS=1`، `bin/chunk_store.py similar <نص>`)
 """.strip() + "\n")
 
-    # REPORT
-    report = []
-    report.append(f"تاريخ التوليد (UTC): {now}\n")
-    report.append(build_environment_md())
-    report.append(build_tools_md())
-    report.append(build_performance_md())
-    report.append(build_learning_engine_md(knowledge))
-    report.append(build_api_md(knowledge))
-    report.append(build_datasets_md())
-    write(AI / 'REPORT.md', '\n\n'.join(report))
-
-    write(AI / 'ENVIRONMENT.md', build_environment_md())
-    write(AI / 'TOOLS.md', build_tools_md())
-    write(AI / 'PERFORMANCE.md', build_performance_md())
-    write(AI / 'LEARNING_ENGINE.md', build_learning_engine_md(knowledge))
-    write(AI / 'API.md', build_api_md(knowledge))
-    write(AI / 'DATASETS.md', build_datasets_md())
+    # Each section is rendered once and shared by REPORT.md and its own file
+    probes = probe_all()
+    sections = [
+        ('ENVIRONMENT.md', build_environment_md(probes)),
+        ('TOOLS.md', build_tools_md(probes)),
+        ('PERFORMANCE.md', build_performance_md()),
+        ('LEARNING_ENGINE.md', build_learning_engine_md(knowledge)),
+        ('API.md', build_api_md(knowledge)),
+        ('DATASETS.md', build_datasets_md()),
+    ]
+    write(AI / 'REPORT.md', '\n\n'.join([f"تاريخ التوليد (UTC): {now}\n"] + [md for _, md in sections]))
+    for name, md in sections:
+        write(AI / name, md)
+
+    # Retrievable text chunks (only files with new content are chunked)
+    ChunkStore(AI).update(knowledge.get('files', []))
 
     # Copy SUMMARY
     src_summary = ME / 'SUMMARY.md'
     if src_summary.exists():
         shutil.copyfile(src_summary, AI / 'KNOWLEDGE_SUMMARY.md')
 
+
+def main():
+    export(open_knowledge(find_knowledge(ME)))
     print(f"AI reference generated at {AI}")
 
 if __name__ == '__main__':
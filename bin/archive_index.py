@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+import os
+import sys
+import zipfile
+import hashlib
+from pathlib import Path
+from datetime import datetime, timezone
+
+# With KN_ARCHIVES=1 every .zip under tran/ also contributes one entry per member,
+# keyed "<archive rel path>!<member name>" (the java/jar: convention).  Only the
+# central directory is read to list members; a member's CRC-32 and size are kept in
+# the fingerprint cache, so a rewritten archive only has its new or changed members
+# decompressed and hashed, and nothing is ever extracted to disk.  Member entries
+# are told apart from ordinary files by their 'crc32' field.
+ARCHIVE_SEP = '!'
+ARCHIVE_SUFFIX = '.zip'
+READ_BUFFER = 1024 * 1024
+UTC = timezone.utc
+
+
+def archives_enabled() -> bool:
+    return os.getenv('KN_ARCHIVES', '0') == '1'
+
+
+def is_archive(rel: str) -> bool:
+    return rel[-4:].lower() == ARCHIVE_SUFFIX and ARCHIVE_SEP not in rel
+
+
+def member_rel(archive_rel: str, name: str) -> str:
+    return archive_rel + ARCHIVE_SEP + name
+
+
+def split_member(rel: str) -> tuple[str, str] | None:
+    """(archive rel path, member name) if `rel` looks like a member key, else None."""
+    i = rel.lower().find(ARCHIVE_SUFFIX + ARCHIVE_SEP)
+    if i < 0:
+        return None
+    cut = i + len(ARCHIVE_SUFFIX)
+    return rel[:cut], rel[cut + 1:]
+
+
+def zip_mtime_ns(date_time: tuple) -> int:
+    # Zip timestamps carry no zone; they are taken as UTC
+    try:
+        return int(datetime(*date_time, tzinfo=UTC).timestamp()) * 1_000_000_000
+    except (ValueError, OverflowError):
+        return 0
+
+
+def list_members(path: Path) -> list[tuple[str, int, int, int]]:
+    """(name, size, crc32, mtime_ns) of the file members, from the central directory only."""
+    with zipfile.ZipFile(path) as zf:
+        return [(i.filename, i.file_size, i.CRC, zip_mtime_ns(i.date_time)) for i in zf.infolist() if not i.is_dir()]
+
+
+def member_entry(archive_abs: str, rel: str, size: int, mtime_ns: int, crc: int, sha: str) -> dict:
+    return {
+        'abs_path': archive_abs + ARCHIVE_SEP + split_member(rel)[1],
+        'rel_path': rel,
+        'size': size,
+        'mtime': mtime_ns / 1e9,
+        'mtime_ns': mtime_ns,
+        'sha256': sha,
+        'crc32': crc,
+    }
+
+
+def hash_members(path: str, items: list[tuple[str, str]]) -> list[tuple[str, str]]:
+    """[(rel, member name)] -> [(rel, sha256)], streaming each member through the decompressor
+    ('' when it cannot be read or fails its CRC check).  Runs in the hashing pool."""
+    out = []
+    try:
+        zf = zipfile.ZipFile(path)
+    except Exception:
+        return [(rel, '') for rel, _ in items]
+    with zf:
+        for rel, name in items:
+            try:
+                h = hashlib.sha256()
+                with zf.open(name) as f:
+                    for chunk in iter(lambda: f.read(READ_BUFFER), b''):
+                        h.update(chunk)
+                out.append((rel, h.hexdigest()))
+            except Exception:
+                out.append((rel, ''))
+    return out
+
+
+def read_member(archive_path: Path, name: str, limit: int = -1) -> bytes:
+    with zipfile.ZipFile(archive_path) as zf, zf.open(name) as f:
+        return f.read(limit)
+
+
+def main():
+    args = sys.argv[1:]
+    if len(args) == 1:
+        for name, size, crc, mtime_ns in list_members(Path(args[0])):
+            when = datetime.fromtimestamp(mtime_ns / 1e9, UTC).strftime('%Y-%m-%d %H:%M')
+            print(f'{crc:08x} {size:>12} {when}  {name}')
+    elif len(args) == 2:
+        sys.stdout.buffer.write(read_member(Path(args[0]), args[1]))
+    else:
+        print('usage: archive_index.py ARCHIVE [MEMBER]', file=sys.stderr)
+        sys.exit(2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""Benchmark knowledge_build.py on synthetic tran/-shaped trees.
+
+Each scale (--files, comma separated) gets a fresh tree and runs these scenarios
+in order, each as its own builder process:
+  cold    first build, empty me/
+  warm    rebuild with nothing changed
+  single  one edited file reported through KN_CHANGED_PATHS
+  bulk    a new directory of --bulk-pct % more files reported as one changed path
+  full    full rescan after the bulk import (what a queue overflow falls back to)
+Wall time, CPU time (user + sys), peak RSS and bytes read (rchar, including the
+hashing pool) are taken from wait4() and /proc/self/io of this process, which
+accumulates the I/O of reaped children.  Results go to
+reports/perf-<ts>/raw/knowledge_build.json (reports/ being KN_REPORTS_DIR, where
+measure_all.sh writes and perf_history.py reads), next to measure_all.sh's reports.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+from datetime import datetime, timezone
+
+BIN_DIR = Path(__file__).resolve().parent
+BUILDER = BIN_DIR / 'knowledge_build.py'
+REPORTS_DIR = Path(os.getenv('KN_REPORTS_DIR', '/workspace/reports'))
+FILES_PER_DIR = 1000
+WORDS = ('knowledge build index cache watcher summary dataset openapi chunk hash merkle scan '
+         'المعرفة الفهرس البيانات الملخص التقرير الأداء الملفات البحث النظام المراقبة').split()
+
+
+def proc_io() -> dict:
+    try:
+        with open('/proc/self/io') as f:
+            return {k: int(v) for k, v in (line.split(':') for line in f)}
+    except OSError:
+        return {}
+
+
+def text_blob(rng: random.Random, size: int) -> bytes:
+    words = []
+    n = 0
+    while n < size:
+        w = rng.choice(WORDS)
+        words.append(w)
+        n += len(w.encode()) + 1
+        if rng.random() < 0.08:
+            words.append('\n')
+    return ' '.join(words).encode()[:size]
+
+
+def file_spec(rng: random.Random, i: int, large_every: int) -> tuple[str, int]:
+    """(suffix, size): mostly small text, some medium structured files, one large binary per `large_every`."""
+    if large_every and i % large_every == large_every - 1:
+        return '.bin', rng.randint(256 * 1024, 4 * 1024 * 1024)
+    r = rng.random()
+    if r < 0.85:
+        return rng.choice(('.md', '.txt')), rng.randint(200, 8 * 1024)
+    return rng.choice(('.json', '.yaml', '.php')), rng.randint(8 * 1024, 32 * 1024)
+
+
+def write_files(rng: random.Random, base: Path, count: int, large_every: int, start: int = 0) -> None:
+    for i in range(start, start + count):
+        d = base / f'd{i // FILES_PER_DIR:04d}'
+        if i % FILES_PER_DIR == 0 or i == start:
+            d.mkdir(parents=True, exist_ok=True)
+        suffix, size = file_spec(rng, i, large_every)
+        data = rng.randbytes(size) if suffix == '.bin' else text_blob(rng, size)
+        (d / f'f{i}{suffix}').write_bytes(data)
+
+
+def generate_tree(root: Path, files: int, large_every: int, seed: int) -> None:
+    """Lay out `root` like KN_TRAN_ROOT: the builder indexes root/tran/, profiles
+    tran/datasets/*.csv and indexes tran/api/ specs."""
+    rng = random.Random(seed)
+    tran = root / 'tran'
+    for sub in ('kb', 'info', 'api', 'datasets'):
+        (tran / sub).mkdir(parents=True, exist_ok=True)
+    (tran / 'README.md').write_bytes(text_blob(rng, 4096))
+    (tran / 'version.json').write_text(json.dumps({'version': '0.0.0-bench'}))
+    (tran / 'api' / 'openapi.yaml').write_text(
+        'openapi: 3.0.0\ninfo:\n  title: Bench\n  version: 1.0.0\npaths:\n'
+        + ''.join(f'  /items/{i}:\n    get:\n      operationId: getItem{i}\n      summary: Item {i}\n' for i in range(50)))
+    with (tran / 'datasets' / 'bench.csv').open('w') as f:
+        f.write('id,name,score\n')
+        for i in range(max(100, files)):
+            f.write(f'{i},{rng.choice(WORDS)},{rng.random():.4f}\n')
+    write_files(rng, tran / 'bulk', max(0, files - 5), large_every)
+
+
+def last_phases(me_root: Path) -> dict:
+    """Wall time per builder phase of the last build (the last metrics.jsonl line; metrics.json
+    is left alone by builds that change no output)."""
+    try:
+        with (me_root / 'metrics.jsonl').open('rb') as f:
+            f.seek(max(0, os.fstat(f.fileno()).st_size - 64 * 1024))
+            phases = json.loads(f.read().splitlines()[-1]).get('phases') or {}
+    except (OSError, ValueError, IndexError):
+        return {}
+    return {name: v.get('wall_s', 0.0) for name, v in phases.items()}
+
+
+def run_builder(env: dict) -> dict:
+    io_before = proc_io()
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, str(BUILDER)], env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    out = proc.stdout.read()
+    _, status, ru = os.wait4(proc.pid, 0)
+    wall = time.perf_counter() - start
+    io_after = proc_io()
+    if status != 0:
+        raise RuntimeError(f'builder failed ({status}): {out.decode(errors="replace")[-2000:]}')
+    return {
+        'wall_s': round(wall, 4),
+        'cpu_s': round(ru.ru_utime + ru.ru_stime, 4),
+        # ru_maxrss is the largest single process (the builder or one hashing worker), in KiB
+        'peak_rss_mb': round(ru.ru_maxrss / 1024, 1),
+        'read_mb': round((io_after.get('rchar', 0) - io_before.get('rchar', 0)) / 1e6, 2),
+        'disk_read_mb': round((io_after.get('read_bytes', 0) - io_before.get('read_bytes', 0)) / 1e6, 2),
+        'output': out.decode(errors='replace').strip().splitlines()[-1:],
+    }
+
+
+def bench_scale(files: int, args) -> list[dict]:
+    work = Path(tempfile.mkdtemp(prefix=f'kn-bench-{files}-', dir=args.workdir))
+    try:
+        t0 = time.perf_counter()
+        generate_tree(work / 'tran', files, args.large_every, args.seed)
+        print(f'[{files}] tree generated in {time.perf_counter() - t0:.1f}s at {work}', file=sys.stderr)
+        tran = work / 'tran' / 'tran'
+        env = {**os.environ, 'KN_TRAN_ROOT': str(work / 'tran'), 'KN_ME_ROOT': str(work / 'me')}
+        env.pop('KN_CHANGED_PATHS', None)
+        env.pop('KN_CHANGED_FILE', None)
+        results = []
+
+        def scenario(name: str, extra_env: dict | None = None):
+            r = run_builder({**env, **(extra_env or {})})
+            r['phases'] = last_phases(work / 'me')
+            results.append({'scenario': name, 'files': files, **r})
+            print(f"[{files}] {name:6} wall={r['wall_s']:.3f}s cpu={r['cpu_s']:.3f}s rss={r['peak_rss_mb']}MB "
+                  f"read={r['read_mb']}MB datasets={r['phases'].get('datasets', 0):.3f}s "
+                  f"openapi={r['phases'].get('openapi', 0):.3f}s", file=sys.stderr)
+
+        scenario('cold')
+        scenario('warm')
+        target = tran / 'README.md'
+        target.write_bytes(target.read_bytes() + b'\nbench edit\n')
+        scenario('single', {'KN_CHANGED_PATHS': 'tran/README.md'})
+        bulk = max(1, files * args.bulk_pct // 100)
+        write_files(random.Random(args.seed + 1), tran / 'import', bulk, args.large_every, start=files)
+        scenario('bulk', {'KN_CHANGED_PATHS': 'tran/import'})
+        scenario('full')
+        return results
+    finally:
+        if not args.keep:
+            shutil.rmtree(work, ignore_errors=True)
+
+
+def write_report(results: list[dict], reports_dir: Path, args) -> Path:
+    ts = datetime.now(timezone.utc).strftime('%Y%m%d-%H%M%S')
+    report = reports_dir / f'perf-{ts}'
+    raw = report / 'raw'
+    raw.mkdir(parents=True, exist_ok=True)
+    u = os.uname()
+    (raw / 'sys_uname.txt').write_text(f'$ uname -a\n{u.sysname} {u.nodename} {u.release} {u.version} {u.machine}\n')
+    meta = {'generated_at_utc': ts, 'python': sys.version.split()[0], 'cpus': os.cpu_count(),
+            'large_every': args.large_every, 'bulk_pct': args.bulk_pct, 'seed': args.seed}
+    (raw / 'knowledge_build.json').write_text(json.dumps({**meta, 'results': results}, ensure_ascii=False, indent=2))
+    lines = ['### أداء knowledge_build.py (شجرة اصطناعية)',
+             '| الملفات | السيناريو | الزمن (s) | CPU (s) | ذروة الذاكرة (MB) | قراءة (MB) | datasets (s) | openapi (s) |',
+             '|---:|---|---:|---:|---:|---:|---:|---:|']
+    for r in results:
+        phases = r.get('phases') or {}
+        lines.append(f"| {r['files']} | {r['scenario']} | {r['wall_s']:.3f} | {r['cpu_s']:.3f} | {r['peak_rss_mb']} | {r['read_mb']} "
+                     f"| {phases.get('datasets', 0):.4f} | {phases.get('openapi', 0):.4f} |")
+    lines.append('')
+    lines.append(f"- مخرجات خام: `{raw / 'knowledge_build.json'}`")
+    (report / 'report.md').write_text('\n'.join(lines) + '\n')
+    return report
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Benchmark knowledge_build.py on synthetic trees')
+    ap.add_argument('--files', default='1000', help='comma-separated tree sizes, e.g. 1000,100000,1000000')
+    ap.add_argument('--large-every', type=int, default=1000, help='one 256 KiB-4 MiB binary per N files (0: none)')
+    ap.add_argument('--bulk-pct', type=int, default=10, help='size of the bulk import, in %% of the tree')
+    ap.add_argument('--seed', type=int, default=1)
+    ap.add_argument('--workdir', default=None, help='where to generate trees (default: system temp dir)')
+    ap.add_argument('--reports', default=str(REPORTS_DIR), help='report root (default: KN_REPORTS_DIR, else /workspace/reports)')
+    ap.add_argument('--keep', action='store_true', help='keep generated trees')
+    args = ap.parse_args()
+    results = []
+    for files in (int(n) for n in args.files.split(',') if n.strip()):
+        results.extend(bench_scale(files, args))
+    report = write_report(results, Path(args.reports), args)
+    print(f'Report generated: {report / "report.md"}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+import os
+import sys
+import time
+import signal
+import resource
+from pathlib import Path
+from contextlib import contextmanager
+
+
+class BuildMetrics:
+    """Wall/CPU time per build phase plus named counters, reset at the start of each build.
+
+    Phases and counters are recorded a handful of times per build (never per file), so
+    the bookkeeping costs microseconds.  CPU time is this process only: hashing done in
+    the process pool shows up as wall time of the 'hash' phase.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        self.phases: dict[str, list[float]] = {}
+        self.counters: dict[str, int] = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            p = self.phases.setdefault(name, [0.0, 0.0])
+            p[0] += time.perf_counter() - wall
+            p[1] += time.process_time() - cpu
+
+    def count(self, name: str, n: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def peak(self, name: str, value: int) -> None:
+        if value > self.counters.get(name, 0):
+            self.counters[name] = value
+
+    def as_dict(self) -> dict:
+        counters = dict(self.counters)
+        lookups = counters.get('cache_hits', 0) + counters.get('files_hashed', 0)
+        self_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        children_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        return {
+            'phases': {name: {'wall_s': round(w, 6), 'cpu_s': round(c, 6)} for name, (w, c) in self.phases.items()},
+            'counters': counters,
+            'cache_hit_ratio': round(counters.get('cache_hits', 0) / lookups, 4) if lookups else None,
+            # ru_maxrss is in KiB on Linux; children are reaped pool workers only
+            'peak_rss_mb': round(self_rss / 1024, 1),
+            'peak_rss_children_mb': round(children_rss / 1024, 1),
+        }
+
+
+class StackSampler:
+    """SIGPROF sampling profiler for the main thread, writing collapsed stacks
+    ("outer;inner;leaf count" lines, the flamegraph.pl / speedscope input format)."""
+
+    def __init__(self, interval_s: float = 0.005):
+        self.interval_s = interval_s
+        self.samples: dict[str, int] = {}
+
+    def _sample(self, signum, frame) -> None:
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f'{Path(code.co_filename).name}:{code.co_name}')
+            frame = frame.f_back
+        key = ';'.join(reversed(stack))
+        self.samples[key] = self.samples.get(key, 0) + 1
+
+    def start(self) -> None:
+        signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval_s, self.interval_s)
+
+    def stop(self) -> None:
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, signal.SIG_DFL)
+
+    def write(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open('w') as f:
+            for stack, n in sorted(self.samples.items(), key=lambda kv: -kv[1]):
+                f.write(f'{stack} {n}\n')
+
+
+@contextmanager
+def maybe_profile(log_dir: Path, label: str):
+    """Sample the enclosed block when KN_PROFILE=1 (interval KN_PROFILE_INTERVAL_MS, default 5)
+    and write <log_dir>/profile-<label>.folded; otherwise does nothing."""
+    if os.getenv('KN_PROFILE', '0') != '1':
+        yield
+        return
+    try:
+        interval = float(os.getenv('KN_PROFILE_INTERVAL_MS', '5')) / 1000
+    except ValueError:
+        interval = 0.005
+    sampler = StackSampler(interval)
+    sampler.start()
+    try:
+        yield
+    finally:
+        sampler.stop()
+        path = log_dir / f'profile-{label}.folded'
+        try:
+            sampler.write(path)
+            print(f'[profile] {sum(sampler.samples.values())} samples -> {path}', file=sys.stderr)
+        except OSError:
+            pass
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import mmap
+import time
+import struct
+from pathlib import Path
+from datetime import datetime, timezone
+
+# Per-run deltas of tran/, one JSON line per build that changed something:
+#   {"seq", "ts_utc", "mode", "added": [[rel, sha]], "removed": [[rel, sha]],
+#    "modified": [[rel, old sha, new sha]], "renamed": [[old, new, old sha, new sha]]}
+# or {"seq", "ts_utc", "mode", "reset": true, "files": N} when there was no previous
+# state to diff against (first build, lost cache): consumers must resync fully.
+# Lines go to seg-<first seq>.jsonl segments of about SEGMENT_BYTES; index.bin holds
+# one INDEX record per line, so "since seq N" and "since time T" are a binary search
+# plus one seek.  Both seq and ts only grow, the latter because builds run one at a time.
+ME_ROOT = Path(os.getenv('KN_ME_ROOT', '/workspace/me'))
+JOURNAL_DIR = ME_ROOT / 'journal'
+INDEX_NAME = 'index.bin'
+INDEX = struct.Struct('<QqQQ')     # seq, ts (epoch seconds), segment (its first seq), byte offset
+UTC = timezone.utc
+
+
+def env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+SEGMENT_BYTES = env_int('KN_JOURNAL_SEGMENT_BYTES', 1024 * 1024)
+KEEP_SEGMENTS = env_int('KN_JOURNAL_KEEP_SEGMENTS', 64)
+
+
+def segment_name(first_seq: int) -> str:
+    return f'seg-{first_seq:012d}.jsonl'
+
+
+def parse_time(value: str) -> int:
+    """Epoch seconds from an ISO-8601 UTC time, epoch seconds, or a relative '-90m' / '-2h' / '-1d'."""
+    if value.startswith('-') and value[-1] in 'smhd':
+        return int(time.time()) - int(float(value[1:-1]) * {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}[value[-1]])
+    try:
+        return int(float(value))
+    except ValueError:
+        pass
+    dt = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return int((dt if dt.tzinfo else dt.replace(tzinfo=UTC)).timestamp())
+
+
+def run_delta(prev_map, current: dict, changed_paths: list, moved: list | None = None) -> dict:
+    """Classify `changed_paths` by comparing digests in `prev_map` and `current` ({rel: entry}).
+
+    Moves reported by the watcher become renames; in full scans a removed and an added
+    path with the same digest are paired up as a rename too.
+    """
+    added, removed, modified, renamed = {}, {}, [], []
+    for old, new in moved or ():
+        prev, cur = prev_map.get(old), current.get(new)
+        old_sha = prev.get('sha256', '') if prev else ''
+        if cur is not None:
+            renamed.append([old, new, old_sha, cur.get('sha256', '')])
+    done = {p for pair in moved or () for p in pair}
+    for rel in changed_paths:
+        if rel in done:
+            continue
+        prev, cur = prev_map.get(rel), current.get(rel)
+        old_sha = prev.get('sha256', '') if prev else None
+        new_sha = cur.get('sha256', '') if cur and 'error' not in cur else None
+        if old_sha == new_sha:
+            continue
+        if old_sha is None:
+            added[rel] = new_sha
+        elif new_sha is None:
+            removed[rel] = old_sha
+        else:
+            modified.append([rel, old_sha, new_sha])
+    by_sha: dict[str, list[str]] = {}
+    for rel, sha in added.items():
+        if sha:
+            by_sha.setdefault(sha, []).append(rel)
+    for old, sha in list(removed.items()):
+        if by_sha.get(sha):
+            new = by_sha[sha].pop(0)
+            renamed.append([old, new, sha, sha])
+            del removed[old], added[new]
+    return {'added': sorted(added.items()), 'removed': sorted(removed.items()), 'modified': modified,
+            'renamed': renamed}
+
+
+def net_changes(entries) -> dict:
+    """Collapse journal entries into the net difference between the first and last state."""
+    before: dict[str, str] = {}
+    after: dict[str, str] = {}
+    first = last = None
+    reset = False
+    for e in entries:
+        first = e['seq'] if first is None else first
+        last = e['seq']
+        if e.get('reset'):
+            reset = True
+            before.clear()
+            after.clear()
+            continue
+        for rel, sha in e.get('added', ()):
+            before.setdefault(rel, '')
+            after[rel] = sha
+        for rel, sha in e.get('removed', ()):
+            before.setdefault(rel, sha)
+            after[rel] = ''
+        for rel, old, new in e.get('modified', ()):
+            before.setdefault(rel, old)
+            after[rel] = new
+        for old, new, old_sha, new_sha in e.get('renamed', ()):
+            before.setdefault(old, old_sha)
+            after[old] = ''
+            before.setdefault(new, '')
+            after[new] = new_sha
+    out = {'from_seq': first, 'to_seq': last, 'reset': reset, 'added': {}, 'removed': {}, 'modified': {},
+           'renamed': []}
+    for rel, new in after.items():
+        old = before[rel]
+        if old == new:
+            continue
+        if not old:
+            out['added'][rel] = new
+        elif not new:
+            out['removed'][rel] = old
+        else:
+            out['modified'][rel] = [old, new]
+    by_sha: dict[str, list[str]] = {}
+    for rel, sha in out['added'].items():
+        by_sha.setdefault(sha, []).append(rel)
+    for old, sha in list(out['removed'].items()):
+        if by_sha.get(sha):
+            new = by_sha[sha].pop(0)
+            out['renamed'].append([old, new, sha])
+            del out['removed'][old], out['added'][new]
+    return out
+
+
+class Journal:
+    def __init__(self, directory: Path = JOURNAL_DIR):
+        self.dir = directory
+        self.index_path = directory / INDEX_NAME
+
+    def _records(self) -> list[tuple[int, int, int, int]]:
+        try:
+            data = self.index_path.read_bytes()
+        except OSError:
+            return []
+        return list(INDEX.iter_unpack(data[:len(data) - len(data) % INDEX.size]))
+
+    def _last(self):
+        try:
+            with self.index_path.open('rb') as f:
+                size = os.fstat(f.fileno()).st_size // INDEX.size * INDEX.size
+                if not size:
+                    return None
+                f.seek(size - INDEX.size)
+                return INDEX.unpack(f.read(INDEX.size))
+        except OSError:
+            return None
+
+    def append(self, ts_utc: str, mode: str, delta: dict | None = None, files: int = 0) -> int | None:
+        """Record one run; `delta` None means a reset.  Returns the new seq, or None when
+        the delta is empty."""
+        if delta is not None and not any(delta.values()):
+            return None
+        ts = parse_time(ts_utc)
+        last = self._last()
+        seq = last[0] + 1 if last else 1
+        segment = last[2] if last else seq
+        self.dir.mkdir(parents=True, exist_ok=True)
+        seg_path = self.dir / segment_name(segment)
+        end = 0
+        if last:
+            # Cut anything a crashed run appended after the last indexed line
+            try:
+                with seg_path.open('rb') as f:
+                    f.seek(last[3])
+                    end = last[3] + len(f.readline())
+            except OSError:
+                end = 0
+        if end >= SEGMENT_BYTES or not seg_path.exists():
+            segment, seg_path, end = seq, self.dir / segment_name(seq), 0
+        entry = {'seq': seq, 'ts_utc': ts_utc, 'mode': mode}
+        entry.update(delta if delta is not None else {'reset': True, 'files': files})
+        line = json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n'
+        with seg_path.open('ab') as f:
+            f.truncate(end)
+            f.write(line.encode('utf-8'))
+        with self.index_path.open('ab') as f:
+            f.truncate(f.tell() // INDEX.size * INDEX.size)
+            f.write(INDEX.pack(seq, ts, segment, end))
+        if segment == seq and last:
+            self.prune()
+        return seq
+
+    def prune(self, keep: int = KEEP_SEGMENTS) -> int:
+        segments = sorted(self.dir.glob('seg-*.jsonl'))
+        drop = segments[:-keep] if keep > 0 else []
+        if not drop:
+            return 0
+        first_kept = int(segments[len(drop)].stem[4:])
+        tmp = self.dir / (INDEX_NAME + '.tmp')
+        tmp.write_bytes(b''.join(INDEX.pack(*r) for r in self._records() if r[2] >= first_kept))
+        os.replace(tmp, self.index_path)
+        for p in drop:
+            p.unlink(missing_ok=True)
+        return len(drop)
+
+    def _first(self):
+        try:
+            with self.index_path.open('rb') as f:
+                data = f.read(INDEX.size)
+        except OSError:
+            return None
+        return INDEX.unpack(data) if len(data) == INDEX.size else None
+
+    def _find(self, key: int, field: int):
+        """The first index record whose `field` (0: seq, 1: ts) is greater than `key`, or None."""
+        try:
+            f = self.index_path.open('rb')
+        except OSError:
+            return None
+        with f:
+            count = os.fstat(f.fileno()).st_size // INDEX.size
+            if not count:
+                return None
+            with mmap.mmap(f.fileno(), count * INDEX.size, access=mmap.ACCESS_READ) as mm:
+                lo, hi = 0, count
+                while lo < hi:
+                    mid = (lo + hi) // 2
+                    if INDEX.unpack_from(mm, mid * INDEX.size)[field] > key:
+                        hi = mid
+                    else:
+                        lo = mid + 1
+                return INDEX.unpack_from(mm, lo * INDEX.size) if lo < count else None
+
+    def entries(self, since_seq: int | None = None, since_ts: int | None = None):
+        """Yield the entries after run `since_seq`, or recorded after time `since_ts`, or all."""
+        if since_seq is not None:
+            start = self._find(since_seq, 0)
+        else:
+            start = self._find(since_ts if since_ts is not None else -1, 1)
+        if start is None:
+            return
+        seq, _, segment, offset = start
+        while True:
+            try:
+                f = (self.dir / segment_name(segment)).open('rb')
+            except FileNotFoundError:
+                return
+            with f:
+                f.seek(offset)
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        return
+                    yield entry
+                    seq = entry['seq'] + 1
+            segment, offset = seq, 0
+
+    def since(self, since_seq: int | None = None, since_ts: int | None = None) -> dict:
+        """Net changes after `since_seq` / `since_ts`; 'truncated' when runs in that range
+        were pruned, in which case the caller has to resync fully."""
+        out = net_changes(self.entries(since_seq, since_ts))
+        first = self._first()
+        if first is None or first[0] == 1:
+            out['truncated'] = False
+        elif since_seq is not None:
+            out['truncated'] = since_seq + 1 < first[0]
+        else:
+            out['truncated'] = (since_ts or 0) < first[1]
+        return out
+
+
+def main():
+    args = sys.argv[1:]
+    as_json = '--json' in args
+    args = [a for a in args if a != '--json']
+    journal = Journal()
+    if args[:1] == ['since'] and len(args) == 2:
+        ref = args[1]
+        out = journal.since(since_seq=int(ref[1:])) if ref.startswith('#') else journal.since(since_ts=parse_time(ref))
+        if as_json:
+            print(json.dumps(out, ensure_ascii=False, indent=2))
+            return
+        if out['truncated']:
+            print('! journal was pruned past this point: resync fully', file=sys.stderr)
+        if out['reset']:
+            print('! the journal was reset in this range (no previous state): resync fully', file=sys.stderr)
+        for rel in sorted(out['added']):
+            print(f'A {rel}')
+        for rel in sorted(out['modified']):
+            print(f'M {rel}')
+        for rel in sorted(out['removed']):
+            print(f'D {rel}')
+        for old, new, _ in out['renamed']:
+            print(f'R {old} -> {new}')
+        print(f"# runs {out['from_seq']}..{out['to_seq']}" if out['from_seq'] else '# no changes', file=sys.stderr)
+    elif args[:1] == ['log'] and len(args) <= 2:
+        records = journal._records()[-(int(args[1]) if len(args) == 2 else 20):]
+        for e in journal.entries(since_seq=records[0][0] - 1) if records else ():
+            counts = 'reset' if e.get('reset') else ' '.join(f"{k}={len(e.get(k, ()))}" for k in
+                                                              ('added', 'removed', 'modified', 'renamed'))
+            print(json.dumps(e, ensure_ascii=False) if as_json else f"#{e['seq']}  {e['ts_utc']}  {e['mode']:8} {counts}")
+    else:
+        print('usage: change_journal.py [--json] since (#SEQ | ISO-TIME | EPOCH | -30m) | log [N]', file=sys.stderr)
+        sys.exit(2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+import hashlib
+
+try:
+    import numpy as np
+except ImportError:  # optional: `make install-bench-tools` installs it
+    np = None
+
+# Content-defined chunking with a windowed Gear hash: a chunk ends after byte i when
+# the hash of the WINDOW bytes ending at i has its low bits clear.  Boundaries only
+# depend on bytes inside the current chunk, so re-chunking from any chunk start
+# reproduces the same cut points.  Without numpy the scan would be far slower than
+# SHA-256 itself, so files fall back to fixed-size chunks.
+CHUNKER_CDC = 1
+CHUNKER_FIXED = 2
+WINDOW = 8
+GEAR = [int.from_bytes(hashlib.sha256(b'kn-gear' + bytes([i])).digest()[:4], 'little') for i in range(256)]
+GEAR_NP = np.array(GEAR, dtype=np.uint32) if np is not None else None
+
+
+def chunk_params(avg: int) -> tuple[int, int, int, int]:
+    avg = 1 << max(12, (max(1, avg) - 1).bit_length())
+    chunker = CHUNKER_CDC if np is not None else CHUNKER_FIXED
+    return chunker, avg, max(WINDOW, avg // 4), avg * 4
+
+
+def _gear_candidates(buf: bytes, mask: int):
+    """Sorted cut lengths-from-0 (window end index + 1) where the Gear hash hits the mask."""
+    if len(buf) < WINDOW:
+        return np.zeros(0, dtype=np.int64)
+    # h[i] = sum(g[i - k] << k for k < WINDOW), built by doubling the covered span
+    h = GEAR_NP[np.frombuffer(buf, dtype=np.uint8)]
+    tmp = np.empty_like(h)
+    span = 1
+    while span < WINDOW:
+        n = len(h) - span
+        np.left_shift(h[:n], np.uint32(span), out=tmp[:n])
+        np.add(h[span:], tmp[:n], out=h[span:])
+        span *= 2
+    np.bitwise_and(h, np.uint32(mask), out=h)
+    hits = np.flatnonzero(h[WINDOW - 1:] == 0)
+    return hits + WINDOW
+
+
+def iter_chunks(f, start: int, params: tuple[int, int, int, int]):
+    """Yield (offset, data, sha256 digest) for the chunks of `f` from offset `start` to EOF.
+
+    `data` is a memoryview of the chunk's bytes, read from `f` only once."""
+    chunker, avg, min_size, max_size = params
+    block = max(8 * 1024 * 1024, 2 * max_size)
+    f.seek(start)
+    buf = b''
+    pos = 0
+    base = start
+    eof = False
+    while not eof:
+        data = f.read(block)
+        eof = not data
+        buf = buf[pos:] + data
+        base += pos
+        pos = 0
+        ends = _gear_candidates(buf, avg - 1) if chunker == CHUNKER_CDC else None
+        while pos < len(buf):
+            remaining = len(buf) - pos
+            cut = 0
+            if chunker == CHUNKER_CDC:
+                i = int(np.searchsorted(ends, pos + min_size))
+                if i < len(ends) and ends[i] - pos <= max_size:
+                    cut = int(ends[i]) - pos
+                elif remaining >= max_size:
+                    cut = max_size
+            elif remaining >= avg:
+                cut = avg
+            if not cut:
+                if not eof:
+                    break
+                cut = remaining
+            piece = memoryview(buf)[pos:pos + cut]
+            yield base + pos, piece, hashlib.sha256(piece).digest()
+            pos += cut
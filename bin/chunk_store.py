@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import math
+import zlib
+from pathlib import Path
+
+from text_index import indexable, tokenize
+from archive_index import split_member, read_member
+
+try:
+    import numpy as np
+except ImportError:  # optional: only needed for the vector index
+    np = None
+
+# chunks.pack holds the raw UTF-8 bytes of every chunk back to back and is only ever
+# appended to; chunks.json is the offset index over it:
+#   paths:  {rel_path: sha256}
+#   files:  {sha256: [first chunk, chunk count]}
+#   chunks: [[file offset, length, pack offset], ...] in pack order
+# Chunks are keyed by file sha256 + byte offset, so a file is chunked once per content
+# and renames or copies cost nothing.  Chunks no path refers to any more stay in the
+# pack until they outweigh the live ones, then the pack is rewritten.
+# vectors.npy (KN_AI_VECTORS=1, needs numpy) has one L2-normalised row per chunk.
+AI_DIR = Path(os.getenv('KN_ME_ROOT', '/workspace/me')) / 'ai'
+PACK_NAME = 'chunks.pack'
+INDEX_NAME = 'chunks.json'
+VECTORS_NAME = 'vectors.npy'
+INDEX_VERSION = 1
+
+
+def env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+CHUNK_BYTES = env_int('KN_AI_CHUNK_BYTES', 4096)
+CHUNK_OVERLAP = env_int('KN_AI_CHUNK_OVERLAP', 512)
+VECTOR_DIM = env_int('KN_AI_VECTOR_DIM', 256)
+
+
+def _char_start(data: bytes, i: int) -> int:
+    while 0 < i < len(data) and data[i] & 0xC0 == 0x80:
+        i -= 1
+    return i
+
+
+def split_chunks(data: bytes, size: int = CHUNK_BYTES, overlap: int = CHUNK_OVERLAP):
+    """Yield (offset, bytes) windows of about `size` bytes, cut after a newline where
+    possible (never inside a UTF-8 sequence); each window repeats the last `overlap`
+    bytes of the previous one, starting at a line boundary when there is one."""
+    n = len(data)
+    start = 0
+    while start < n:
+        end = min(n, start + size)
+        if end < n:
+            nl = data.rfind(b'\n', start + size // 2, end)
+            end = nl + 1 if nl != -1 else _char_start(data, end)
+            if end <= start:
+                end = min(n, start + size)
+        yield start, data[start:end]
+        if end >= n:
+            break
+        nxt = max(start + 1, end - overlap)
+        nl = data.find(b'\n', nxt, end)
+        start = nl + 1 if nl != -1 and nl + 1 < end else max(start + 1, _char_start(data, nxt))
+
+
+def embed(text: str, dim: int = VECTOR_DIM):
+    """Hashed bag-of-words vector (signed feature hashing over text_index tokens, 1 + log tf)."""
+    vec = np.zeros(dim, dtype=np.float32)
+    counts: dict[str, int] = {}
+    for t in tokenize(text):
+        if not t.isdigit():
+            counts[t] = counts.get(t, 0) + 1
+    for t, tf in counts.items():
+        h = zlib.crc32(t.encode('utf-8'))
+        vec[h % dim] += (1.0 + math.log(tf)) * (1 if h & 0x80000000 else -1)
+    norm = float(np.linalg.norm(vec))
+    return vec / norm if norm else vec
+
+
+def vectors_enabled() -> bool:
+    return np is not None and os.getenv('KN_AI_VECTORS', '0') == '1'
+
+
+class ChunkStore:
+    def __init__(self, directory: Path = AI_DIR):
+        self.dir = directory
+        self.pack_path = directory / PACK_NAME
+        self.paths: dict[str, str] = {}
+        self.files: dict[str, list[int]] = {}
+        self.chunks: list[list] = []
+        self.pack_bytes = 0
+        self.params = [CHUNK_BYTES, CHUNK_OVERLAP]
+        try:
+            obj = json.loads((directory / INDEX_NAME).read_text())
+            if obj.get('version') == INDEX_VERSION and obj.get('params') == self.params:
+                self.paths, self.files, self.chunks = obj['paths'], obj['files'], obj['chunks']
+                self.pack_bytes = obj['pack_bytes']
+        except Exception:
+            pass
+
+    def chunks_for(self, rel: str) -> list[list]:
+        sha = self.paths.get(rel)
+        if sha is None or sha not in self.files:
+            return []
+        first, count = self.files[sha]
+        return self.chunks[first:first + count]
+
+    def read(self, sha: str, offset: int) -> str | None:
+        """Text of the chunk of `sha` starting at byte `offset`, or None."""
+        if sha not in self.files:
+            return None
+        first, count = self.files[sha]
+        for off, length, pack_off in self.chunks[first:first + count]:
+            if off == offset:
+                with self.pack_path.open('rb') as f:
+                    f.seek(pack_off)
+                    return f.read(length).decode('utf-8', 'replace')
+        return None
+
+    def update(self, files: list) -> int:
+        """Chunk text files whose sha256 is not stored yet; returns the number of new chunks.
+
+        Archive members (entries with 'crc32') are read out of their .zip, like the text index does.
+        """
+        paths = {}
+        for f in files:
+            sha = f.get('sha256')
+            if sha and 'error' not in f and indexable(f.get('rel_path', ''), f.get('size', 0)):
+                paths[f['rel_path']] = (sha, f.get('abs_path'), 'crc32' in f)
+        new_chunks = []
+        new_files = {}
+        pack_off = self.pack_bytes
+        self.dir.mkdir(parents=True, exist_ok=True)
+        if pack_off or self.pack_path.exists():
+            # Drop bytes an interrupted run appended without recording them
+            with self.pack_path.open('ab') as pack:
+                pack.truncate(pack_off)
+        with self.pack_path.open('ab') as pack:
+            for rel, (sha, abs_path, member) in paths.items():
+                if sha in self.files or sha in new_files:
+                    continue
+                try:
+                    if member:
+                        archive, name = split_member(abs_path)
+                        data = read_member(Path(archive), name)
+                    else:
+                        data = Path(abs_path).read_bytes()
+                except Exception:
+                    continue
+                new_files[sha] = [len(self.chunks) + len(new_chunks), 0]
+                for off, piece in split_chunks(data):
+                    pack.write(piece)
+                    new_chunks.append([off, len(piece), pack_off])
+                    new_files[sha][1] += 1
+                    pack_off += len(piece)
+        new_paths = {rel: sha for rel, (sha, _, _) in paths.items()}
+        vectors_missing = vectors_enabled() and not (self.dir / VECTORS_NAME).exists()
+        if not new_chunks and new_paths == self.paths and not vectors_missing:
+            return 0
+        vectors = self._load_vectors(len(self.chunks)) if vectors_enabled() else None
+        if vectors is not None and new_chunks:
+            vectors = np.concatenate([vectors, self._embed_chunks(new_chunks)])
+        self.chunks.extend(new_chunks)
+        self.files.update(new_files)
+        self.paths = new_paths
+        self.pack_bytes = pack_off
+        live = set(new_paths.values())
+        live_bytes = sum(c[1] for sha in live for c in self._file_chunks(sha))
+        if self.pack_bytes - live_bytes > max(live_bytes, 1024 * 1024):
+            vectors = self._compact(live, vectors)
+        if vectors is not None:
+            self._save_vectors(vectors)
+        else:
+            # Rows would no longer line up with the chunk list
+            (self.dir / VECTORS_NAME).unlink(missing_ok=True)
+        self._save_index()
+        return len(new_chunks)
+
+    def _embed_chunks(self, chunks: list[list]):
+        rows = np.zeros((len(chunks), VECTOR_DIM), dtype=np.float32)
+        with self.pack_path.open('rb') as pack:
+            for i, (_, length, pack_off) in enumerate(chunks):
+                pack.seek(pack_off)
+                rows[i] = embed(pack.read(length).decode('utf-8', 'replace'))
+        return rows
+
+    def _load_vectors(self, rows: int):
+        try:
+            vectors = np.load(self.dir / VECTORS_NAME)
+            if vectors.shape == (rows, VECTOR_DIM):
+                return vectors
+        except Exception:
+            pass
+        return self._embed_chunks(self.chunks)
+
+    def _save_vectors(self, vectors) -> None:
+        tmp = self.dir / (VECTORS_NAME + '.tmp')
+        with tmp.open('wb') as f:
+            np.save(f, vectors)
+        os.replace(tmp, self.dir / VECTORS_NAME)
+
+    def _file_chunks(self, sha: str) -> list[list]:
+        first, count = self.files.get(sha, (0, 0))
+        return self.chunks[first:first + count]
+
+    def _compact(self, live: set, vectors):
+        keep = []
+        tmp = self.dir / (PACK_NAME + '.tmp')
+        chunks, files, pack_off = [], {}, 0
+        with self.pack_path.open('rb') as src, tmp.open('wb') as dst:
+            for sha, (first, count) in sorted(self.files.items(), key=lambda kv: kv[1][0]):
+                if sha not in live:
+                    continue
+                files[sha] = [len(chunks), count]
+                for i in range(first, first + count):
+                    off, length, old_off = self.chunks[i]
+                    src.seek(old_off)
+                    dst.write(src.read(length))
+                    chunks.append([off, length, pack_off])
+                    keep.append(i)
+                    pack_off += length
+        os.replace(tmp, self.pack_path)
+        self.chunks, self.files, self.pack_bytes = chunks, files, pack_off
+        return vectors[keep] if vectors is not None else None
+
+    def _save_index(self) -> None:
+        obj = {'version': INDEX_VERSION, 'params': self.params, 'pack_bytes': self.pack_bytes,
+               'paths': self.paths, 'files': self.files, 'chunks': self.chunks}
+        tmp = self.dir / (INDEX_NAME + '.tmp')
+        tmp.write_text(json.dumps(obj, ensure_ascii=False))
+        os.replace(tmp, self.dir / INDEX_NAME)
+
+    def similar(self, query: str, limit: int = 5) -> list[tuple[float, str, int]]:
+        """(cosine score, sha256, offset) of the live chunks closest to `query`."""
+        vectors = np.load(self.dir / VECTORS_NAME, mmap_mode='r')
+        if vectors.shape != (len(self.chunks), VECTOR_DIM):
+            return []
+        scores = vectors @ embed(query)
+        owner: list[str | None] = [None] * len(self.chunks)
+        for sha in set(self.paths.values()):
+            first, count = self.files.get(sha, (0, 0))
+            owner[first:first + count] = [sha] * count
+        out = []
+        for i in np.argsort(-scores):
+            if owner[i] is not None:
+                out.append((float(scores[i]), owner[i], self.chunks[i][0]))
+                if len(out) >= limit:
+                    break
+        return out
+
+
+def main():
+    args = sys.argv[1:]
+    store = ChunkStore()
+    if args[:1] == ['get'] and len(args) in (2, 3):
+        sha = store.paths.get(args[1])
+        for off, length, _ in store.chunks_for(args[1]):
+            if len(args) == 2 or off == int(args[2]):
+                print(f'--- {args[1]} @{off} ({length} bytes)')
+                print(store.read(sha, off))
+    elif args[:1] == ['similar'] and len(args) > 1:
+        if np is None:
+            print('numpy is required for similarity lookup', file=sys.stderr)
+            sys.exit(1)
+        by_sha: dict[str, list[str]] = {}
+        for rel, sha in store.paths.items():
+            by_sha.setdefault(sha, []).append(rel)
+        for score, sha, off in store.similar(' '.join(args[1:])):
+            print(f'{score:6.3f}  {by_sha[sha][0]} @{off}')
+    else:
+        print('usage: chunk_store.py get REL_PATH [OFFSET] | similar QUERY...', file=sys.stderr)
+        sys.exit(2)
+
+
+if __name__ == '__main__':
+    main()
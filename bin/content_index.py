@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import hashlib
+from pathlib import Path
+
+ME_ROOT = Path(os.getenv('KN_ME_ROOT', '/workspace/me'))
+INDEX_FILE = ME_ROOT / '.knowledge_content_index.json'
+SAMPLE_BYTES = 64 * 1024
+INDEX_VERSION = 1
+
+
+def sample_file(path: Path) -> tuple[int, int, str]:
+    """(size, mtime_ns, digest of the size plus the first, middle and last SAMPLE_BYTES)."""
+    with path.open('rb') as f:
+        st = os.fstat(f.fileno())
+        size = st.st_size
+        h = hashlib.sha256(str(size).encode())
+        if size <= 3 * SAMPLE_BYTES:
+            h.update(f.read())
+        else:
+            for off in (0, (size - SAMPLE_BYTES) // 2, size - SAMPLE_BYTES):
+                f.seek(off)
+                h.update(f.read(SAMPLE_BYTES))
+    return size, st.st_mtime_ns, h.hexdigest()
+
+
+class ContentIndex:
+    """digest -> {size, mtime_ns, sample, paths}, persisted next to the fingerprint cache.
+
+    `probe` recognises a path as a rename or preserving copy (mv, cp -p, rsync -t) of
+    known content when size, mtime_ns and the sampled bytes all match, so moved assets
+    keep their digest instead of being rehashed.  Samples are only kept for files of
+    at least `probe_min` bytes; smaller files are cheaper to hash than to probe.
+    """
+
+    def __init__(self, path: Path, probe_min: int = 1024 * 1024):
+        self.path = path
+        self.probe_min = probe_min
+        self.digests: dict[str, dict] = {}
+        self.loaded = False
+        self.dirty = False
+        self._by_size: dict[int, list[str]] | None = None
+
+    @classmethod
+    def load(cls, path: Path, probe_min: int = 1024 * 1024) -> 'ContentIndex':
+        idx = cls(path, probe_min)
+        try:
+            obj = json.loads(path.read_text())
+            if obj.get('version') == INDEX_VERSION:
+                idx.digests = obj.get('digests', {})
+                idx.loaded = True
+        except Exception:
+            pass
+        return idx
+
+    def save(self) -> bool:
+        if not self.dirty:
+            return False
+        tmp = self.path.with_name(self.path.name + '.tmp')
+        tmp.write_text(json.dumps({'version': INDEX_VERSION, 'digests': self.digests}, ensure_ascii=False))
+        os.replace(tmp, self.path)
+        self.dirty = False
+        return True
+
+    def _size_index(self) -> dict[int, list[str]]:
+        if self._by_size is None:
+            self._by_size = {}
+            for digest, info in self.digests.items():
+                if info.get('sample'):
+                    self._by_size.setdefault(info['size'], []).append(digest)
+        return self._by_size
+
+    def add(self, rel: str, digest: str, size: int, mtime_ns: int | None = None, sample: str | None = None) -> None:
+        if not digest:
+            return
+        info = self.digests.get(digest)
+        if info is None:
+            info = self.digests[digest] = {'size': size, 'mtime_ns': None, 'sample': None, 'paths': []}
+        if rel not in info['paths']:
+            info['paths'].append(rel)
+            self.dirty = True
+        if sample and not info.get('sample'):
+            info['sample'] = sample
+            info['mtime_ns'] = mtime_ns
+            self.dirty = True
+            if self._by_size is not None:
+                self._by_size.setdefault(size, []).append(digest)
+
+    def remove(self, rel: str, digest: str) -> None:
+        info = self.digests.get(digest)
+        if info is None or rel not in info['paths']:
+            return
+        info['paths'].remove(rel)
+        self.dirty = True
+        if not info['paths']:
+            del self.digests[digest]
+            if self._by_size is not None and digest in self._by_size.get(info['size'], []):
+                self._by_size[info['size']].remove(digest)
+
+    def move(self, old: str, new: str, digest: str) -> bool:
+        """Rename `old` to `new` under `digest`; False if `old` was not recorded with that digest."""
+        info = self.digests.get(digest)
+        if info is None or old not in info['paths']:
+            return False
+        info['paths'][info['paths'].index(old)] = new
+        self.dirty = True
+        return True
+
+    def rebuild(self, root: Path, files_meta) -> None:
+        """Seed the index from a full file list (first run, or after the index was lost)."""
+        self.digests = {}
+        self._by_size = None
+        for f in files_meta:
+            if f.get('sha256') and 'error' not in f:
+                sample = None
+                if f['size'] >= self.probe_min:
+                    try:
+                        size, mtime_ns, sample = sample_file(root / f['rel_path'])
+                        if (size, mtime_ns) != (f['size'], f.get('mtime_ns')):
+                            sample = None
+                    except OSError:
+                        pass
+                self.add(f['rel_path'], f['sha256'], f['size'], f.get('mtime_ns'), sample)
+        self.loaded = True
+        self.dirty = True
+
+    def samples(self, paths: dict) -> dict:
+        """{rel: (path, size)} -> {rel: (size, mtime_ns, sample)} for files large enough to probe."""
+        out = {}
+        for rel, (p, size) in paths.items():
+            if size >= self.probe_min:
+                try:
+                    out[rel] = sample_file(p)
+                except OSError:
+                    pass
+        return out
+
+    def probe(self, samples: dict) -> dict:
+        """Return {rel: digest} for sampled paths matching known content."""
+        by_size = self._size_index()
+        reused = {}
+        for rel, (size, mtime_ns, sample) in samples.items():
+            for digest in by_size.get(size, ()):
+                info = self.digests[digest]
+                if info['sample'] == sample and info['mtime_ns'] == mtime_ns:
+                    reused[rel] = digest
+                    break
+        return reused
+
+    def paths_for(self, digest: str) -> list[str]:
+        info = self.digests.get(digest)
+        return list(info['paths']) if info else []
+
+    def duplicates(self) -> list[tuple[str, int, list[str]]]:
+        groups = [(d, info['size'], info['paths']) for d, info in self.digests.items() if len(info['paths']) > 1]
+        groups.sort(key=lambda g: g[1] * (len(g[2]) - 1), reverse=True)
+        return groups
+
+    def duplicate_bytes(self) -> int:
+        return sum(size * (len(paths) - 1) for _, size, paths in self.duplicates())
+
+
+def main():
+    idx = ContentIndex.load(INDEX_FILE)
+    if not idx.loaded:
+        print('content index not built yet', file=sys.stderr)
+        sys.exit(1)
+    args = sys.argv[1:]
+    if args[:1] == ['lookup'] and len(args) == 2:
+        print(json.dumps(idx.paths_for(args[1]), ensure_ascii=False, indent=2))
+    else:
+        dupes = [{'digest': d, 'size': size, 'paths': paths} for d, size, paths in idx.duplicates()]
+        print(json.dumps({'duplicate_bytes': idx.duplicate_bytes(), 'groups': dupes}, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
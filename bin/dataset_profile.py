@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+import os
+import csv
+import sys
+import json
+import math
+from pathlib import Path
+
+READ_CHUNK = 8 * 1024 * 1024
+NULL_VALUES = {'', 'null', 'NULL', 'None', 'NA', 'N/A', 'nan', 'NaN'}
+EXACT_DISTINCT_MAX = 1024
+HLL_BITS = 12
+STRING_STAT_CHARS = 64
+
+
+class HyperLogLog:
+    """Approximate distinct counter in 2**bits bytes (about 1.6% error at 12 bits)."""
+
+    def __init__(self, bits: int = HLL_BITS):
+        self.bits = bits
+        self.registers = bytearray(1 << bits)
+
+    def add(self, value: str) -> None:
+        # str hash is SipHash, randomised per process but stable within the one pass a sketch lives for
+        x = hash(value) & 0xFFFFFFFFFFFFFFFF
+        j = x >> (64 - self.bits)
+        rest = x & ((1 << (64 - self.bits)) - 1)
+        rank = (64 - self.bits) - rest.bit_length() + 1
+        if rank > self.registers[j]:
+            self.registers[j] = rank
+
+    def estimate(self) -> int:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        e = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if e <= 2.5 * m and zeros:
+            e = m * math.log(m / zeros)
+        return int(round(e))
+
+
+class ColumnStats:
+    def __init__(self):
+        self.nulls = 0
+        self.numeric = True
+        self.num_min = self.num_max = None
+        self.str_min = self.str_max = None
+        self.exact: set | None = set()
+        self.hll: HyperLogLog | None = None
+
+    def add(self, value: str) -> None:
+        if value in NULL_VALUES:
+            self.nulls += 1
+            return
+        if self.numeric:
+            try:
+                n = float(value)
+                if self.num_min is None or n < self.num_min:
+                    self.num_min = n
+                if self.num_max is None or n > self.num_max:
+                    self.num_max = n
+            except ValueError:
+                self.numeric = False
+        short = value[:STRING_STAT_CHARS]
+        if self.str_min is None or short < self.str_min:
+            self.str_min = short
+        if self.str_max is None or short > self.str_max:
+            self.str_max = short
+        if self.exact is not None:
+            self.exact.add(value)
+            if len(self.exact) > EXACT_DISTINCT_MAX:
+                self.hll = HyperLogLog()
+                for v in self.exact:
+                    self.hll.add(v)
+                self.exact = None
+        else:
+            self.hll.add(value)
+
+    def result(self) -> dict:
+        numeric = self.numeric and self.num_min is not None
+        out = {
+            'nulls': self.nulls,
+            'type': 'number' if numeric else 'string',
+            'min': self.num_min if numeric else self.str_min,
+            'max': self.num_max if numeric else self.str_max,
+        }
+        if self.exact is not None:
+            out['distinct'] = len(self.exact)
+        else:
+            out['distinct'] = self.hll.estimate()
+            out['distinct_approx'] = True
+        return out
+
+
+def count_lines(path: Path) -> tuple[int, bool]:
+    """(newline count, whether the last line lacks a trailing newline), reading in chunks."""
+    count = 0
+    last = b''
+    with path.open('rb') as f:
+        for chunk in iter(lambda: f.read(READ_CHUNK), b''):
+            count += chunk.count(b'\n')
+            last = chunk[-1:]
+    return count, bool(last) and last != b'\n'
+
+
+def read_header(path: Path) -> list[str]:
+    with path.open('r', encoding='utf-8', errors='replace', newline='') as f:
+        return next(csv.reader(f), [])
+
+
+def column_stats(path: Path, header: list[str]) -> tuple[int, int, list[dict]]:
+    """(records, ragged records, per-column stats) from one csv.reader pass."""
+    cols = [ColumnStats() for _ in header]
+    records = ragged = 0
+    with path.open('r', encoding='utf-8', errors='replace', newline='') as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        for row in reader:
+            records += 1
+            if len(row) != len(cols):
+                ragged += 1
+            for col, value in zip(cols, row):
+                col.add(value)
+    return records, ragged, [{'name': name, **col.result()} for name, col in zip(header, cols)]
+
+
+def want_stats(size: int) -> bool:
+    mode = os.getenv('KN_DATASET_STATS', 'auto').strip().lower()
+    if mode in ('0', 'off', 'false'):
+        return False
+    if mode in ('1', 'on', 'true'):
+        return True
+    # The csv.reader pass runs at roughly 10 MB/s; bigger files only get counted
+    try:
+        limit = int(os.getenv('KN_DATASET_STATS_MAX_BYTES', str(64 * 1024 * 1024)))
+    except ValueError:
+        limit = 64 * 1024 * 1024
+    return size <= limit
+
+
+def profile_csv(path: Path, stats: bool | None = None) -> dict:
+    """Row/column counts in bounded memory; with stats, a csv.reader pass adds exact
+    record counts and per-column null/min/max/distinct figures."""
+    size = path.stat().st_size
+    if stats is None:
+        stats = want_stats(size)
+    header = read_header(path)
+    info = {'size': size, 'columns': len(header), 'header': header, 'stats': stats}
+    if stats:
+        records, ragged, cols = column_stats(path, header)
+        info.update({'rows': records, 'rows_exact': True, 'ragged_rows': ragged, 'column_stats': cols})
+    else:
+        # Newline counting is exact unless quoted fields contain line breaks
+        lines, unterminated = count_lines(path)
+        info.update({'rows': max(0, lines + int(unterminated) - 1), 'rows_exact': False})
+    return info
+
+
+def main():
+    for arg in sys.argv[1:]:
+        print(json.dumps({arg: profile_csv(Path(arg))}, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
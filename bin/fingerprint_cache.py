@@ -0,0 +1,242 @@
+import os
+import mmap
+import struct
+import hashlib
+from pathlib import Path
+
+# Layout (little-endian):
+#   header | bucket directory ((1 << bits) + 1 x u32 record index) | records | child table | path string table
+# Records are sorted by a 64-bit path hash; the top `bits` of the hash select a bucket,
+# so a lookup touches one directory slot and the one or two records in its bucket.
+# Directory records (FLAG_DIR) keep the directory mtime_ns; their size/aux fields hold the
+# number and start of their children in the child table (u32 record indices).
+# Meta records (FLAG_META, keyed by a NUL-prefixed name) hold build-state digests such
+# as the stable digest of each generated output.
+# Archive member records (FLAG_CRC) keep the member's CRC-32 in aux.
+MAGIC = b'KNFC'
+VERSION = 2
+HEADER = struct.Struct('<4sHHIQqQQ')     # magic, version, bucket bits, count, strings offset, updated_at_ns, child table offset, filters digest
+RECORD = struct.Struct('<QIIQqII32s')    # path hash, str offset, str length, size, mtime_ns, flags, aux, sha256
+RECORD_KEY = struct.Struct('<QII')
+SLOT = struct.Struct('<I')
+BUCKET_RANGE = struct.Struct('<II')
+FLAG_NO_SHA = 0x1
+FLAG_DIR = 0x2
+FLAG_MERKLE = 0x4      # written by the former chunked fingerprint mode; such entries are rehashed
+FLAG_META = 0x8
+FLAG_CRC = 0x10
+MAX_BUCKET_BITS = 24
+
+
+def path_hash(rel: str) -> int:
+    return int.from_bytes(hashlib.blake2b(rel.encode('utf-8', 'surrogateescape'), digest_size=8).digest(), 'little')
+
+
+def bucket_bits_for(count: int) -> int:
+    return min(MAX_BUCKET_BITS, max(1, count.bit_length()))
+
+
+class FingerprintCache:
+    """Read-only, memory-mapped view over the binary fingerprint cache.
+
+    Behaves like the old ``{rel_path: entry}`` dict for ``get``/``in``/``items``;
+    entries are decoded only when looked up.
+    """
+
+    def __init__(self, path: Path, root: Path):
+        self.path = path
+        self.root = root
+        self._root_prefix = os.path.join(str(root), '')
+        self.count = 0
+        self.updated_at_ns = 0
+        self.filters_digest = 0
+        self._mm = None
+        try:
+            with path.open('rb') as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return
+        if len(mm) < HEADER.size:
+            mm.close()
+            return
+        magic, version, bits, count, strings_off, updated, children_off, filters_digest = HEADER.unpack_from(mm, 0)
+        if magic != MAGIC or version != VERSION:
+            mm.close()
+            return
+        self._mm = mm
+        self.bits = bits
+        self.count = count
+        self.updated_at_ns = updated
+        self.filters_digest = filters_digest
+        self._children_off = children_off
+        self._strings_off = strings_off
+        self._records_off = HEADER.size + ((1 << bits) + 1) * SLOT.size
+
+    @property
+    def valid(self) -> bool:
+        return self._mm is not None
+
+    def _rel_at(self, i: int) -> str:
+        _, off, length = RECORD_KEY.unpack_from(self._mm, self._records_off + i * RECORD.size)
+        start = self._strings_off + off
+        return self._mm[start:start + length].decode('utf-8', 'surrogateescape')
+
+    def _find(self, rel: str) -> int:
+        if not self.count:
+            return -1
+        h = path_hash(rel)
+        lo, hi = BUCKET_RANGE.unpack_from(self._mm, HEADER.size + (h >> (64 - self.bits)) * SLOT.size)
+        encoded = rel.encode('utf-8', 'surrogateescape')
+        for i in range(lo, hi):
+            rh, off, length = RECORD_KEY.unpack_from(self._mm, self._records_off + i * RECORD.size)
+            if rh == h and length == len(encoded):
+                start = self._strings_off + off
+                if self._mm[start:start + length] == encoded:
+                    return i
+        return -1
+
+    def _entry(self, i: int, rel: str | None = None) -> dict:
+        _, off, length, size, mtime_ns, flags, aux, sha = RECORD.unpack_from(self._mm, self._records_off + i * RECORD.size)
+        if rel is None:
+            start = self._strings_off + off
+            rel = self._mm[start:start + length].decode('utf-8', 'surrogateescape')
+        entry = {
+            'abs_path': self._root_prefix + rel,
+            'rel_path': rel,
+            'size': size,
+            'mtime': mtime_ns / 1e9,
+            'mtime_ns': mtime_ns,
+            'sha256': '' if flags & FLAG_NO_SHA else sha.hex(),
+        }
+        if flags & FLAG_MERKLE:
+            entry['hash_mode'] = 'merkle'
+        if flags & FLAG_CRC:
+            entry['crc32'] = aux
+        return entry
+
+    def _flags(self, i: int) -> int:
+        return struct.unpack_from('<I', self._mm, self._records_off + i * RECORD.size + 32)[0]
+
+    def _find_file(self, rel: str) -> int:
+        i = self._find(rel)
+        return i if i >= 0 and not self._flags(i) & (FLAG_DIR | FLAG_META) else -1
+
+    def get(self, rel: str, default=None):
+        i = self._find_file(rel)
+        return self._entry(i, rel) if i >= 0 else default
+
+    def __contains__(self, rel) -> bool:
+        return self._find_file(rel) >= 0
+
+    def __iter__(self):
+        return self.keys()
+
+    def keys(self):
+        for i in range(self.count):
+            if not self._flags(i) & (FLAG_DIR | FLAG_META):
+                yield self._rel_at(i)
+
+    def items(self):
+        for i in range(self.count):
+            if self._flags(i) & (FLAG_DIR | FLAG_META):
+                continue
+            entry = self._entry(i)
+            yield entry['rel_path'], entry
+
+    def _dir_at(self, i: int) -> tuple[int, list, list]:
+        _, _, _, n, mtime_ns, _, start, _ = RECORD.unpack_from(self._mm, self._records_off + i * RECORD.size)
+        children = struct.unpack_from(f'<{n}I', self._mm, self._children_off + start * SLOT.size)
+        files, subdirs = [], []
+        for c in children:
+            if self._flags(c) & FLAG_DIR:
+                subdirs.append(self._rel_at(c))
+            else:
+                files.append(self._entry(c))
+        return mtime_ns, files, subdirs
+
+    def get_dir(self, rel: str):
+        """Return (mtime_ns, file entries, subdir paths) recorded for a directory, or None."""
+        i = self._find(rel)
+        if i < 0 or not self._flags(i) & FLAG_DIR:
+            return None
+        return self._dir_at(i)
+
+    def dir_items(self):
+        for i in range(self.count):
+            if self._flags(i) & FLAG_DIR:
+                mtime_ns, files, subdirs = self._dir_at(i)
+                yield self._rel_at(i), (mtime_ns, [f['rel_path'] for f in files] + subdirs)
+
+    def meta(self, name: str) -> str:
+        """Hex digest stored under `name` by write_fingerprint_cache(meta=...), or ''."""
+        i = self._find('\0' + name)
+        if i < 0 or not self._flags(i) & FLAG_META:
+            return ''
+        return RECORD.unpack_from(self._mm, self._records_off + i * RECORD.size)[7].hex()
+
+    def values(self):
+        for _, entry in self.items():
+            yield entry
+
+    def close(self) -> None:
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+
+
+def write_fingerprint_cache(path: Path, files_meta, updated_at_ns: int, dirs: dict | None = None,
+                            filters_digest: int = 0, meta: dict | None = None) -> None:
+    """`dirs` maps a directory rel path ('' for the root) to (mtime_ns, child rel paths);
+    `meta` maps names to 32-byte hex digests."""
+    records = []
+    for f in files_meta:
+        if 'error' in f or 'size' not in f:
+            continue
+        rel = f['rel_path']
+        sha = f.get('sha256') or ''
+        mtime_ns = f.get('mtime_ns')
+        if mtime_ns is None:
+            mtime_ns = int(round(f.get('mtime', 0) * 1e9))
+        flags = (0 if sha else FLAG_NO_SHA) | (FLAG_MERKLE if f.get('hash_mode') == 'merkle' else 0)
+        crc = f.get('crc32')
+        if crc is not None:
+            flags |= FLAG_CRC
+        records.append((path_hash(rel), rel.encode('utf-8', 'surrogateescape'), f['size'], mtime_ns,
+                        flags, bytes.fromhex(sha) if sha else bytes(32), crc or 0))
+    for rel, (mtime_ns, _) in (dirs or {}).items():
+        records.append((path_hash(rel), rel.encode('utf-8', 'surrogateescape'), 0, mtime_ns,
+                        FLAG_DIR | FLAG_NO_SHA, bytes(32), 0))
+    for name, digest in (meta or {}).items():
+        key = '\0' + name
+        records.append((path_hash(key), key.encode('utf-8'), 0, 0, FLAG_META, bytes.fromhex(digest), 0))
+    records.sort(key=lambda r: (r[0], r[1]))
+    index_of = {r[1]: i for i, r in enumerate(records)} if dirs else {}
+    child_table: list[int] = []
+    child_span = {}
+    for rel, (_, children) in (dirs or {}).items():
+        idx = [index_of[c] for c in (c.encode('utf-8', 'surrogateescape') for c in children) if c in index_of]
+        child_span[rel.encode('utf-8', 'surrogateescape')] = (len(idx), len(child_table))
+        child_table.extend(idx)
+    bits = bucket_bits_for(len(records))
+    slots = [0] * ((1 << bits) + 1)
+    for r in records:
+        slots[(r[0] >> (64 - bits)) + 1] += 1
+    for i in range(1, len(slots)):
+        slots[i] += slots[i - 1]
+    records_off = HEADER.size + len(slots) * SLOT.size
+    children_off = records_off + len(records) * RECORD.size
+    strings_off = children_off + len(child_table) * SLOT.size
+    tmp = path.with_name(path.name + '.tmp')
+    with tmp.open('wb') as out:
+        out.write(HEADER.pack(MAGIC, VERSION, bits, len(records), strings_off, updated_at_ns, children_off, filters_digest))
+        out.write(struct.pack(f'<{len(slots)}I', *slots))
+        str_off = 0
+        for h, rel_b, size, mtime_ns, flags, sha, aux in records:
+            if flags & FLAG_DIR:
+                size, aux = child_span[rel_b]
+            out.write(RECORD.pack(h, str_off, len(rel_b), size, mtime_ns, flags, aux, sha))
+            str_off += len(rel_b)
+        out.write(struct.pack(f'<{len(child_table)}I', *child_table))
+        for r in records:
+            out.write(r[1])
+    os.replace(tmp, path)
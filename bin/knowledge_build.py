@@ -1,25 +1,87 @@
 #!/usr/bin/env python3
 import os
+import re
 import sys
 import json
 import time
+import select
+import signal
+import struct
+import mmap
+import shutil
 import hashlib
+import ctypes
+import ctypes.util
 from datetime import datetime, timezone
 from pathlib import Path
-from fnmatch import fnmatch
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
 
-TRAN_ROOT = Path('/workspace/tran')
-ME_ROOT = Path('/workspace/me')
+from knowledge_io import OutputBatch, iter_knowledge_chunks
+from fingerprint_cache import FingerprintCache, write_fingerprint_cache
+from content_index import ContentIndex, INDEX_FILE as CONTENT_INDEX_FILE
+from dataset_profile import profile_csv, want_stats
+from openapi_index import index_openapi, INDEX_FILE as OPENAPI_INDEX_FILE
+from text_index import TextIndex, indexable, load_manifest, INDEX_DIR as TEXT_INDEX_DIR
+from build_metrics import BuildMetrics, maybe_profile
+from snapshot_store import SnapshotStore, SNAPSHOTS_DIR
+from change_journal import Journal, run_delta, JOURNAL_DIR
+from archive_index import (ARCHIVE_SEP, archives_enabled, is_archive, split_member, list_members, member_entry,
+                           member_rel, hash_members, read_member)
+from metrics_store import (MetricsRollup, compact_log, serve_in_thread, STATE_FILE as METRICS_STATE_FILE,
+                           ROLLUP_DIR as METRICS_ROLLUP_DIR)
+
+TRAN_ROOT = Path(os.getenv('KN_TRAN_ROOT', '/workspace/tran'))
+ME_ROOT = Path(os.getenv('KN_ME_ROOT', '/workspace/me'))
 ME_ROOT.mkdir(parents=True, exist_ok=True)
 
-CACHE_FILE = ME_ROOT / '.knowledge_cache.json'
+CACHE_FILE = ME_ROOT / '.knowledge_cache.bin'
+LEGACY_CACHE_FILE = ME_ROOT / '.knowledge_cache.json'
+# Chunk tables of the former chunked (Merkle) fingerprint mode; removed on sight
+LEGACY_CHUNKS_DIR = ME_ROOT / '.knowledge_chunks'
+SUMMARY_FRAGMENTS_FILE = ME_ROOT / '.knowledge_summary.json'
+# Bump when a SUMMARY.md section renders differently, so cached fragments are dropped
+SUMMARY_VERSION = 2
+DATASETS_FILE = ME_ROOT / 'datasets.json'
+DATASETS_PREFIX = 'tran/datasets/'
+API_PREFIX = 'tran/api/'
 METRICS_JSONL = ME_ROOT / 'metrics.jsonl'
 METRICS_SUMMARY = ME_ROOT / 'metrics.json'
-SNAPSHOTS_DIR = ME_ROOT / 'snapshots'
+OUTPUT_FORMAT = 'jsonl' if os.getenv('KN_OUTPUT_FORMAT', 'json').strip().lower() == 'jsonl' else 'json'
+KNOWLEDGE_FILE = ME_ROOT / f'knowledge.{OUTPUT_FORMAT}'
+LOG_DIR = ME_ROOT / '_logs'
 UTC = timezone.utc
 
 
+def env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except Exception:
+        return default
+
+
+HASH_READ_BUFFER = 8 * 1024 * 1024
+DEDUP_PROBE_MIN = env_int('KN_DEDUP_PROBE_MIN', 1024 * 1024)
+# Above this many queued changes an incremental build is no cheaper than a full scan
+QUEUE_MAX = env_int('KN_QUEUE_MAX', 10000)
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE_SELF | IN_MOVE_SELF
+EVENT_HEADER = struct.Struct('iIII')
+# Phase timings and counters of the build in progress, appended to metrics.jsonl
+PHASES = BuildMetrics()
+# Loaded on first use and kept for the daemon's lifetime
+ROLLUP: MetricsRollup | None = None
+
+
 def sha256_file(path: Path) -> str:
     h = hashlib.sha256()
     with path.open('rb') as f:
@@ -42,83 +104,685 @@ def list_files(root: Path):
             yield p
 
 
-def load_cache() -> dict:
-    if CACHE_FILE.exists():
+def load_cache():
+    cache = FingerprintCache(CACHE_FILE, TRAN_ROOT)
+    if cache.valid:
+        return cache
+    if LEGACY_CACHE_FILE.exists():
         try:
-            return json.loads(CACHE_FILE.read_text())
+            legacy = json.loads(LEGACY_CACHE_FILE.read_text())
+            return {f.get('rel_path'): f for f in legacy.get('files', [])}
         except Exception:
             return {}
     return {}
 
 
-def save_cache(cache: dict) -> None:
-    CACHE_FILE.write_text(json.dumps(cache, ensure_ascii=False))
+def save_cache(files_meta: list, now_dt: datetime, dirs: dict | None = None, digests: dict | None = None) -> None:
+    write_fingerprint_cache(CACHE_FILE, files_meta, int(now_dt.timestamp() * 1e9), dirs, filters_digest(), digests)
+    if LEGACY_CACHE_FILE.exists():
+        LEGACY_CACHE_FILE.unlink()
+    if LEGACY_CHUNKS_DIR.exists():
+        shutil.rmtree(LEGACY_CHUNKS_DIR, ignore_errors=True)
 
 
-def build_filters():
-    include = [s.strip() for s in os.getenv('KN_INCLUDE_GLOBS', '').split(',') if s.strip()]
-    ignore = [s.strip() for s in os.getenv('KN_IGNORE_GLOBS', '').split(',') if s.strip()]
-    def is_included(rel_path: str) -> bool:
+def make_entry(p: Path, rel: str, size: int, mtime_ns: int, sha: str) -> dict:
+    entry = {
+        'abs_path': str(p),
+        'rel_path': rel,
+        'size': size,
+        'mtime': mtime_ns / 1e9,
+        'mtime_ns': mtime_ns,
+        'sha256': sha,
+    }
+    return entry
+
+
+def fingerprint_current(prev, size: int, mtime_ns: int) -> bool:
+    if not prev or prev.get('size') != size:
+        return False
+    if prev.get('hash_mode', 'sha256') != 'sha256':
+        # Cached by the former Merkle mode: 'sha256' holds a chunk root, not the file digest
+        return False
+    if 'mtime_ns' in prev:
+        return prev['mtime_ns'] == mtime_ns
+    # Legacy JSON cache entries only carry the float st_mtime
+    return abs((prev.get('mtime') or 0) - mtime_ns / 1e9) < 1e-6
+
+
+def glob_to_regex(pat: str) -> str:
+    """fnmatch-compatible translation ('*' also crosses '/') plus '**/' for zero or more directories."""
+    out = []
+    i, n = 0, len(pat)
+    while i < n:
+        c = pat[i]
+        if c == '*':
+            if pat.startswith('**/', i):
+                out.append('(?:.*/)?')
+                i += 3
+                continue
+            while i < n and pat[i] == '*':
+                i += 1
+            out.append('.*')
+            continue
+        i += 1
+        if c == '?':
+            out.append('.')
+        elif c == '[':
+            j = i
+            if j < n and pat[j] == '!':
+                j += 1
+            if j < n and pat[j] == ']':
+                j += 1
+            while j < n and pat[j] != ']':
+                j += 1
+            if j >= n:
+                out.append('\\[')
+                continue
+            stuff = pat[i:j].replace('\\', '\\\\')
+            i = j + 1
+            if stuff.startswith('!'):
+                stuff = '^' + stuff[1:]
+            elif stuff.startswith(('^', '[')):
+                stuff = '\\' + stuff
+            out.append(f'[{stuff}]')
+        else:
+            out.append(re.escape(c))
+    return ''.join(out)
+
+
+def _compile_globs(patterns: list[str]):
+    if not patterns:
+        return None
+    return re.compile('|'.join(f'(?:{glob_to_regex(p)})' for p in patterns) + r'\Z', re.S)
+
+
+class PathMatcher:
+    """KN_INCLUDE_GLOBS / KN_IGNORE_GLOBS compiled once into a single regex each.
+
+    Calling the matcher with a relative path answers "is this file included?".
+    ``may_match_under(dir)`` answers whether anything below a directory can be
+    included, so walkers can prune whole subtrees; the answer is memoised per
+    directory and also short-circuits file checks inside excluded directories.
+    """
+
+    def __init__(self, include: list[str], ignore: list[str]):
+        self.include = include
+        self.ignore = ignore
+        self.trivial = not include and not ignore
+        self._include_re = _compile_globs(include)
+        self._ignore_re = _compile_globs(ignore)
+        # An ignore glob ending in '*' that matches "<dir>/" matches everything below it too
+        self._subtree_ignore_re = _compile_globs([p for p in ignore if p.endswith('*')])
+        self._include_prefixes = [re.split(r'[*?\[]', p, maxsplit=1)[0] for p in include]
+        self._dir_cache: dict[str, bool] = {'': True}
+
+    def may_match_under(self, rel_dir: str) -> bool:
+        hit = self._dir_cache.get(rel_dir)
+        if hit is not None:
+            return hit
+        parent = rel_dir.rpartition('/')[0]
+        ok = self.may_match_under(parent) if parent != rel_dir else True
+        if ok:
+            prefix = rel_dir + '/'
+            if self._subtree_ignore_re is not None and self._subtree_ignore_re.match(prefix):
+                ok = False
+            elif self._include_re is not None:
+                ok = any(lit.startswith(prefix) or prefix.startswith(lit) for lit in self._include_prefixes)
+        self._dir_cache[rel_dir] = ok
+        return ok
+
+    def __call__(self, rel_path: str) -> bool:
+        if self.trivial:
+            return True
         rp = rel_path.replace('\\', '/')
-        if include:
-            ok = any(fnmatch(rp, pat) for pat in include)
-            if not ok:
-                return False
-        if ignore:
-            if any(fnmatch(rp, pat) for pat in ignore):
-                return False
+        if not self.may_match_under(rp.rpartition('/')[0]):
+            return False
+        if self._include_re is not None and not self._include_re.match(rp):
+            return False
+        if self._ignore_re is not None and self._ignore_re.match(rp):
+            return False
         return True
-    return is_included
 
 
-def collect_metadata_parallel(root: Path, prev_map: dict, max_workers: int, is_included) -> tuple[list, list]:
+def build_filters() -> PathMatcher:
+    include = [s.strip() for s in os.getenv('KN_INCLUDE_GLOBS', '').split(',') if s.strip()]
+    ignore = [s.strip() for s in os.getenv('KN_IGNORE_GLOBS', '').split(',') if s.strip()]
+    return PathMatcher(include, ignore)
+
+
+def filters_digest() -> int:
+    spec = os.getenv('KN_INCLUDE_GLOBS', '') + '\0' + os.getenv('KN_IGNORE_GLOBS', '')
+    return int.from_bytes(hashlib.blake2b(spec.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def scan_dir(root: Path, rel: str, prev_dir):
+    """List one directory with os.scandir, reusing DirEntry stat results.
+
+    Returns (rel, mtime_ns, files, subdirs, errors) where files are
+    (rel, size, mtime_ns, prev_entry) tuples.  When `prev_dir` carries the same
+    directory mtime its cached listing is returned without reading the directory.
+    """
+    path = os.path.join(root, rel) if rel else str(root)
+    files, subdirs, errors = [], [], []
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+    except OSError as e:
+        return rel, None, files, subdirs, [(rel, str(e))]
+    if prev_dir is not None and prev_dir[0] == mtime_ns:
+        _, cached_files, cached_dirs = prev_dir
+        files = [(f['rel_path'], f['size'], f['mtime_ns'], f) for f in cached_files]
+        return rel, mtime_ns, files, cached_dirs, errors
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                child = f"{rel}/{entry.name}" if rel else entry.name
+                try:
+                    if entry.is_dir():
+                        if not entry.is_symlink():
+                            subdirs.append(child)
+                        continue
+                    st = entry.stat()
+                    files.append((child, st.st_size, st.st_mtime_ns, None))
+                except OSError as e:
+                    errors.append((child, str(e)))
+    except OSError as e:
+        errors.append((rel, str(e)))
+    return rel, mtime_ns, files, subdirs, errors
+
+
+def walk_tree(root: Path, is_included, prev_map, prune: bool = False):
+    """Parallel scandir walk; returns (files, dirs, errors) with dirs as {rel: (mtime_ns, children)}."""
+    get_dir = getattr(prev_map, 'get_dir', None) if prune else None
+    may_match_under = getattr(is_included, 'may_match_under', lambda d: True)
+    try:
+        threads = int(os.getenv('KN_WALK_THREADS', str(min(32, (os.cpu_count() or 2) * 4))))
+    except Exception:
+        threads = 8
+    files, errors = [], []
+    dirs: dict[str, tuple[int, list[str]]] = {}
+    with ThreadPoolExecutor(max_workers=max(1, threads)) as tp:
+        pending = {tp.submit(scan_dir, root, '', get_dir('') if get_dir else None)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                rel, mtime_ns, dir_files, subdirs, dir_errors = fut.result()
+                errors.extend(dir_errors)
+                if mtime_ns is None:
+                    continue
+                dirs[rel] = (mtime_ns, [f[0] for f in dir_files] + list(subdirs))
+                files.extend(f for f in dir_files if is_included(f[0]))
+                for d in subdirs:
+                    if may_match_under(d):
+                        pending.add(tp.submit(scan_dir, root, d, get_dir(d) if get_dir else None))
+    files.sort(key=lambda f: f[0])
+    return files, dirs, errors
+
+
+def sha256_large(path: Path) -> str:
+    # One hashlib call over the mapping: the GIL is released for the whole file
+    with path.open('rb') as f:
+        try:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return hashlib.sha256(mm).hexdigest()
+        except (ValueError, OSError):
+            pass
+        h = hashlib.sha256()
+        for chunk in iter(lambda: f.read(HASH_READ_BUFFER), b''):
+            h.update(chunk)
+        return h.hexdigest()
+
+
+def hash_batch(batch: list[tuple[str, str]]) -> list[tuple[str, str]]:
+    out = []
+    for rel, path in batch:
+        try:
+            out.append((rel, sha256_file(Path(path))))
+        except Exception:
+            out.append((rel, ''))
+    return out
+
+
+class HashScheduler:
+    """Routes fingerprinting work by file size.
+
+    Small files are grouped into batches of roughly KN_HASH_BATCH_BYTES (at most
+    KN_HASH_BATCH_FILES files) and sent to the process pool as one task each, so
+    pickling/IPC is paid per batch rather than per file; a change set below
+    KN_HASH_INLINE_BYTES is hashed in-process without touching a pool.  Files of
+    KN_HASH_LARGE_BYTES and up go to a thread pool:
+    hashlib releases the GIL, so they run in parallel without copying data
+    between processes.  Pools are created on first use and kept until close(),
+    which lets the daemon reuse them across builds.
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max(1, max_workers)
+        self.batch_bytes = env_int('KN_HASH_BATCH_BYTES', 16 * 1024 * 1024)
+        self.batch_files = max(1, env_int('KN_HASH_BATCH_FILES', 512))
+        self.large_bytes = env_int('KN_HASH_LARGE_BYTES', 64 * 1024 * 1024)
+        self.inline_bytes = env_int('KN_HASH_INLINE_BYTES', 4 * 1024 * 1024)
+        self.progress = os.getenv('KN_HASH_PROGRESS', '0') == '1'
+        self._processes = None
+        self._threads = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self) -> None:
+        for executor in (self._processes, self._threads):
+            if executor is not None:
+                executor.shutdown()
+        self._processes = self._threads = None
+
+    def _process_pool(self) -> ProcessPoolExecutor:
+        if self._processes is None:
+            self._processes = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._processes
+
+    def _thread_pool(self) -> ThreadPoolExecutor:
+        if self._threads is None:
+            self._threads = ThreadPoolExecutor(max_workers=self.max_workers)
+        return self._threads
+
+    def _batches(self, small: list[tuple[str, Path, int]]):
+        batch, batch_size = [], 0
+        for rel, p, size in small:
+            batch.append((rel, str(p)))
+            batch_size += size
+            if batch_size >= self.batch_bytes or len(batch) >= self.batch_files:
+                yield batch, batch_size
+                batch, batch_size = [], 0
+        if batch:
+            yield batch, batch_size
+
+    def _report(self, kind: str, done: int, total: int, files: int, size: int, hashed: int, started: float) -> None:
+        if not self.progress:
+            return
+        elapsed = max(time.perf_counter() - started, 1e-9)
+        print(f"[hash] {kind} {done}/{total} files={files} bytes={fmt_bytes(size)} "
+              f"total={fmt_bytes(hashed)} {hashed / elapsed / 1e6:.1f} MB/s", file=sys.stderr)
+
+    def hash(self, paths: dict) -> dict:
+        """Fingerprint {rel: (path, size)}; returns {rel: digest} ('' when hashing failed)."""
+        sha_map = {}
+        small, large = [], []
+        for rel, (p, size) in paths.items():
+            if size >= self.large_bytes:
+                large.append((rel, p, size))
+            else:
+                small.append((rel, p, size))
+        if not large and sum(size for _, _, size in small) <= self.inline_bytes:
+            sha_map.update(hash_batch([(rel, str(p)) for rel, p, _ in small]))
+            return sha_map
+        started = time.perf_counter()
+        futures = {}
+        for batch, size in self._batches(small):
+            futures[self._process_pool().submit(hash_batch, batch)] = ('batch', batch, size)
+        for rel, p, size in large:
+            fut = self._thread_pool().submit(sha256_large, p)
+            futures[fut] = ('large', rel, size)
+        total = len(futures)
+        PHASES.peak('hash_queue_peak', total)
+        PHASES.count('hash_tasks', total)
+        hashed = 0
+        for done, fut in enumerate(as_completed(futures), 1):
+            kind, item, size = futures[fut]
+            hashed += size
+            if kind == 'batch':
+                try:
+                    sha_map.update(fut.result())
+                except Exception:
+                    sha_map.update((rel, '') for rel, _ in item)
+                self._report(kind, done, total, len(item), size, hashed, started)
+            else:
+                try:
+                    sha_map[item] = fut.result()
+                except Exception:
+                    sha_map[item] = ''
+                self._report(kind, done, total, 1, size, hashed, started)
+        return sha_map
+
+    def hash_members(self, tasks: dict) -> dict:
+        """Hash archive members {archive path: [(rel, member name, size)]}; returns {rel: digest}.
+
+        Members of one archive are batched like small files, so each task opens the
+        archive once and streams its members through the decompressor.
+        """
+        batches = []
+        for path, items in tasks.items():
+            batch, batch_size = [], 0
+            for rel, name, size in items:
+                batch.append((rel, name))
+                batch_size += size
+                if batch_size >= self.batch_bytes or len(batch) >= self.batch_files:
+                    batches.append((path, batch, batch_size))
+                    batch, batch_size = [], 0
+            if batch:
+                batches.append((path, batch, batch_size))
+        sha_map = {}
+        if sum(size for _, _, size in batches) <= self.inline_bytes:
+            for path, batch, _ in batches:
+                sha_map.update(hash_members(path, batch))
+            return sha_map
+        futures = {self._process_pool().submit(hash_members, path, batch): batch for path, batch, _ in batches}
+        PHASES.peak('hash_queue_peak', len(futures))
+        PHASES.count('hash_tasks', len(futures))
+        for fut in as_completed(futures):
+            try:
+                sha_map.update(fut.result())
+            except Exception:
+                sha_map.update((rel, '') for rel, _ in futures[fut])
+        return sha_map
+
+
+def hash_many(paths: dict, max_workers: int, scheduler: HashScheduler | None = None) -> dict:
+    if not paths:
+        return {}
+    if scheduler is None:
+        with HashScheduler(max_workers) as own:
+            return own.hash(paths)
+    return scheduler.hash(paths)
+
+
+def hash_with_reuse(paths: dict, max_workers: int, scheduler=None, content_index: ContentIndex | None = None) -> dict:
+    """hash_many, except renamed/copied content found in the content index keeps its digest."""
+    if content_index is None or not paths:
+        PHASES.count('files_hashed', len(paths))
+        PHASES.count('bytes_hashed', sum(size for _, size in paths.values()))
+        return hash_many(paths, max_workers, scheduler)
+    samples = content_index.samples(paths)
+    reused = content_index.probe(samples) if samples else {}
+    to_hash = {rel: v for rel, v in paths.items() if rel not in reused}
+    PHASES.count('files_hashed', len(to_hash))
+    PHASES.count('bytes_hashed', sum(size for _, size in to_hash.values()))
+    PHASES.count('content_reused', len(reused))
+    sha_map = hash_many(to_hash, max_workers, scheduler)
+    for rel, (size, mtime_ns, sample) in samples.items():
+        if sha_map.get(rel):
+            content_index.add(rel, sha_map[rel], size, mtime_ns, sample)
+    sha_map.update(reused)
+    return sha_map
+
+
+def collect_metadata_parallel(root: Path, prev_map: dict, max_workers: int, is_included, scheduler=None,
+                              prune: bool = False, content_index: ContentIndex | None = None) -> tuple[list, list, dict]:
     files = []
     changed_paths = []
     to_hash = []
     stat_map = {}
-    for p in list_files(root):
-        rel = str(p.relative_to(root))
-        if not is_included(rel):
+    with PHASES.phase('walk'):
+        walked, dirs, errors = walk_tree(root, is_included, prev_map, prune)
+    PHASES.count('files_stated', len(walked))
+    for rel, err in errors:
+        if rel and is_included(rel):
+            files.append({'abs_path': str(root / rel), 'rel_path': rel, 'error': err})
+            changed_paths.append(rel)
+    for rel, size, mtime_ns, prev in walked:
+        if prev is None:
+            prev = prev_map.get(rel)
+        if not fingerprint_current(prev, size, mtime_ns):
+            to_hash.append(rel)
+        stat_map[rel] = (root / rel, size, mtime_ns, prev)
+    PHASES.count('cache_hits', len(stat_map) - len(to_hash))
+    with PHASES.phase('hash'):
+        sha_map = hash_with_reuse({rel: stat_map[rel][:2] for rel in to_hash}, max_workers, scheduler, content_index)
+    changed_paths.extend(to_hash)
+    reported = set(changed_paths)
+    prev_members: dict[str, list[dict]] = {}
+    for rel in prev_map.keys():
+        if rel in stat_map or rel in reported:
             continue
-        try:
-            st = p.stat()
-            stat_map[rel] = (p, st.st_size, st.st_mtime)
+        if ARCHIVE_SEP in rel:
             prev = prev_map.get(rel)
-            if not (prev and prev.get('size') == st.st_size and prev.get('mtime') == st.st_mtime):
-                to_hash.append(rel)
-        except Exception as e:
-            files.append({'abs_path': str(p), 'rel_path': rel, 'error': str(e)})
-            changed_paths.append(rel)
-    sha_map = {}
-    if to_hash:
-        workers = max(1, min(max_workers, len(to_hash)))
-        with ProcessPoolExecutor(max_workers=workers) as pool:
-            future_to_rel = {pool.submit(sha256_file, stat_map[rel][0]): rel for rel in to_hash}
-            for fut in as_completed(future_to_rel):
-                rel = future_to_rel[fut]
-                try:
-                    sha_map[rel] = fut.result()
-                except Exception:
-                    sha_map[rel] = ''
-                changed_paths.append(rel)
-    for rel, (p, size, mtime) in stat_map.items():
-        prev = prev_map.get(rel)
+            if prev and 'crc32' in prev:
+                prev_members.setdefault(split_member(rel)[0], []).append(prev)
+                continue
+        changed_paths.append(rel)
+    archives = []
+    for rel, (p, size, mtime_ns, prev) in stat_map.items():
         sha = sha_map.get(rel) if rel in sha_map else (prev.get('sha256') if prev else '')
-        files.append({
-            'abs_path': str(p),
-            'rel_path': rel,
-            'size': size,
-            'mtime': mtime,
-            'sha256': sha,
-        })
-    return files, changed_paths
-
-
-def collect_from_changes_only(root: Path, prev_map: dict, changes: list[str], max_workers: int, is_included):
-    files_map: dict[str, dict] = {k: dict(v) for k, v in prev_map.items() if is_included(k)}
+        files.append(make_entry(p, rel, size, mtime_ns, sha))
+        if archives_enabled() and is_archive(rel):
+            archives.append(files[-1])
+    if archives or prev_members:
+        with PHASES.phase('archives'):
+            files.extend(collect_archive_members(archives, prev_members, set(to_hash), changed_paths, max_workers,
+                                                 is_included, scheduler))
+        files.sort(key=lambda f: f['rel_path'])
+    return files, changed_paths, dirs
+
+
+def collect_archive_members(archives: list, prev_members: dict, changed: set, changed_paths: list, max_workers: int,
+                            is_included, scheduler=None) -> list:
+    """Member entries of the .zip entries in `archives` (KN_ARCHIVES=1).
+
+    `prev_members` maps each archive to its member entries from the last build.  An
+    archive not in `changed` keeps them as they are; a changed one has its central
+    directory re-read, reusing the digest of members with the same CRC-32 and size,
+    and hashing the rest in the pool.  Member keys go through `is_included` like any
+    other path.  Members that disappeared or are now excluded (including those of
+    archives no longer present) are added to `changed_paths`.
+    """
+    members = []
+    tasks: dict[str, list] = {}
+    for a in archives:
+        rel = a['rel_path']
+        old = {m['rel_path']: m for m in prev_members.pop(rel, [])}
+        if rel not in changed and old:
+            for mrel, m in old.items():
+                if is_included(mrel):
+                    members.append(m)
+                else:
+                    changed_paths.append(mrel)
+            continue
+        try:
+            listing = list_members(Path(a['abs_path']))
+        except Exception:
+            listing = []
+        seen = set()
+        for name, size, crc, mtime_ns in listing:
+            mrel = member_rel(rel, name)
+            if not is_included(mrel):
+                continue
+            seen.add(mrel)
+            prev = old.get(mrel)
+            if prev and prev.get('crc32') == crc and prev.get('size') == size and prev.get('sha256'):
+                PHASES.count('cache_hits')
+                entry = member_entry(a['abs_path'], mrel, size, mtime_ns, crc, prev['sha256'])
+                if prev.get('mtime_ns') != mtime_ns:
+                    changed_paths.append(mrel)
+            else:
+                entry = member_entry(a['abs_path'], mrel, size, mtime_ns, crc, '')
+                tasks.setdefault(a['abs_path'], []).append((mrel, name, size))
+                changed_paths.append(mrel)
+            members.append(entry)
+        changed_paths.extend(m for m in old if m not in seen)
+    for old in prev_members.values():
+        changed_paths.extend(m['rel_path'] for m in old)
+    if tasks:
+        total = sum(size for items in tasks.values() for _, _, size in items)
+        PHASES.count('files_hashed', sum(len(items) for items in tasks.values()))
+        PHASES.count('bytes_hashed', total)
+        if scheduler is None:
+            with HashScheduler(max_workers) as own:
+                sha_map = own.hash_members(tasks)
+        else:
+            sha_map = scheduler.hash_members(tasks)
+        for m in members:
+            if m['rel_path'] in sha_map:
+                m['sha256'] = sha_map[m['rel_path']]
+    return members
+
+
+def expand_dir_changes(root: Path, files_map: dict, changes: list[str]) -> list[str]:
+    expanded: list[str] = []
+    for rel in changes:
+        p = root / rel
+        if p.is_dir():
+            expanded.extend(str(f.relative_to(root)) for f in list_files(p))
+            continue
+        if not p.exists() and rel not in files_map:
+            prefix = rel.rstrip('/') + '/'
+            expanded.extend(k for k in files_map if k.startswith(prefix))
+            continue
+        expanded.append(rel)
+    return expanded
+
+
+def apply_move(root: Path, files_map: dict, src: str, dst: str) -> list[tuple[str, str]]:
+    """Re-key the entries at or under `src` to `dst`, keeping their digests; returns (old, new) pairs."""
+    if src in files_map:
+        pairs = [(src, dst)]
+    else:
+        prefix = src.rstrip('/') + '/'
+        base = dst.rstrip('/') + '/'
+        pairs = [(k, base + k[len(prefix):]) for k in files_map if k.startswith(prefix)]
+    root_prefix = os.path.join(str(root), '')
+    for old, new in pairs:
+        entry = dict(files_map.pop(old))
+        entry['rel_path'] = new
+        entry['abs_path'] = root_prefix + new
+        files_map[new] = entry
+    return pairs
+
+
+def remap_path(rel: str, src: str, dst: str) -> str:
+    if rel == src:
+        return dst
+    prefix = src.rstrip('/') + '/'
+    return dst.rstrip('/') + '/' + rel[len(prefix):] if rel.startswith(prefix) else rel
+
+
+class ChangeOverlay:
+    """{rel: entry} view of the previous build's map (a FingerprintCache or a dict, never
+    modified) with the entries a batch of changes touched layered on top.
+
+    Only touched entries are stored here; the rest are looked up in, or streamed from,
+    the base when the file list is assembled.
+    """
+
+    def __init__(self, base, is_included):
+        self.base = base
+        self.is_included = is_included
+        self.trivial = getattr(is_included, 'trivial', False)
+        self.touched: dict[str, dict | None] = {}   # None marks a removed entry
+
+    def _visible(self, rel: str) -> bool:
+        return self.trivial or self.is_included(rel)
+
+    def get(self, rel: str, default=None):
+        if rel in self.touched:
+            entry = self.touched[rel]
+        else:
+            entry = self.base.get(rel) if self._visible(rel) else None
+        return default if entry is None else entry
+
+    def __contains__(self, rel) -> bool:
+        return self.get(rel) is not None
+
+    def __getitem__(self, rel: str) -> dict:
+        entry = self.get(rel)
+        if entry is None:
+            raise KeyError(rel)
+        return entry
+
+    def __setitem__(self, rel: str, entry: dict) -> None:
+        self.touched[rel] = entry
+
+    def pop(self, rel: str, default=None):
+        entry = self.get(rel)
+        if entry is None:
+            return default
+        self.touched[rel] = None
+        return entry
+
+    def __iter__(self):
+        return self.keys()
+
+    def keys(self):
+        for rel in self.base.keys():
+            if rel not in self.touched and self._visible(rel):
+                yield rel
+        yield from (rel for rel, entry in self.touched.items() if entry is not None)
+
+    def values(self):
+        for rel, entry in self.base.items():
+            if rel not in self.touched and self._visible(rel):
+                yield entry
+        yield from (entry for entry in self.touched.values() if entry is not None)
+
+
+def collect_from_changes_only(root: Path, prev_map: dict, changes: list, max_workers: int, is_included, scheduler=None,
+                              content_index: ContentIndex | None = None):
+    """`changes` holds changed paths and (src, dst) moves, in event order.
+
+    Work is proportional to the changes: untouched entries are not copied, only passed
+    through from `prev_map` into the returned list.
+    """
+    files_map = ChangeOverlay(prev_map, is_included)
     need_hash: list[str] = []
     changed_paths: list[str] = []
-    for rel in changes:
+    moved: list[tuple[str, str]] = []
+    pending: dict[str, None] = {}
+    for change in changes:
+        if not isinstance(change, tuple):
+            pending[change] = None
+            continue
+        src, dst = change
+        pairs = apply_move(root, files_map, src, dst)
+        if not pairs:
+            # Moved in from an excluded/unknown location: a plain delete + create
+            pending[src] = None
+            pending[dst] = None
+            continue
+        # Earlier events under src now refer to the new location
+        pending = {remap_path(rel, src, dst): None for rel in pending}
+        moved.extend(pairs)
+        for old, new in pairs:
+            changed_paths.append(old)
+            changed_paths.append(new)
+            if not is_included(new):
+                files_map.pop(new, None)
+        if pairs == [(src, dst)]:
+            pending[dst] = None     # single file: confirm size/mtime with one stat
+    with PHASES.phase('stat'):
+        stat_changes(root, files_map, pending, is_included, need_hash, changed_paths)
+    with PHASES.phase('hash'):
+        sha_map = hash_with_reuse({rel: (root / rel, files_map[rel]['size']) for rel in need_hash}, max_workers, scheduler,
+                                  content_index)
+    for rel, sha in sha_map.items():
+        if rel in files_map:
+            files_map[rel]['sha256'] = sha
+    # Only archives these changes touched have their members revisited
+    touched_archives = {rel for rel in changed_paths if is_archive(rel)}
+    prev_members: dict[str, list[dict]] = {}
+    archives = []
+    if touched_archives:
+        for rel in [k for k in files_map if ARCHIVE_SEP in k]:
+            entry = files_map.get(rel)
+            if entry is not None and 'crc32' in entry and split_member(rel)[0] in touched_archives:
+                prev_members.setdefault(split_member(rel)[0], []).append(files_map.pop(rel))
+        for rel in sorted(touched_archives):
+            entry = files_map.get(rel)
+            if archives_enabled() and entry is not None and 'error' not in entry:
+                archives.append(entry)
+    if archives or prev_members:
+        with PHASES.phase('archives'):
+            for m in collect_archive_members(archives, prev_members, set(need_hash), changed_paths, max_workers,
+                                             is_included, scheduler):
+                files_map[m['rel_path']] = m
+    files_list = list(files_map.values())
+    files_list.sort(key=lambda x: x.get('rel_path', ''))
+    return files_list, list(dict.fromkeys(changed_paths)), moved
+
+
+def stat_changes(root: Path, files_map: dict, pending: dict, is_included, need_hash: list, changed_paths: list) -> None:
+    """Stat the changed paths (directories expanded) into files_map, queueing new content for hashing."""
+    for rel in expand_dir_changes(root, files_map, list(pending)):
+        PHASES.count('files_stated')
         if not is_included(rel):
             files_map.pop(rel, None)
             continue
@@ -126,16 +790,12 @@ def collect_from_changes_only(root: Path, prev_map: dict, changes: list[str], ma
         if p.exists() and p.is_file():
             try:
                 st = p.stat()
-                prev = prev_map.get(rel)
-                if not (prev and prev.get('size') == st.st_size and prev.get('mtime') == st.st_mtime):
+                prev = files_map.get(rel)
+                if not fingerprint_current(prev, st.st_size, st.st_mtime_ns):
                     need_hash.append(rel)
-                files_map[rel] = {
-                    'abs_path': str(p),
-                    'rel_path': rel,
-                    'size': st.st_size,
-                    'mtime': st.st_mtime,
-                    'sha256': prev.get('sha256') if prev else ''
-                }
+                else:
+                    PHASES.count('cache_hits')
+                files_map[rel] = make_entry(p, rel, st.st_size, st.st_mtime_ns, prev.get('sha256', '') if prev else '')
                 changed_paths.append(rel)
             except Exception as e:
                 files_map[rel] = {
@@ -148,21 +808,83 @@ def collect_from_changes_only(root: Path, prev_map: dict, changes: list[str], ma
             if rel in files_map:
                 files_map.pop(rel, None)
                 changed_paths.append(rel)
-    if need_hash:
-        workers = max(1, min(max_workers, len(need_hash)))
-        with ProcessPoolExecutor(max_workers=workers) as pool:
-            future_to_rel = {pool.submit(sha256_file, (root / rel)): rel for rel in need_hash}
-            for fut in as_completed(future_to_rel):
-                rel = future_to_rel[fut]
-                try:
-                    sha = fut.result()
-                except Exception:
-                    sha = ''
-                if rel in files_map:
-                    files_map[rel]['sha256'] = sha
-    files_list = list(files_map.values())
-    files_list.sort(key=lambda x: x.get('rel_path', ''))
-    return files_list, changed_paths
+
+
+def update_content_index(content_index: ContentIndex, prev_map, files_meta: list, changed_paths: list,
+                         moved: list | None = None) -> None:
+    if not content_index.loaded or not prev_map:
+        content_index.rebuild(TRAN_ROOT, files_meta)
+        return
+    current = {f['rel_path']: f for f in files_meta if 'rel_path' in f}
+    skip = set()
+    for old, new in moved or ():
+        cur = current.get(new)
+        if cur and cur.get('sha256') and content_index.move(old, new, cur['sha256']):
+            skip.add(old)
+            skip.add(new)
+    for rel in changed_paths:
+        if rel in skip:
+            continue
+        prev = prev_map.get(rel)
+        cur = current.get(rel)
+        old_sha = prev.get('sha256') if prev else ''
+        new_sha = cur.get('sha256') if cur and 'error' not in cur else ''
+        if old_sha == new_sha:
+            continue
+        if old_sha:
+            content_index.remove(rel, old_sha)
+        if new_sha:
+            content_index.add(rel, new_sha, cur['size'], cur.get('mtime_ns'))
+
+
+def update_text_index(files_meta: list, changed_paths: list) -> bool:
+    """Re-tokenize changed text files into the full-text index (KN_FTS=0 disables it)."""
+    if os.getenv('KN_FTS', '1') == '0' or (not changed_paths and load_manifest(TEXT_INDEX_DIR) is not None):
+        return False
+    text_index = TextIndex.load(TEXT_INDEX_DIR)
+    current = {f['rel_path']: f for f in files_meta if 'rel_path' in f}
+    if not text_index.loaded:
+        text_index.reset()
+        changed_paths = list(current)
+    for rel in changed_paths:
+        cur = current.get(rel)
+        sha = cur.get('sha256', '') if cur and 'error' not in cur and indexable(rel, cur['size']) else ''
+        if sha == text_index.sha(rel):
+            continue
+        text_index.remove(rel)
+        if sha:
+            text_index.add(rel, sha, read_member_text(cur) if 'crc32' in cur else read_text(TRAN_ROOT / rel))
+    return text_index.commit()
+
+
+def read_member_text(entry: dict) -> str:
+    archive, name = split_member(entry['rel_path'])
+    try:
+        return read_member(TRAN_ROOT / archive, name).decode('utf-8', errors='replace')
+    except Exception as e:
+        return f"<ERROR reading {entry['abs_path']}: {e}>"
+
+
+def journal_delta(prev_map, files_meta: list, changed_paths: list, moved: list | None = None) -> dict | None:
+    """Per-run delta for the change journal; None when there is no previous state to diff against."""
+    if not isinstance(prev_map, FingerprintCache) and not prev_map:
+        return None
+    if not changed_paths:
+        return {}
+    current = {f['rel_path']: f for f in files_meta if 'rel_path' in f}
+    return run_delta(prev_map, current, changed_paths, moved)
+
+
+def record_journal(now: str, mode: str, delta: dict | None, files_count: int) -> None:
+    """Append the run to me/journal/ (KN_JOURNAL=0 disables it)."""
+    if os.getenv('KN_JOURNAL', '1') == '0':
+        return
+    try:
+        seq = Journal(JOURNAL_DIR).append(now, mode, delta, files_count)
+        if seq:
+            PHASES.count('journal_seq', seq)
+    except Exception:
+        pass
 
 
 def fmt_bytes(n: int) -> str:
@@ -176,105 +898,186 @@ def fmt_bytes(n: int) -> str:
     return f"{size*step:.1f} TB"
 
 
-def generate_index_md(root: Path, files_meta: list) -> str:
-    lines = []
-    lines.append("### فهرس الملفات في tran")
-    lines.append("| المسار | الحجم | آخر تعديل | SHA256 |")
-    lines.append("|---|---:|---:|---|")
-    for f in files_meta:
-        rel = f.get('rel_path', '')
-        if 'error' in f:
-            lines.append(f"| {rel} | - | - | ERROR: {f['error']} |")
-        else:
-            size = fmt_bytes(f['size'])
-            mtime = datetime.fromtimestamp(f['mtime'], UTC).strftime('%Y-%m-%d %H:%M:%S UTC')
-            sha = f['sha256'][:16]
-            lines.append(f"| {rel} | {size} | {mtime} | {sha}… |")
+INDEX_HEADER = [
+    "### فهرس الملفات في tran",
+    "| المسار | الحجم | آخر تعديل | SHA256 |",
+    "|---|---:|---:|---|",
+]
+
+
+def index_row(f: dict) -> str:
+    rel = f.get('rel_path', '')
+    if 'error' in f:
+        return f"| {rel} | - | - | ERROR: {f['error']} |"
+    size = fmt_bytes(f['size'])
+    mtime = datetime.fromtimestamp(f['mtime'], UTC).strftime('%Y-%m-%d %H:%M:%S UTC')
+    sha = f['sha256'][:16]
+    return f"| {rel} | {size} | {mtime} | {sha}… |"
+
+
+def load_index_rows(path: Path, digest: str) -> dict | None:
+    """Rows of the previous INDEX.md by path, if the file is still the one we wrote."""
+    try:
+        data = path.read_bytes()
+    except OSError:
+        return None
+    if not digest or hashlib.sha256(data).hexdigest() != digest:
+        return None
+    rows = {}
+    for line in data.decode('utf-8', 'surrogateescape').split('\n')[len(INDEX_HEADER):]:
+        end = line.find(' | ', 2)
+        if end > 0:
+            rows[line[2:end]] = line
+    return rows
+
+
+def generate_index_md(root: Path, files_meta: list, changed=None, prev_rows: dict | None = None) -> str:
+    """With `prev_rows` from the previous INDEX.md, only rows for paths in `changed` are re-rendered."""
+    lines = list(INDEX_HEADER)
+    if prev_rows is None:
+        lines.extend(index_row(f) for f in files_meta)
+    else:
+        changed = set(changed or ())
+        for f in files_meta:
+            rel = f.get('rel_path', '')
+            row = None if rel in changed else prev_rows.get(rel)
+            lines.append(row if row is not None else index_row(f))
     return "\n".join(lines) + "\n"
 
 
-def summarize_openapi(p: Path) -> dict:
+def _openapi_info(p: Path, rel: str, specs: dict | None) -> dict:
     info = {"path": str(p), "exists": p.exists()}
-    if not p.exists():
-        return info
-    text = read_text(p)
-    title = None
-    version = None
-    paths_count = text.count("\n  /") + text.count("\n/")
-    for line in text.splitlines():
-        ls = line.strip()
-        if ls.startswith('title:') and title is None:
-            title = ls.split(':', 1)[1].strip()
-        if ls.startswith('version:') and version is None:
-            version = ls.split(':', 1)[1].strip()
-    info.update({"title": title, "version": version, "paths_approx": paths_count})
+    spec = specs.get(rel) if specs is not None else None
+    if spec is None and p.exists():
+        try:
+            spec = index_openapi(p)
+        except Exception as e:
+            spec = {'error': str(e)}
+    if spec:
+        info.update(spec)
+        info['operations'] = len(spec.get('operations', []))
     return info
 
 
-def summarize_csv(p: Path) -> dict:
+def update_derived_index(path: Path, key: str, files_meta: list, batch: OutputBatch, match, build, fresh=None) -> dict:
+    """Maintain {rel: derived info} for matching files in `path`, rebuilding an entry only
+    when its sha256 changed (or `fresh(entry, file)` rejects it)."""
+    try:
+        prev = json.loads(path.read_text()).get(key, {})
+    except Exception:
+        prev = {}
+    by_sha = {p['sha256']: p for p in prev.values() if p.get('sha256')}
+    out = {}
+    for f in files_meta:
+        rel = f.get('rel_path', '')
+        if not f.get('sha256') or 'crc32' in f or not match(rel):
+            continue
+        entry = by_sha.get(f['sha256'])
+        if entry is None or (fresh is not None and not fresh(entry, f)):
+            try:
+                entry = {'sha256': f['sha256'], **build(TRAN_ROOT / rel)}
+            except Exception as e:
+                entry = {'sha256': f['sha256'], 'error': str(e)}
+        out[rel] = entry
+    if out != prev or not path.exists():
+        batch.add_text(path, json.dumps({key: out}, ensure_ascii=False, indent=2))
+    return out
+
+
+def update_dataset_profiles(files_meta: list, batch: OutputBatch) -> dict:
+    """Profile the CSVs under tran/datasets/ (me/datasets.json)."""
+    return update_derived_index(DATASETS_FILE, 'datasets', files_meta, batch,
+                                lambda rel: rel.startswith(DATASETS_PREFIX) and rel.lower().endswith('.csv'),
+                                profile_csv, lambda prof, f: prof.get('stats') == want_stats(f['size']))
+
+
+def update_openapi_index(files_meta: list, batch: OutputBatch) -> dict:
+    """Index the OpenAPI specs under tran/api/ (me/openapi_index.json)."""
+    return update_derived_index(OPENAPI_INDEX_FILE, 'specs', files_meta, batch,
+                                lambda rel: rel.startswith(API_PREFIX) and rel.lower().endswith(('.yaml', '.yml', '.json')),
+                                index_openapi)
+
+
+def _dataset_info(p: Path, rel: str, datasets: dict | None) -> dict:
     info = {"path": str(p), "exists": p.exists()}
+    prof = datasets.get(rel) if datasets is not None else None
+    if prof is None and p.exists():
+        try:
+            prof = profile_csv(p)
+        except Exception as e:
+            prof = {'error': str(e)}
+    if prof:
+        info.update(prof)
+        if 'header' in prof:
+            info['header'] = ','.join(prof['header'])
+    return info
+
+
+def _text_section(title: str, p: Path) -> list[str]:
     if not p.exists():
-        return info
+        return []
+    return [title, "```", read_text(p)[:2000], "```"]
+
+
+def _table_section(title: str, info: dict, keys: list[str]) -> list[str]:
+    return [title, "| الحقل | القيمة |", "|---|---|"] + [f"| {k} | {info.get(k)} |" for k in keys]
+
+
+def _dir_section(title: str, d: Path) -> list[str]:
+    if not d.exists():
+        return []
+    return [title] + [f"- {p.name} ({fmt_bytes(p.stat().st_size)})" for p in sorted(d.glob('*')) if p.is_file()]
+
+
+def _version_section(p: Path) -> list[str]:
+    if not p.exists():
+        return []
     try:
-        with p.open('r', encoding='utf-8', errors='replace') as f:
-            lines = f.readlines()
-        header = lines[0].strip() if lines else ''
-        rows = max(0, len(lines) - 1)
-        cols = header.count(',') + 1 if header else 0
-        info.update({"rows": rows, "columns": cols, "header": header})
-    except Exception as e:
-        info.update({"error": str(e)})
-    return info
+        obj = json.loads(read_text(p))
+        return ["#### version.json", "```", json.dumps(obj, ensure_ascii=False, indent=2)[:2000], "```"]
+    except Exception:
+        return ["#### version.json", "```", read_text(p)[:2000], "```"]
 
 
-def generate_summary_md(root: Path) -> str:
-    parts = []
-    parts.append("### خلاصة المعرفة المستخلصة من tran")
-    readme = root / 'tran' / 'README.md'
-    if readme.exists():
-        parts.append("#### README")
-        txt = read_text(readme)
-        parts.append("```")
-        parts.append(txt[:2000])
-        parts.append("```")
-    info_dir = root / 'tran' / 'info'
-    if info_dir.exists():
-        for name in ['KNOWLEDGE_INDEX.md', 'ROOT_STRUCTURE.md']:
-            p = info_dir / name
-            if p.exists():
-                parts.append(f"#### info/{name}")
-                parts.append("```")
-                parts.append(read_text(p)[:2000])
-                parts.append("```")
-    kb_dir = root / 'tran' / 'kb'
-    if kb_dir.exists():
-        for name in ['CHANGELOG.md', 'all_knowledge.md']:
-            p = kb_dir / name
-            if p.exists():
-                parts.append(f"#### kb/{name}")
-                parts.append("```")
-                parts.append(read_text(p)[:2000])
-                parts.append("```")
-    api_yaml = root / 'tran' / 'api' / 'openapi.yaml'
-    api_info = summarize_openapi(api_yaml)
-    parts.append("#### API (openapi.yaml)")
-    parts.append("| الحقل | القيمة |")
-    parts.append("|---|---|")
-    for k in ['title', 'version', 'paths_approx']:
-        parts.append(f"| {k} | {api_info.get(k)} |")
-    ds_csv = root / 'tran' / 'datasets' / 'sample_posts.csv'
-    ds_info = summarize_csv(ds_csv)
-    parts.append("#### datasets/sample_posts.csv")
-    parts.append("| الحقل | القيمة |")
-    parts.append("|---|---|")
-    for k in ['rows', 'columns', 'header']:
-        parts.append(f"| {k} | {ds_info.get(k)} |")
-    ci_file = root / 'tran' / 'ci' / 'github-actions.yml'
-    if ci_file.exists():
-        parts.append("#### CI/github-actions.yml")
-        parts.append("```")
-        parts.append(read_text(ci_file)[:2000])
-        parts.append("```")
+def _duplicates_section(content_index: ContentIndex | None) -> list[str]:
+    if content_index is None:
+        return []
+    dupes = content_index.duplicates()
+    lines = _table_section("#### المحتوى المكرر", {
+        'groups': len(dupes),
+        'redundant_copies': sum(len(paths) - 1 for _, _, paths in dupes),
+        'duplicate_bytes': fmt_bytes(content_index.duplicate_bytes()),
+    }, ['groups', 'redundant_copies', 'duplicate_bytes'])
+    for digest, size, paths in dupes[:10]:
+        lines.append(f"- {digest[:16]}… ({fmt_bytes(size)} × {len(paths)}): " + ", ".join(sorted(paths)[:5]))
+    return lines
+
+
+def summary_sections(root: Path, content_index: ContentIndex | None = None, datasets: dict | None = None,
+                     specs: dict | None = None) -> list:
+    """(id, sources, render) for each SUMMARY.md section, in order.
+
+    Sources are paths relative to `root`; one ending in '/' covers everything under
+    that directory, and None means the section is re-rendered on every build.
+    """
+    t = root / 'tran'
+    sections = [
+        ('title', (), lambda: ["### خلاصة المعرفة المستخلصة من tran"]),
+        ('readme', ('tran/README.md',), lambda: _text_section("#### README", t / 'README.md')),
+    ]
+    for sub, names in [('info', ['KNOWLEDGE_INDEX.md', 'ROOT_STRUCTURE.md']), ('kb', ['CHANGELOG.md', 'all_knowledge.md'])]:
+        for name in names:
+            sections.append((f'{sub}/{name}', (f'tran/{sub}/{name}',),
+                             lambda sub=sub, name=name: _text_section(f"#### {sub}/{name}", t / sub / name)))
+    sections += [
+        ('api', ('tran/api/openapi.yaml',), lambda: _table_section(
+            "#### API (openapi.yaml)", _openapi_info(t / 'api' / 'openapi.yaml', 'tran/api/openapi.yaml', specs),
+            ['title', 'version', 'paths', 'operations'])),
+        ('dataset', ('tran/datasets/sample_posts.csv',), lambda: _table_section(
+            "#### datasets/sample_posts.csv", _dataset_info(t / 'datasets' / 'sample_posts.csv', 'tran/datasets/sample_posts.csv', datasets),
+            ['rows', 'columns', 'header'])),
+        ('ci', ('tran/ci/github-actions.yml',), lambda: _text_section("#### CI/github-actions.yml", t / 'ci' / 'github-actions.yml')),
+    ]
     for sub, title in [
         ('models', 'Models'),
         ('proj', 'Projects'),
@@ -284,155 +1087,550 @@ def generate_summary_md(root: Path) -> str:
         ('legacy', 'Legacy'),
         ('assets', 'Assets'),
     ]:
-        d = root / 'tran' / sub
-        if d.exists():
-            parts.append(f"#### {title} ({sub}/)")
-            for p in sorted(d.glob('*')):
-                if p.is_file():
-                    parts.append(f"- {p.name} ({fmt_bytes(p.stat().st_size)})")
-    version_json = root / 'tran' / 'version.json'
-    if version_json.exists():
-        parts.append("#### version.json")
-        try:
-            obj = json.loads(read_text(version_json))
-            parts.append("```")
-            parts.append(json.dumps(obj, ensure_ascii=False, indent=2)[:2000])
-            parts.append("```")
-        except Exception:
-            parts.append("```")
-            parts.append(read_text(version_json)[:2000])
-            parts.append("```")
-    return "\n".join(parts) + "\n"
+        sections.append((f'dir/{sub}', (f'tran/{sub}/',), lambda sub=sub, title=title: _dir_section(f"#### {title} ({sub}/)", t / sub)))
+    sections += [
+        ('version', ('tran/version.json',), lambda: _version_section(t / 'version.json')),
+        ('duplicates', None, lambda: _duplicates_section(content_index)),
+    ]
+    return sections
+
+
+def _sources_touched(sources, changed: set) -> bool:
+    for src in sources:
+        if src.endswith('/'):
+            if any(c.startswith(src) for c in changed):
+                return True
+        elif src in changed:
+            return True
+    return False
+
+
+def _sources_tracked(sources, is_included) -> bool:
+    # Sources hidden by KN_INCLUDE/KN_IGNORE never show up in changed_paths
+    if is_included is None or getattr(is_included, 'trivial', False):
+        return True
+    return all(not src.endswith('/') and is_included(src) for src in sources)
+
+
+def generate_summary_md(root: Path, content_index: ContentIndex | None = None, changed=None,
+                        fragments: dict | None = None, is_included=None, datasets: dict | None = None,
+                        specs: dict | None = None) -> tuple[str, dict]:
+    """Render SUMMARY.md; returns (text, fragments).
 
+    With the previous build's `fragments` (section id -> lines), only sections whose
+    sources appear in `changed` are re-rendered.
+    """
+    changed_set = set(changed or ())
+    parts = []
+    rendered = {}
+    for sid, sources, render in summary_sections(root, content_index, datasets, specs):
+        reuse = fragments is not None and sid in fragments and sources is not None \
+            and _sources_tracked(sources, is_included) and not _sources_touched(sources, changed_set)
+        lines = fragments[sid] if reuse else render()
+        rendered[sid] = lines
+        parts.extend(lines)
+    return "\n".join(parts) + "\n", rendered
+
+
+def files_digest(files_meta: list) -> str:
+    """Digest of everything knowledge.json / INDEX.md render from the file entries."""
+    h = hashlib.sha256()
+    for f in files_meta:
+        h.update(repr((f.get('rel_path'), f.get('size'), f.get('mtime_ns', f.get('mtime')), f.get('sha256'),
+                       f.get('hash_mode'), f.get('error'))).encode('utf-8', 'surrogateescape'))
+    return h.hexdigest()
+
+
+def state_digest(*parts) -> str:
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(str(part).encode('utf-8', 'surrogateescape') + b'\0')
+    return h.hexdigest()
 
-def write_if_changed(path: Path, content: str) -> bool:
+
+def stored_digests(prev_map) -> dict:
+    """Output digests recorded in the fingerprint cache by the previous build."""
+    cache = prev_map if isinstance(prev_map, FingerprintCache) else FingerprintCache(CACHE_FILE, TRAN_ROOT)
     try:
-        if path.exists() and path.read_text(encoding='utf-8', errors='replace') == content:
-            return False
+        return {k: cache.meta(k) for k in ('knowledge', 'index', 'index_src', 'summary', 'cache')} if cache.valid else {}
+    finally:
+        if cache is not prev_map:
+            cache.close()
+
+
+def load_summary_fragments() -> dict | None:
+    try:
+        obj = json.loads(SUMMARY_FRAGMENTS_FILE.read_text())
+        if obj.get('version') != SUMMARY_VERSION or obj.get('filters') != filters_digest():
+            return None
+        return obj['fragments']
     except Exception:
-        pass
-    path.write_text(content)
+        return None
+
+
+def stage_output(batch: OutputBatch, path: Path, content: str, key: str, stored: dict, digests: dict) -> bool:
+    digests[key] = hashlib.sha256(content.encode('utf-8', 'surrogateescape')).hexdigest()
+    if digests[key] == stored.get(key) and path.exists():
+        return False
+    batch.add_text(path, content)
     return True
 
 
-def read_changes_from_env(root: Path):
+def dedupe_changes(changes: list) -> list:
+    # A path repeated on both sides of a move names two different files, so only dedupe between moves
+    out, seen = [], set()
+    for c in changes:
+        if isinstance(c, tuple):
+            out.append(c)
+            seen = set()
+        elif c not in seen:
+            seen.add(c)
+            out.append(c)
+    return out
+
+
+def events_to_changes(events) -> list:
+    """(event names, cookie, rel) in order -> changed paths and (src, dst) moves.
+
+    MOVED_FROM/MOVED_TO pair up by cookie, or by adjacency when the producer has no
+    cookies (cookie 0).  An unpaired half is a delete or a create.
+    """
+    changes = []
+    moved_from: dict[int, int] = {}
+    last_from = None
+    for names, cookie, rel in events:
+        if 'MOVED_TO' in names and (cookie in moved_from or (not cookie and last_from is not None)):
+            i = moved_from.pop(cookie) if cookie else last_from
+            changes[i] = (changes[i], rel)
+            last_from = None
+            continue
+        last_from = None
+        if 'MOVED_FROM' in names:
+            if cookie:
+                moved_from[cookie] = len(changes)
+            else:
+                last_from = len(changes)
+        changes.append(rel)
+    return dedupe_changes(changes)
+
+
+def parse_change_line(line: str, root: Path):
+    """`EVENTS<TAB>COOKIE<TAB>PATH`, `EVENTS<TAB>PATH` or a bare path -> (names, cookie, rel)."""
+    names, cookie, path = (), 0, line.strip()
+    fields = line.rstrip('\r\n').split('\t')
+    if len(fields) in (2, 3):
+        names = set(fields[0].split(','))
+        path = fields[-1]
+        try:
+            cookie = int(fields[1]) if len(fields) == 3 else 0
+        except ValueError:
+            cookie = 0
+    try:
+        rel = str(Path(path).resolve().relative_to(root.resolve())) if path.startswith('/') else path
+    except Exception:
+        rel = path
+    return names, cookie, rel
+
+
+def read_changes_from_env(root: Path) -> list | None:
+    """Changes handed over by the watcher; None asks for a full scan (queue overflow)."""
     changed_env = os.getenv('KN_CHANGED_PATHS', '').strip()
     changed_file = os.getenv('KN_CHANGED_FILE', '').strip()
-    changes: list[str] = []
+    events = []
     if changed_file:
         p = Path(changed_file)
         if p.exists():
             try:
-                lines = [ln.strip() for ln in p.read_text().splitlines() if ln.strip()]
-                for ln in lines:
-                    try:
-                        rel = str(Path(ln).resolve().relative_to(root.resolve())) if ln.startswith('/') else ln
-                    except Exception:
-                        rel = ln
-                    changes.append(rel)
+                events.extend(parse_change_line(ln, root) for ln in p.read_text().splitlines() if ln.strip())
             except Exception:
                 pass
     if changed_env:
         for part in changed_env.split(','):
             s = part.strip()
             if s:
-                changes.append(s)
-    seen = set()
-    uniq = []
-    for c in changes:
-        if c not in seen:
-            uniq.append(c)
-            seen.add(c)
-    return uniq
+                events.append(((), 0, s))
+    if any('Q_OVERFLOW' in names for names, _, _ in events):
+        return None
+    changes = events_to_changes(events)
+    return changes if len(changes) <= QUEUE_MAX else None
 
 
-def snapshot_daily(outputs: list[Path], now_dt: datetime) -> None:
-    day = now_dt.strftime('%Y%m%d')
-    target = SNAPSHOTS_DIR / day
-    target.mkdir(parents=True, exist_ok=True)
-    for p in outputs:
-        try:
-            dest = target / p.name
-            if not dest.exists():
-                dest.write_text(p.read_text(encoding='utf-8', errors='replace'))
-        except Exception:
-            pass
+def snapshot_outputs(outputs: list[Path], now_dt: datetime) -> dict | None:
+    """Deduplicated snapshot of the outputs, at most one per KN_SNAPSHOT_INTERVAL_S period."""
+    store = SnapshotStore(SNAPSHOTS_DIR)
+    try:
+        if not store.due(now_dt):
+            return None
+        snap = store.take(outputs, now_dt)
+        store.prune()
+        return snap
+    except Exception:
+        return None
 
 
-def append_metrics(now: str, files_count: int, changed_count: int, duration_s: float, writes: dict):
+def append_metrics(now: str, files_count: int, changed_count: int, duration_s: float, writes: dict, summary: bool = True,
+                   phases: dict | None = None):
     entry = {
         'ts_utc': now,
         'files': files_count,
         'changed': changed_count,
         'duration_s': round(duration_s, 6),
         'writes': writes,
+        **(phases or {}),
     }
     try:
         with METRICS_JSONL.open('a') as f:
             f.write(json.dumps(entry) + '\n')
     except Exception:
         pass
+    global ROLLUP
+    try:
+        # The state file is only rewritten when a slot rolls over or the log is compacted;
+        # otherwise the next load replays this entry from metrics.jsonl
+        if ROLLUP is None:
+            ROLLUP = MetricsRollup.load(METRICS_STATE_FILE, METRICS_JSONL)
+        else:
+            ROLLUP.catch_up()
+        compacted = compact_log(METRICS_JSONL, METRICS_ROLLUP_DIR)
+        if compacted:
+            ROLLUP.log_bytes = METRICS_JSONL.stat().st_size
+        if compacted or ROLLUP.rolled_over():
+            ROLLUP.save()
+    except Exception:
+        pass
+    if not summary:
+        return
     try:
         METRICS_SUMMARY.write_text(json.dumps(entry, ensure_ascii=False, indent=2))
     except Exception:
         pass
 
 
-def main():
-    if not TRAN_ROOT.exists():
-        print(f"tran folder not found at {TRAN_ROOT}")
-        sys.exit(1)
+def get_max_workers() -> int:
+    try:
+        return int(os.getenv('KN_CONCURRENCY', str(os.cpu_count() or 2)))
+    except Exception:
+        return os.cpu_count() or 2
 
+
+def run_build(changes: list | None = None, prev_map: dict | None = None, scheduler=None, prev_dirs: dict | None = None,
+              content_index: ContentIndex | None = None) -> dict:
     start_time = time.time()
+    PHASES.reset()
     is_included = build_filters()
-    prev_cache = load_cache()
-    prev_map = {f.get('rel_path'): f for f in prev_cache.get('files', [])} if isinstance(prev_cache, dict) else {}
+    own_cache = prev_map is None
+    with PHASES.phase('load_cache'):
+        if own_cache:
+            prev_map = load_cache()
+        if content_index is None:
+            content_index = ContentIndex.load(CONTENT_INDEX_FILE, DEDUP_PROBE_MIN)
 
     now_dt = datetime.now(UTC)
     now = now_dt.strftime('%Y-%m-%dT%H:%M:%SZ')
-    try:
-        max_workers = int(os.getenv('KN_CONCURRENCY', str(os.cpu_count() or 2)))
-    except Exception:
-        max_workers = os.cpu_count() or 2
+    max_workers = get_max_workers()
 
-    changes = read_changes_from_env(TRAN_ROOT)
-    if changes:
-        files_meta, changed_paths = collect_from_changes_only(TRAN_ROOT, prev_map, changes, max_workers, is_included)
-    else:
-        files_meta, changed_paths = collect_metadata_parallel(TRAN_ROOT, prev_map, max_workers, is_included)
+    cached = isinstance(prev_map, FingerprintCache)
+    # 'collect' includes its nested 'walk'/'stat' and 'hash' phases
+    with PHASES.phase('collect'):
+        if changes:
+            files_meta, changed_paths, moved = collect_from_changes_only(TRAN_ROOT, prev_map, changes, max_workers,
+                                                                         is_included, scheduler, content_index)
+            # Directory listings are only refreshed by full scans; a stale one is never trusted
+            # because any add/remove/rename in a directory bumps its mtime.
+            dirs = dict(prev_map.dir_items()) if cached else (prev_dirs or {})
+        else:
+            # KN_PRUNE_DIRS=1 reuses the cached listing of directories whose mtime is unchanged.
+            # In-place edits do not touch the directory mtime, so this relies on the watcher
+            # (KN_CHANGED_PATHS) to report content changes inside such directories.
+            prune = os.getenv('KN_PRUNE_DIRS', '0') == '1' and cached and prev_map.filters_digest == filters_digest()
+            files_meta, changed_paths, dirs = collect_metadata_parallel(TRAN_ROOT, prev_map, max_workers, is_included,
+                                                                        scheduler, prune, content_index)
+            moved = []
+    with PHASES.phase('content_index'):
+        update_content_index(content_index, prev_map, files_meta, changed_paths, moved)
+    with PHASES.phase('journal'):
+        delta = journal_delta(prev_map, files_meta, changed_paths, moved)
+    stored = stored_digests(prev_map)
+    if own_cache and isinstance(prev_map, FingerprintCache):
+        prev_map.close()
 
-    knowledge = {
+    header = {
         'generated_at_utc': now,
         'source_root': str(TRAN_ROOT),
         'file_count': len(files_meta),
-        'files': files_meta,
     }
-    knowledge_path = ME_ROOT / 'knowledge.json'
-    wrote_json = write_if_changed(knowledge_path, json.dumps(knowledge, ensure_ascii=False, indent=2))
+    knowledge = {**header, 'files': files_meta}
+    knowledge_path = KNOWLEDGE_FILE
 
-    index_md = generate_index_md(TRAN_ROOT, files_meta)
-    wrote_index = write_if_changed(ME_ROOT / 'INDEX.md', index_md)
+    # Outputs are compared through digests kept in the cache (never by reading them
+    # back); generated_at_utc is left out so an unchanged tree rewrites nothing.
+    batch = OutputBatch(fsync=os.getenv('KN_FSYNC', '0') == '1')
+    with PHASES.phase('digest'):
+        files_d = files_digest(files_meta)
+    stable_header = {k: v for k, v in header.items() if k != 'generated_at_utc'}
+    digests = {'knowledge': state_digest(OUTPUT_FORMAT, json.dumps(stable_header, sort_keys=True), files_d)}
+    wrote_json = digests['knowledge'] != stored.get('knowledge') or not knowledge_path.exists()
+    if wrote_json:
+        with PHASES.phase('encode_json'):
+            batch.add_chunks(knowledge_path, iter_knowledge_chunks(header, files_meta, OUTPUT_FORMAT))
 
-    summary_md = generate_summary_md(TRAN_ROOT)
-    wrote_summary = write_if_changed(ME_ROOT / 'SUMMARY.md', summary_md)
+    # INDEX.md is a function of the file entries alone: skip it when they are unchanged,
+    # otherwise patch the rows of changed paths into the previous table
+    index_path = ME_ROOT / 'INDEX.md'
+    digests['index_src'] = state_digest('index', files_d)
+    if digests['index_src'] == stored.get('index_src') and stored.get('index') and index_path.exists():
+        digests['index'] = stored['index']
+        wrote_index = False
+    else:
+        with PHASES.phase('index_md'):
+            prev_rows = load_index_rows(index_path, stored.get('index', ''))
+            index_md = generate_index_md(TRAN_ROOT, files_meta, changed_paths, prev_rows)
+            wrote_index = stage_output(batch, index_path, index_md, 'index', stored, digests)
 
-    cache_obj = {
-        'files': files_meta,
-        'updated_at_utc': now,
-    }
-    save_cache(cache_obj)
+    with PHASES.phase('derived'):
+        with PHASES.phase('datasets'):
+            datasets = update_dataset_profiles(files_meta, batch)
+        with PHASES.phase('openapi'):
+            specs = update_openapi_index(files_meta, batch)
+    with PHASES.phase('summary_md'):
+        fragments = load_summary_fragments()
+        summary_md, new_fragments = generate_summary_md(TRAN_ROOT, content_index, changed_paths, fragments, is_included,
+                                                        datasets, specs)
+        wrote_summary = stage_output(batch, ME_ROOT / 'SUMMARY.md', summary_md, 'summary', stored, digests)
+        if new_fragments != fragments:
+            batch.add_text(SUMMARY_FRAGMENTS_FILE, json.dumps({'version': SUMMARY_VERSION, 'filters': filters_digest(),
+                                                               'fragments': new_fragments}, ensure_ascii=False))
 
-    (ME_ROOT / 'latest_run.txt').write_text(now)
+    changed_outputs = wrote_json or wrote_index or wrote_summary
+    if changed_outputs:
+        batch.add_text(ME_ROOT / 'latest_run.txt', now)
+    with PHASES.phase('commit'):
+        batch.commit()
 
-    # Daily snapshot of outputs (idempotent per file/day)
-    snapshot_daily([knowledge_path, ME_ROOT / 'INDEX.md', ME_ROOT / 'SUMMARY.md'], now_dt)
+    digests['cache'] = state_digest(files_d, sorted(dirs.items()), filters_digest())
+    with PHASES.phase('save_cache'):
+        if changed_outputs or digests['cache'] != stored.get('cache'):
+            save_cache(files_meta, now_dt, dirs, digests)
+        content_index.save()
+    with PHASES.phase('text_index'):
+        update_text_index(files_meta, changed_paths)
+    with PHASES.phase('journal'):
+        record_journal(now, 'changes' if changes else 'full', delta, len(files_meta))
+
+    with PHASES.phase('snapshot'):
+        snap = snapshot_outputs([knowledge_path, ME_ROOT / 'INDEX.md', ME_ROOT / 'SUMMARY.md'], now_dt)
+    if snap:
+        PHASES.count('snapshot_new_chunks', snap['new_chunks'])
+        PHASES.count('snapshot_stored_bytes', snap['stored_bytes'])
 
     duration = time.time() - start_time
     writes = {'json': wrote_json, 'index': wrote_index, 'summary': wrote_summary}
-    append_metrics(now, len(files_meta), len(changed_paths), duration, writes)
+    append_metrics(now, len(files_meta), len(changed_paths), duration, writes, summary=changed_outputs,
+                   phases=PHASES.as_dict())
+
+    return {
+        'now': now,
+        'knowledge': knowledge,
+        'files_meta': files_meta,
+        'changed_paths': changed_paths,
+        'dirs': dirs,
+        'content_index': content_index,
+        'duration_s': duration,
+        'writes': writes,
+    }
+
+
+class TreeWatcher:
+    """Recursive inotify watch on a tree, read directly through libc."""
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f"inotify_init1 failed: {os.strerror(err)}")
+        self.wd_to_dir: dict[int, Path] = {}
+        self.add_tree(root)
+
+    def add_dir(self, path: Path) -> None:
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(str(path)), WATCH_MASK)
+        if wd >= 0:
+            self.wd_to_dir[wd] = path
+
+    def add_tree(self, path: Path) -> None:
+        self.add_dir(path)
+        for dirpath, dirnames, _ in os.walk(path):
+            for name in dirnames:
+                self.add_dir(Path(dirpath) / name)
+
+    def read_events(self, timeout: float | None) -> list[tuple[int, int, Path]]:
+        """Return (mask, cookie, path) tuples; an overflow is reported with an empty path."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        buf = os.read(self.fd, 256 * 1024)
+        events = []
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(buf):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(buf, offset)
+            offset += EVENT_HEADER.size
+            name = buf[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                events.append((mask, 0, Path()))
+                continue
+            if mask & IN_IGNORED:
+                self.wd_to_dir.pop(wd, None)
+                continue
+            base = self.wd_to_dir.get(wd)
+            if base is None:
+                continue
+            path = base / os.fsdecode(name) if name else base
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                self.add_tree(path)
+            events.append((mask, cookie, path))
+        return events
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+def log_watch(message: str) -> None:
+    try:
+        LOG_DIR.mkdir(parents=True, exist_ok=True)
+        with (LOG_DIR / 'watch.log').open('a') as f:
+            f.write(f"[{datetime.now(UTC).strftime('%Y-%m-%dT%H:%M:%SZ')}] {message}\n")
+    except Exception:
+        pass
+
+
+def remove_pid_file(path: Path) -> None:
+    """Remove `path` if it still names this process (a newer instance may have replaced it)."""
+    try:
+        if path.read_text().strip() == str(os.getpid()):
+            path.unlink()
+    except Exception:
+        pass
+
+
+def run_daemon() -> None:
+    import ai_export
+
+    debounce = float(os.getenv('DEBOUNCE_SECONDS', '0.5'))
+    max_delay = float(os.getenv('KN_MAX_BATCH_DELAY', '5'))
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    watcher = TreeWatcher(TRAN_ROOT)
+    log_watch(f"daemon watching {TRAN_ROOT} (pid={os.getpid()})")
+    metrics_addr = os.getenv('KN_METRICS_ADDR', '')
+    if metrics_addr:
+        global ROLLUP
+        ROLLUP = MetricsRollup.load(METRICS_STATE_FILE, METRICS_JSONL)
+        try:
+            serve_in_thread(metrics_addr, ROLLUP)
+            log_watch(f"serving metrics on {metrics_addr}")
+        except Exception as e:
+            log_watch(f"metrics endpoint on {metrics_addr} failed: {e}")
+    service = None
+    serve_addr = os.getenv('KN_SERVE', '')
+    if serve_addr:
+        import knowledge_serve
+        try:
+            service = knowledge_serve.serve_in_thread(serve_addr, ME_ROOT)
+            log_watch(f"serving knowledge queries on {serve_addr}")
+        except Exception as e:
+            log_watch(f"query service on {serve_addr} failed: {e}")
+
+    # Bounded and de-duplicated between moves, like dedupe_changes; past QUEUE_MAX
+    # entries the batch collapses into a full scan
+    pending: list[tuple[set, int, str]] = []
+    pending_seen: set[str] = set()
+    full_scan = True
+    prev_map = None
+    prev_dirs = None
+    content_index = None
+    first_event_at = None
+    deadline = time.monotonic()
+    with HashScheduler(get_max_workers()) as scheduler:
+        try:
+            while True:
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                events = watcher.read_events(timeout)
+                now_mono = time.monotonic()
+                for mask, cookie, path in events:
+                    if mask & IN_Q_OVERFLOW:
+                        full_scan = True
+                        continue
+                    try:
+                        rel = str(path.relative_to(TRAN_ROOT))
+                    except ValueError:
+                        continue
+                    if rel == '.' or full_scan:
+                        continue
+                    if mask & (IN_MOVED_FROM | IN_MOVED_TO):
+                        pending.append(({'MOVED_FROM'} if mask & IN_MOVED_FROM else {'MOVED_TO'}, cookie, rel))
+                        pending_seen.clear()
+                    elif rel not in pending_seen:
+                        pending_seen.add(rel)
+                        pending.append((set(), cookie, rel))
+                    if len(pending) > QUEUE_MAX:
+                        full_scan = True
+                        pending.clear()
+                        pending_seen.clear()
+                if events:
+                    if first_event_at is None:
+                        first_event_at = now_mono
+                    deadline = min(now_mono + debounce, first_event_at + max_delay)
+                if deadline is None or time.monotonic() < deadline:
+                    continue
+                changes = events_to_changes(pending)
+                pending.clear()
+                pending_seen.clear()
+                first_event_at = None
+                deadline = None
+                if not (full_scan or changes):
+                    continue
+                mode = 'full' if full_scan else f"changes={len(changes)}"
+                full_scan = False
+                try:
+                    with maybe_profile(LOG_DIR, datetime.now(UTC).strftime('%Y%m%d-%H%M%S')):
+                        result = run_build(None if mode == 'full' else changes, prev_map, scheduler, prev_dirs,
+                                           content_index)
+                    prev_map = {f['rel_path']: f for f in result['files_meta'] if 'rel_path' in f}
+                    prev_dirs = result['dirs']
+                    content_index = result['content_index']
+                    if service is not None:
+                        service.publish(result['knowledge'])
+                    ai_export.export(result['knowledge'])
+                    log_watch(f"build ({mode}) files={len(result['files_meta'])} changed={len(result['changed_paths'])} duration_s={result['duration_s']:.3f}")
+                except Exception as e:
+                    full_scan = True
+                    content_index = None
+                    deadline = time.monotonic() + max_delay
+                    log_watch(f"build ({mode}) failed: {e}")
+        finally:
+            watcher.close()
+
+
+def main():
+    if not TRAN_ROOT.exists():
+        print(f"tran folder not found at {TRAN_ROOT}")
+        sys.exit(1)
+
+    if '--daemon' in sys.argv[1:]:
+        # knowledge_watch.sh writes our PID (it execs us) and passes the file along
+        pid_file = os.getenv('KN_PID_FILE', '')
+        try:
+            run_daemon()
+        finally:
+            if pid_file:
+                remove_pid_file(Path(pid_file))
+        return
 
-    print(f"Knowledge built at {now}; files={len(files_meta)}; changed={len(changed_paths)}; duration_s={duration:.3f}; writes={writes}")
+    with maybe_profile(LOG_DIR, datetime.now(UTC).strftime('%Y%m%d-%H%M%S')):
+        result = run_build(read_changes_from_env(TRAN_ROOT))
+    print(f"Knowledge built at {result['now']}; files={len(result['files_meta'])}; changed={len(result['changed_paths'])}; duration_s={result['duration_s']:.3f}; writes={result['writes']}")
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
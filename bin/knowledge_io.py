@@ -0,0 +1,191 @@
+import os
+import json
+from pathlib import Path
+
+READ_CHUNK = 1024 * 1024
+JSONL_FORMAT = 'knowledge-jsonl/1'
+
+
+def _encode_entry_json(entry: dict) -> str:
+    # Same bytes json.dumps(knowledge, indent=2) would produce for a list item
+    return '    ' + json.dumps(entry, ensure_ascii=False, indent=2).replace('\n', '\n    ')
+
+
+def iter_knowledge_chunks(header: dict, files, fmt: str = 'json'):
+    if fmt == 'jsonl':
+        yield json.dumps({'format': JSONL_FORMAT, **header}, ensure_ascii=False) + '\n'
+        for entry in files:
+            yield json.dumps(entry, ensure_ascii=False) + '\n'
+        return
+    head = json.dumps(header, ensure_ascii=False, indent=2)
+    head = head[:-2] + ',\n' if header else '{\n'
+    first = True
+    for entry in files:
+        if first:
+            yield head + '  "files": [\n' + _encode_entry_json(entry)
+            first = False
+        else:
+            yield ',\n' + _encode_entry_json(entry)
+    yield (head + '  "files": []\n}') if first else '\n  ]\n}'
+
+
+class OutputBatch:
+    """Stage outputs as temp files next to their targets, then rename them into place together.
+
+    With fsync=True the staged files are flushed before any rename and each target
+    directory once afterwards, so a crash leaves either the old or the new set.
+    """
+
+    def __init__(self, fsync: bool = False):
+        self.fsync = fsync
+        self.staged: list[tuple[Path, Path]] = []
+
+    def add_chunks(self, path: Path, chunks) -> None:
+        tmp = path.with_name(path.name + '.tmp')
+        with tmp.open('w', encoding='utf-8') as f:
+            for chunk in chunks:
+                f.write(chunk)
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        self.staged.append((tmp, path))
+
+    def add_text(self, path: Path, text: str) -> None:
+        self.add_chunks(path, (text,))
+
+    def commit(self) -> list[Path]:
+        for tmp, path in self.staged:
+            os.replace(tmp, path)
+        if self.fsync:
+            for d in {path.parent for _, path in self.staged}:
+                fd = os.open(d, os.O_RDONLY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+        written = [path for _, path in self.staged]
+        self.staged = []
+        return written
+
+    def discard(self) -> None:
+        for tmp, _ in self.staged:
+            try:
+                tmp.unlink()
+            except OSError:
+                pass
+        self.staged = []
+
+
+def _iter_json_array(f, buf: str, pos: int):
+    decoder = json.JSONDecoder()
+    eof = False
+    while True:
+        while pos < len(buf) and buf[pos] in ' \t\r\n,':
+            pos += 1
+        if pos >= len(buf):
+            if eof:
+                return
+            more = f.read(READ_CHUNK)
+            eof = not more
+            buf, pos = buf[pos:] + more, 0
+            continue
+        if buf[pos] == ']':
+            return
+        try:
+            obj, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            more = f.read(READ_CHUNK)
+            eof = not more
+            buf, pos = buf[pos:] + more, 0
+            continue
+        yield obj
+        pos = end
+        if pos > READ_CHUNK:
+            buf, pos = buf[pos:], 0
+
+
+def _read_json_header(f) -> tuple[dict, str, int] | None:
+    buf = ''
+    while True:
+        idx = buf.find('"files"')
+        if idx >= 0:
+            bracket = buf.find('[', idx)
+            if bracket >= 0:
+                break
+        more = f.read(READ_CHUNK)
+        if not more:
+            return None
+        buf += more
+    head = buf[:idx].rstrip().rstrip(',') + '}'
+    try:
+        header = json.loads(head)
+    except json.JSONDecodeError:
+        return None
+    return header, buf, bracket + 1
+
+
+def read_knowledge_header(path: Path) -> dict:
+    try:
+        with path.open('r', encoding='utf-8', errors='replace') as f:
+            if path.suffix == '.jsonl':
+                header = json.loads(f.readline() or '{}')
+                header.pop('format', None)
+                return header
+            parsed = _read_json_header(f)
+            if parsed is not None:
+                return parsed[0]
+        obj = json.loads(path.read_text())
+        obj.pop('files', None)
+        return obj
+    except Exception:
+        return {}
+
+
+def iter_knowledge_files(path: Path):
+    """Yield file entries from knowledge.json / knowledge.jsonl without loading the whole document."""
+    try:
+        f = path.open('r', encoding='utf-8', errors='replace')
+    except OSError:
+        return
+    with f:
+        if path.suffix == '.jsonl':
+            f.readline()
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+            return
+        parsed = _read_json_header(f)
+        if parsed is None:
+            f.seek(0)
+            try:
+                yield from json.load(f).get('files', [])
+            except Exception:
+                return
+            return
+        _, buf, pos = parsed
+        yield from _iter_json_array(f, buf, pos)
+
+
+class KnowledgeFiles:
+    """Re-iterable view over the entries of a knowledge file."""
+
+    def __init__(self, path: Path):
+        self.path = path
+
+    def __iter__(self):
+        return iter_knowledge_files(self.path)
+
+
+def find_knowledge(me_root: Path) -> Path:
+    candidates = [p for p in (me_root / 'knowledge.jsonl', me_root / 'knowledge.json') if p.exists()]
+    if not candidates:
+        return me_root / 'knowledge.json'
+    return max(candidates, key=lambda p: p.stat().st_mtime)
+
+
+def open_knowledge(path: Path) -> dict:
+    knowledge = read_knowledge_header(path)
+    knowledge['files'] = KnowledgeFiles(path)
+    return knowledge
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import time
+import asyncio
+import threading
+from bisect import bisect_left
+from pathlib import Path
+from urllib.parse import urlsplit, parse_qs, unquote
+
+from knowledge_io import find_knowledge, read_knowledge_header, iter_knowledge_files
+from metrics_store import parse_addr
+
+# Read-only HTTP/1.1 view of the build outputs, served from memory:
+#   GET /status                    generation, file count, build time
+#   GET /file?path=REL             one files_meta entry
+#   GET /ls?prefix=P[&after=REL][&limit=N]
+#                                  entries under a prefix, in path order, paged by `after`
+#   GET /digest/SHA256             paths holding that content
+#   GET /summary, /index           SUMMARY.md / INDEX.md
+# Lookups and documents carry an ETag and honour If-None-Match.  A loaded build is an
+# immutable KnowledgeView; a new one is built off the event loop and swapped in with one
+# assignment, so requests never wait for a build or a reload and the builder never
+# waits for readers.
+ME_ROOT = Path(os.getenv('KN_ME_ROOT', '/workspace/me'))
+DEFAULT_ADDR = '127.0.0.1:9465'
+POLL_S = float(os.getenv('KN_SERVE_POLL_S', '1'))
+LIST_LIMIT = 1000
+MAX_HEADER_BYTES = 16 * 1024
+STATUS_TEXT = {200: 'OK', 304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed'}
+
+
+def stat_tag(path: Path) -> str:
+    try:
+        st = path.stat()
+    except OSError:
+        return ''
+    return f'{st.st_mtime_ns:x}-{st.st_size:x}'
+
+
+def read_bytes(path: Path) -> bytes:
+    try:
+        return path.read_bytes()
+    except OSError:
+        return b''
+
+
+class KnowledgeView:
+    """One build's outputs, indexed for lookups; never modified once built."""
+
+    def __init__(self, header: dict, files: list, knowledge_tag: str, me_root: Path = ME_ROOT,
+                 reuse: 'KnowledgeView | None' = None):
+        self.header = header
+        self.generation = knowledge_tag
+        if reuse is not None and reuse.generation == knowledge_tag:
+            self.files, self.paths, self.by_sha = reuse.files, reuse.paths, reuse.by_sha
+        else:
+            self.files = {f['rel_path']: f for f in files if 'rel_path' in f}
+            self.paths = sorted(self.files)
+            self.by_sha: dict[str, list[str]] = {}
+            for rel in self.paths:
+                sha = self.files[rel].get('sha256')
+                if sha:
+                    self.by_sha.setdefault(sha, []).append(rel)
+        self.docs = {}
+        for name, route in (('SUMMARY.md', '/summary'), ('INDEX.md', '/index')):
+            p = me_root / name
+            tag = stat_tag(p)
+            old = reuse.docs.get(route) if reuse is not None else None
+            self.docs[route] = old if old is not None and old[0] == tag else (tag, read_bytes(p))
+        self.loaded_at = time.time()
+
+    @classmethod
+    def load(cls, me_root: Path = ME_ROOT, reuse: 'KnowledgeView | None' = None) -> 'KnowledgeView':
+        path = find_knowledge(me_root)
+        tag = stat_tag(path)
+        if reuse is not None and reuse.generation == tag:
+            return cls(reuse.header, [], tag, me_root, reuse)
+        if path.suffix == '.json':
+            try:
+                obj = json.loads(path.read_bytes())
+                files = obj.pop('files', [])
+                return cls(obj, files, tag, me_root)
+            except (OSError, ValueError):
+                pass
+        return cls(read_knowledge_header(path), list(iter_knowledge_files(path)), tag, me_root)
+
+    def source_tags(self) -> tuple[str, ...]:
+        return (self.generation, self.docs['/summary'][0], self.docs['/index'][0])
+
+    def listing(self, prefix: str, after: str = '', limit: int = LIST_LIMIT) -> dict:
+        i = bisect_left(self.paths, max(prefix, after))
+        if after and i < len(self.paths) and self.paths[i] == after:
+            i += 1
+        out = []
+        while i < len(self.paths) and len(out) < limit and self.paths[i].startswith(prefix):
+            f = self.files[self.paths[i]]
+            out.append({'rel_path': f['rel_path'], 'size': f.get('size'), 'sha256': f.get('sha256', '')})
+            i += 1
+        more = i < len(self.paths) and self.paths[i].startswith(prefix)
+        return {'prefix': prefix, 'entries': out, 'next': out[-1]['rel_path'] if more and out else None}
+
+
+def current_tags(me_root: Path = ME_ROOT) -> tuple[str, ...]:
+    return (stat_tag(find_knowledge(me_root)), stat_tag(me_root / 'SUMMARY.md'), stat_tag(me_root / 'INDEX.md'))
+
+
+class KnowledgeService:
+    def __init__(self, me_root: Path = ME_ROOT):
+        self.me_root = me_root
+        self.view: KnowledgeView | None = None
+        self._reloading = False
+
+    # -- publishing -------------------------------------------------------
+
+    async def reload(self) -> None:
+        """Load the outputs on disk in a worker thread and swap them in."""
+        if self._reloading:
+            return
+        self._reloading = True
+        try:
+            self.view = await asyncio.get_running_loop().run_in_executor(None, KnowledgeView.load, self.me_root,
+                                                                         self.view)
+        finally:
+            self._reloading = False
+
+    def publish(self, knowledge: dict) -> None:
+        """Swap in a build's in-memory result (called from the daemon's build thread)."""
+        header = {k: v for k, v in knowledge.items() if k != 'files'}
+        tag = stat_tag(find_knowledge(self.me_root))
+        self.view = KnowledgeView(header, list(knowledge.get('files', [])), tag, self.me_root, self.view)
+
+    async def poll(self) -> None:
+        while True:
+            await asyncio.sleep(POLL_S)
+            view = self.view
+            if view is None or current_tags(self.me_root) != view.source_tags():
+                try:
+                    await self.reload()
+                except Exception as e:
+                    print(f'[serve] reload failed: {e}', file=sys.stderr)
+
+    # -- HTTP -------------------------------------------------------------
+
+    def route(self, target: str) -> tuple[int, str, bytes, str]:
+        """(status, content type, body, etag) for a GET of `target`."""
+        view = self.view
+        if view is None:
+            return 404, 'application/json', b'{"error": "no build loaded yet"}', ''
+        url = urlsplit(target)
+        qs = parse_qs(url.query)
+        path = url.path
+        if path == '/file':
+            rel = qs.get('path', [''])[0]
+            f = view.files.get(rel)
+            if f is None:
+                return 404, 'application/json', json.dumps({'error': 'not found', 'path': rel}).encode(), ''
+            tag = f"{f.get('sha256', '')}-{f.get('size', 0)}-{f.get('mtime_ns', 0)}"
+            return 200, 'application/json', json.dumps(f, ensure_ascii=False).encode(), tag
+        if path == '/ls':
+            try:
+                limit = max(1, min(int(qs.get('limit', [str(LIST_LIMIT)])[0]), LIST_LIMIT))
+            except ValueError:
+                return 400, 'application/json', b'{"error": "bad limit"}', ''
+            prefix, after = qs.get('prefix', [''])[0], qs.get('after', [''])[0]
+            body = view.listing(prefix, after, limit)
+            return 200, 'application/json', json.dumps(body, ensure_ascii=False).encode(), view.generation
+        if path.startswith('/digest/'):
+            sha = unquote(path[len('/digest/'):]).lower()
+            paths = view.by_sha.get(sha)
+            if not paths:
+                return 404, 'application/json', json.dumps({'error': 'not found', 'sha256': sha}).encode(), ''
+            body = json.dumps({'sha256': sha, 'paths': paths}, ensure_ascii=False).encode()
+            return 200, 'application/json', body, view.generation
+        if path in view.docs:
+            tag, data = view.docs[path]
+            return 200, 'text/markdown; charset=utf-8', data, tag
+        if path == '/status':
+            body = {**view.header, 'generation': view.generation, 'files': len(view.files),
+                    'loaded_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(view.loaded_at))}
+            return 200, 'application/json', json.dumps(body, ensure_ascii=False).encode(), ''
+        return 404, 'application/json', b'{"error": "unknown endpoint"}', ''
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    return
+                lines = head.decode('latin-1').split('\r\n')
+                parts = lines[0].split()
+                headers = {}
+                for line in lines[1:]:
+                    name, sep, value = line.partition(':')
+                    if sep:
+                        headers[name.strip().lower()] = value.strip()
+                if len(parts) != 3:
+                    status, ctype, body, tag = 400, 'application/json', b'{"error": "bad request"}', ''
+                elif parts[0] not in ('GET', 'HEAD'):
+                    status, ctype, body, tag = 405, 'application/json', b'{"error": "read-only service"}', ''
+                else:
+                    status, ctype, body, tag = self.route(parts[1])
+                etag = f'"{tag}"' if tag else ''
+                if status == 200 and etag and etag in (t.strip() for t in headers.get('if-none-match', '').split(',')):
+                    status, body = 304, b''
+                keep = headers.get('connection', '').lower() != 'close' and len(parts) == 3 and parts[2] == 'HTTP/1.1'
+                out = [f'HTTP/1.1 {status} {STATUS_TEXT[status]}', f'Content-Type: {ctype}',
+                       f'Content-Length: {len(body)}', 'Cache-Control: no-cache']
+                if etag:
+                    out.append(f'ETag: {etag}')
+                if not keep:
+                    out.append('Connection: close')
+                writer.write(('\r\n'.join(out) + '\r\n\r\n').encode('latin-1'))
+                if parts[:1] != ['HEAD'] and status != 304:
+                    writer.write(body)
+                await writer.drain()
+                if not keep:
+                    return
+        finally:
+            writer.close()
+
+    async def serve(self, addr: str, poll: bool = True, ready: threading.Event | None = None) -> None:
+        if self.view is None:
+            await self.reload()
+        kind, target = parse_addr(addr)
+        if kind == 'unix':
+            try:
+                os.unlink(target)
+            except FileNotFoundError:
+                pass
+            server = await asyncio.start_unix_server(self.handle, target, limit=MAX_HEADER_BYTES)
+        else:
+            server = await asyncio.start_server(self.handle, *target, limit=MAX_HEADER_BYTES)
+        if ready is not None:
+            ready.set()
+        async with server:
+            if poll:
+                asyncio.create_task(self.poll())
+            await server.serve_forever()
+
+
+def serve_in_thread(addr: str, me_root: Path = ME_ROOT) -> KnowledgeService:
+    """Run the service on its own event loop thread (knowledge_build.py --daemon with
+    KN_SERVE); the daemon then hands each build over with publish()."""
+    service = KnowledgeService(me_root)
+    ready = threading.Event()
+    failed: list[BaseException] = []
+
+    def run():
+        try:
+            asyncio.run(service.serve(addr, poll=False, ready=ready))
+        except BaseException as e:
+            failed.append(e)
+        finally:
+            ready.set()
+
+    thread = threading.Thread(target=run, name='knowledge-serve', daemon=True)
+    thread.start()
+    if not ready.wait(30):
+        raise TimeoutError(f'query service on {addr} did not start within 30s')
+    if failed:
+        raise failed[0]
+    return service
+
+
+def main():
+    args = sys.argv[1:]
+    if len(args) > 1 or args[:1] in (['-h'], ['--help']):
+        print(f'usage: knowledge_serve.py [ADDR]  (host:port or unix:/path, default KN_SERVE or {DEFAULT_ADDR})',
+              file=sys.stderr)
+        sys.exit(2)
+    addr = args[0] if args else (os.getenv('KN_SERVE') or DEFAULT_ADDR)
+    print(f'serving {ME_ROOT} on {addr}', file=sys.stderr)
+    try:
+        asyncio.run(KnowledgeService().serve(addr))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
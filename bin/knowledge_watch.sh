@@ -9,8 +9,10 @@ PID_FILE="$ROOT/me/.knowledge_watch.pid"
 SCRIPT="$ROOT/bin/knowledge_build.py"
 DEBOUNCE_SECS="${DEBOUNCE_SECONDS:-0.5}"
 TRIGGER_FILE="$ROOT/me/.knowledge_build.scheduled"
-SENT_CHANGES="$ROOT/me/.watch_changes.tmp"
-: > "$SENT_CHANGES"
+QUEUE_FILE="$ROOT/me/.watch_changes.tmp"
+BATCH_FILE="$ROOT/me/.watch_changes.batch"
+QUEUE_MAX="${KN_QUEUE_MAX:-10000}"
+rm -f "$QUEUE_FILE" "$BATCH_FILE"
 
 need_tool() {
   command -v "$1" >/dev/null 2>&1 || { echo "missing tool: $1" >&2; return 1; }
@@ -27,6 +29,15 @@ if [[ -f "$PID_FILE" ]] && ps -p "$(cat "$PID_FILE" 2>/dev/null)" >/dev/null 2>&
   exit 0
 fi
 
+# Resident mode: knowledge_build.py reads inotify itself, keeps its cache and
+# hashing pool warm and runs the AI export in-process (KN_WATCH_DAEMON=0 for the legacy loop)
+if [[ "${KN_WATCH_DAEMON:-1}" == "1" ]]; then
+  echo $$ > "$PID_FILE"
+  echo "[$(date -u +%Y-%m-%dT%H:%M:%SZ)] starting resident daemon for $WATCH_ROOT" | tee -a "$LOG_DIR/watch.log" >/dev/null
+  # exec keeps our PID, so the daemon removes PID_FILE itself when it exits
+  KN_PID_FILE="$PID_FILE" exec ionice -c1 -n0 nice -n -5 python3 "$SCRIPT" --daemon
+fi
+
 need_tool inotifywait || { echo "Install inotify-tools (apt-get install -y inotify-tools)" >&2; exit 2; }
 
 echo $$ > "$PID_FILE"
@@ -40,30 +51,57 @@ normalize_rel() {
   printf "%s" "$rel"
 }
 
+run_batch() {
+  ts=$(date -u +%Y%m%d-%H%M%S)
+  # Hand the event lines (EVENTS<TAB>PATH) to the builder so it can pair up moves;
+  # an empty batch means a full scan
+  echo "[$(date -u +%Y-%m-%dT%H:%M:%SZ)] change detected -> build (events=$(wc -l < "$BATCH_FILE"))" | tee -a "$LOG_DIR/watch.log" >/dev/null
+  KN_CHANGED_FILE="$BATCH_FILE" ionice -c1 -n0 nice -n -5 python3 "$SCRIPT" >> "$LOG_DIR/run-$ts.log" 2>&1 || true
+  # Export AI reference after successful build (best-effort)
+  python3 "$ROOT/bin/ai_export.py" >> "$LOG_DIR/run-$ts.log" 2>&1 || true
+}
+
 schedule_build() {
+  local full="${1:-}"
   if [[ -f "$TRIGGER_FILE" ]]; then
     return 0
   fi
   : > "$TRIGGER_FILE"
   (
     sleep "$DEBOUNCE_SECS"
-    ts=$(date -u +%Y%m%d-%H%M%S)
-    # Read and export changes
-    CHANGES=$(tr '\n' ',' < "$SENT_CHANGES" | sed 's/,$//')
-    echo "[$(date -u +%Y-%m-%dT%H:%M:%SZ)] change detected -> build (changes=${CHANGES})" | tee -a "$LOG_DIR/watch.log" >/dev/null
-    KN_CHANGED_PATHS="$CHANGES" ionice -c1 -n0 nice -n -5 python3 "$SCRIPT" >> "$LOG_DIR/run-$ts.log" 2>&1 || true
-    # Export AI reference after successful build (best-effort)
-    python3 "$ROOT/bin/ai_export.py" >> "$LOG_DIR/run-$ts.log" 2>&1 || true
-    : > "$SENT_CHANGES"
-    rm -f "$TRIGGER_FILE"
+    # The queue is renamed away before each build, so events arriving mid-build
+    # start a fresh queue that the next iteration picks up
+    while [[ -n "$full" || -s "$QUEUE_FILE" ]]; do
+      if [[ -n "$full" ]]; then
+        : > "$BATCH_FILE"
+        full=""
+      else
+        mv -f "$QUEUE_FILE" "$BATCH_FILE"
+      fi
+      run_batch
+    done
+    rm -f "$BATCH_FILE" "$TRIGGER_FILE"
+    # An event queued after the last check found the trigger still present
+    if [[ -s "$QUEUE_FILE" ]]; then
+      schedule_build
+    fi
   ) &
 }
 
-# Initial build once (no changes list)
-schedule_build
+# Initial full build
+schedule_build full
 
-inotifywait -m -r -e close_write,create,delete,move --format '%w%f %e' "$WATCH_ROOT" | while read -r path evt; do
+queued=0
+inotifywait -m -r -e close_write,create,delete,move --format $'%e\t%w%f' "$WATCH_ROOT" | while IFS=$'\t' read -r evt path; do
   rel=$(normalize_rel "$path")
-  echo "$rel" >> "$SENT_CHANGES"
+  # Bounded queue: past KN_QUEUE_MAX events (e.g. bulk imports) a single overflow
+  # marker replaces the rest and the builder falls back to a full scan
+  [[ -e "$QUEUE_FILE" ]] || queued=0
+  if (( queued < QUEUE_MAX )); then
+    printf '%s\t%s\n' "$evt" "$rel" >> "$QUEUE_FILE"
+  elif (( queued == QUEUE_MAX )); then
+    printf 'Q_OVERFLOW\t\n' >> "$QUEUE_FILE"
+  fi
+  queued=$((queued + 1))
   schedule_build
 done
\ No newline at end of file
@@ -6,7 +6,7 @@ set -euo pipefail
 
 start_epoch=$(date +%s)
 ts_utc=$(date -u +%Y%m%d-%H%M%S)
-reports_dir="/workspace/reports/perf-${ts_utc}"
+reports_dir="${KN_REPORTS_DIR:-/workspace/reports}/perf-${ts_utc}"
 mkdir -p "${reports_dir}"
 report_md="${reports_dir}/report.md"
 raw_dir="${reports_dir}/raw"
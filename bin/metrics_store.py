@@ -0,0 +1,449 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import time
+import threading
+import socketserver
+from bisect import bisect_left
+from pathlib import Path
+from datetime import datetime, timezone
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Rolling build statistics kept next to metrics.jsonl so percentile queries never
+# rescan the log:
+#   .metrics_state.json  cumulative histograms since the state was created, a ring of
+#                        SLOT_SECONDS slots (the rolling window), the last entry and how
+#                        many bytes of metrics.jsonl they cover
+#   metrics/rollup-YYYY-MM.jsonl
+#                        metrics.jsonl lines compacted into DOWNSAMPLE_SECONDS buckets
+#                        with the same histograms, once the log outgrows ROTATE_BYTES
+# Histograms use fixed bucket bounds, so any set of slots or rollup buckets merges by
+# adding counts.  The state file is only rewritten when a slot rolls over or the log is
+# compacted; whoever loads it replays the log lines past its byte count, so builds in
+# between append to metrics.jsonl and nothing else.
+ME_ROOT = Path(os.getenv('KN_ME_ROOT', '/workspace/me'))
+LOG_FILE = ME_ROOT / 'metrics.jsonl'
+STATE_FILE = ME_ROOT / '.metrics_state.json'
+ROLLUP_DIR = ME_ROOT / 'metrics'
+STATE_VERSION = 1
+UTC = timezone.utc
+
+
+def env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+SLOT_SECONDS = env_int('KN_METRICS_SLOT_S', 60)
+SLOT_COUNT = env_int('KN_METRICS_SLOTS', 60)
+ROTATE_BYTES = env_int('KN_METRICS_ROTATE_BYTES', 4 * 1024 * 1024)
+KEEP_LINES = env_int('KN_METRICS_KEEP_LINES', 500)
+DOWNSAMPLE_SECONDS = env_int('KN_METRICS_DOWNSAMPLE_S', 3600)
+DEFAULT_ADDR = '127.0.0.1:9464'
+
+# metric -> (upper bucket bounds, exposition name, help)
+HISTOGRAMS = {
+    'duration_s': ((0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300),
+                   'kn_build_duration_seconds', 'Wall time of a knowledge build.'),
+    'changed': ((0, 1, 2, 5, 10, 50, 100, 500, 1000, 5000, 10000, 100000),
+                'kn_build_changed_files', 'Files changed per knowledge build.'),
+    'writes': ((0, 1, 2, 3), 'kn_build_output_writes', 'Outputs rewritten per knowledge build.'),
+}
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+def entry_time(entry: dict) -> float:
+    try:
+        return datetime.strptime(entry['ts_utc'], '%Y-%m-%dT%H:%M:%SZ').replace(tzinfo=UTC).timestamp()
+    except Exception:
+        return time.time()
+
+
+def entry_values(entry: dict) -> dict:
+    writes = entry.get('writes')
+    return {
+        'duration_s': float(entry.get('duration_s', 0.0)),
+        'changed': float(entry.get('changed', 0)),
+        'writes': float(sum(1 for v in writes.values() if v)) if isinstance(writes, dict) else 0.0,
+    }
+
+
+def new_agg(metric: str) -> dict:
+    return {'h': [0] * (len(HISTOGRAMS[metric][0]) + 1), 'sum': 0.0, 'max': 0.0}
+
+
+def add_value(agg: dict, metric: str, value: float) -> None:
+    agg['h'][bisect_left(HISTOGRAMS[metric][0], value)] += 1
+    agg['sum'] += value
+    agg['max'] = max(agg['max'], value)
+
+
+def observe_into(aggs: dict, values: dict) -> None:
+    for metric, value in values.items():
+        add_value(aggs.setdefault(metric, new_agg(metric)), metric, value)
+
+
+def merge_aggs(metric: str, aggs) -> dict:
+    out = new_agg(metric)
+    for a in aggs:
+        if a and len(a['h']) == len(out['h']):
+            out['h'] = [x + y for x, y in zip(out['h'], a['h'])]
+            out['sum'] += a['sum']
+            out['max'] = max(out['max'], a['max'])
+    return out
+
+
+def quantile(agg: dict, metric: str, q: float) -> float | None:
+    """Estimate from bucket counts, interpolating linearly inside the bucket (as PromQL's
+    histogram_quantile does) and capped at the largest value seen."""
+    n = sum(agg['h'])
+    if not n:
+        return None
+    bounds = HISTOGRAMS[metric][0]
+    rank = q * n
+    seen = 0
+    for i, count in enumerate(agg['h']):
+        if count and seen + count >= rank:
+            lower = bounds[i - 1] if i else 0.0
+            upper = bounds[i] if i < len(bounds) else agg['max']
+            upper = min(upper, agg['max'])
+            if upper <= lower:
+                return upper
+            return lower + (upper - lower) * (rank - seen) / count
+        seen += count
+    return agg['max']
+
+
+class MetricsRollup:
+    """Bounded in-memory aggregation of build entries, persisted to STATE_FILE."""
+
+    def __init__(self, path: Path = STATE_FILE, log_path: Path = LOG_FILE):
+        self.path = path
+        self.log_path = log_path
+        self.lock = threading.Lock()
+        self.builds = 0
+        self.total: dict[str, dict] = {}
+        self.slots: list[dict] = []   # [{'t': slot start, 'm': {metric: agg}}], oldest first
+        self.last: dict = {}
+        self.log_bytes: int | None = 0
+        self.saved_slot = None
+        self.mtime_ns = 0
+
+    @classmethod
+    def load(cls, path: Path = STATE_FILE, log_path: Path = LOG_FILE) -> 'MetricsRollup':
+        rollup = cls(path, log_path)
+        rollup.reload()
+        return rollup
+
+    def reload(self) -> bool:
+        """Re-read the state file if it changed on disk, then replay the log lines it does
+        not cover yet; True when anything new was picked up."""
+        changed = False
+        try:
+            mtime_ns = self.path.stat().st_mtime_ns
+            obj = json.loads(self.path.read_text()) if mtime_ns != self.mtime_ns else None
+        except Exception:
+            obj = None
+        if obj is not None and obj.get('version') == STATE_VERSION and obj.get('slot_s') == SLOT_SECONDS:
+            with self.lock:
+                self.builds, self.total, self.slots, self.last = obj['builds'], obj['total'], obj['slots'], obj['last']
+                # States written before the byte count existed already cover the whole log
+                self.log_bytes = obj.get('log_bytes')
+                self.saved_slot = self.slots[-1]['t'] if self.slots else None
+                self.mtime_ns = mtime_ns
+            changed = True
+        return self.catch_up() > 0 or changed
+
+    def catch_up(self) -> int:
+        """Observe the complete log lines past `log_bytes`; returns how many there were."""
+        observed = 0
+        try:
+            with self.log_path.open('rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                if self.log_bytes is None or size < self.log_bytes:
+                    # Unknown coverage, or the log was rewritten behind our back
+                    self.log_bytes = size
+                    return 0
+                f.seek(self.log_bytes)
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break
+                    self.log_bytes += len(line)
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.observe(entry)
+                    observed += 1
+        except OSError:
+            pass
+        return observed
+
+    def save(self) -> None:
+        with self.lock:
+            obj = {'version': STATE_VERSION, 'slot_s': SLOT_SECONDS, 'builds': self.builds, 'total': self.total,
+                   'slots': self.slots, 'last': self.last, 'log_bytes': self.log_bytes}
+            self.saved_slot = self.slots[-1]['t'] if self.slots else None
+        tmp = self.path.with_name(self.path.name + '.tmp')
+        tmp.write_text(json.dumps(obj, ensure_ascii=False))
+        os.replace(tmp, self.path)
+        self.mtime_ns = self.path.stat().st_mtime_ns
+
+    def observe(self, entry: dict) -> None:
+        t = entry_time(entry)
+        values = entry_values(entry)
+        start = int(t // SLOT_SECONDS * SLOT_SECONDS)
+        with self.lock:
+            self.builds += 1
+            observe_into(self.total, values)
+            if not self.slots or self.slots[-1]['t'] < start:
+                self.slots.append({'t': start, 'm': {}})
+            slot = next((s for s in reversed(self.slots) if s['t'] <= start), self.slots[0])
+            observe_into(slot['m'], values)
+            del self.slots[:-SLOT_COUNT]
+            self.last = entry
+
+    def rolled_over(self) -> bool:
+        """True when a slot was started since the state file was last read or written."""
+        with self.lock:
+            return bool(self.slots) and self.slots[-1]['t'] != self.saved_slot
+
+    def window(self, metric: str, window_s: float | None = None, now: float | None = None) -> dict:
+        """Merged histogram of the slots that started within `window_s` (all slots if None)."""
+        now = time.time() if now is None else now
+        with self.lock:
+            aggs = [s['m'].get(metric) for s in self.slots
+                    if window_s is None or s['t'] + SLOT_SECONDS > now - window_s]
+        return merge_aggs(metric, aggs)
+
+    def quantile(self, metric: str, q: float, window_s: float | None = None) -> float | None:
+        if window_s is None:
+            with self.lock:
+                agg = merge_aggs(metric, [self.total.get(metric)])
+        else:
+            agg = self.window(metric, window_s)
+        return quantile(agg, metric, q)
+
+    def exposition(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        now = time.time()
+        window_s = SLOT_SECONDS * SLOT_COUNT
+        with self.lock:
+            total = {m: merge_aggs(m, [self.total.get(m)]) for m in HISTOGRAMS}
+            builds, last = self.builds, dict(self.last)
+        lines = ['# HELP kn_builds_total Knowledge builds recorded.', '# TYPE kn_builds_total counter',
+                 f'kn_builds_total {builds}']
+        for metric, (bounds, name, help_text) in HISTOGRAMS.items():
+            agg = total[metric]
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+            cum = 0
+            for bound, count in zip([*bounds, '+Inf'], agg['h']):
+                cum += count
+                lines.append(f'{name}_bucket{{le="{bound}"}} {cum}')
+            lines += [f'{name}_sum {agg["sum"]:.6g}', f'{name}_count {cum}']
+            recent = self.window(metric, window_s, now)
+            lines += [f'# HELP {name}_window {help_text[:-1]}, last {window_s}s.', f'# TYPE {name}_window summary']
+            for q in QUANTILES:
+                v = quantile(recent, metric, q)
+                lines.append(f'{name}_window{{quantile="{q}"}} {"NaN" if v is None else f"{v:.6g}"}')
+            lines += [f'{name}_window_sum {recent["sum"]:.6g}', f'{name}_window_count {sum(recent["h"])}']
+        if last:
+            lines += ['# HELP kn_build_last_timestamp_seconds End of the last build.',
+                      '# TYPE kn_build_last_timestamp_seconds gauge',
+                      f'kn_build_last_timestamp_seconds {entry_time(last):.0f}',
+                      '# HELP kn_build_last_files Files tracked by the last build.', '# TYPE kn_build_last_files gauge',
+                      f'kn_build_last_files {last.get("files", 0)}']
+            phases = last.get('phases') or {}
+            if phases:
+                lines += ['# HELP kn_build_last_phase_seconds Wall time per phase of the last build.',
+                          '# TYPE kn_build_last_phase_seconds gauge']
+                lines += [f'kn_build_last_phase_seconds{{phase="{p}"}} {v.get("wall_s", 0):.6g}'
+                          for p, v in phases.items()]
+            if last.get('cache_hit_ratio') is not None:
+                lines += ['# HELP kn_build_last_cache_hit_ratio Fingerprint cache hit ratio of the last build.',
+                          '# TYPE kn_build_last_cache_hit_ratio gauge',
+                          f'kn_build_last_cache_hit_ratio {last["cache_hit_ratio"]}']
+            if 'peak_rss_mb' in last:
+                lines += ['# HELP kn_build_last_peak_rss_bytes Peak RSS of the build process.',
+                          '# TYPE kn_build_last_peak_rss_bytes gauge',
+                          f'kn_build_last_peak_rss_bytes {int(last["peak_rss_mb"] * 1024 * 1024)}']
+        return '\n'.join(lines) + '\n'
+
+
+def compact_log(log_path: Path = LOG_FILE, rollup_dir: Path = ROLLUP_DIR, force: bool = False) -> int:
+    """Fold all but the last KEEP_LINES lines of the log into rollup segments once it is
+    larger than ROTATE_BYTES; returns the number of lines compacted."""
+    try:
+        if not force and log_path.stat().st_size <= ROTATE_BYTES:
+            return 0
+        lines = log_path.read_text(errors='replace').splitlines()
+    except OSError:
+        return 0
+    old, keep = lines[:-KEEP_LINES] if KEEP_LINES else lines, lines[-KEEP_LINES:] if KEEP_LINES else []
+    if not old:
+        return 0
+    buckets: dict[int, dict] = {}
+    for line in old:
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue
+        start = int(entry_time(entry) // DOWNSAMPLE_SECONDS * DOWNSAMPLE_SECONDS)
+        b = buckets.setdefault(start, {'t': start, 'n': 0, 'm': {}})
+        b['n'] += 1
+        b['files'] = entry.get('files', 0)
+        observe_into(b['m'], entry_values(entry))
+    rollup_dir.mkdir(parents=True, exist_ok=True)
+    by_segment: dict[str, list[str]] = {}
+    for start, b in sorted(buckets.items()):
+        name = datetime.fromtimestamp(start, UTC).strftime('rollup-%Y-%m.jsonl')
+        by_segment.setdefault(name, []).append(json.dumps(b))
+    for name, rows in by_segment.items():
+        with (rollup_dir / name).open('a') as f:
+            f.write('\n'.join(rows) + '\n')
+    tmp = log_path.with_name(log_path.name + '.tmp')
+    tmp.write_text(''.join(line + '\n' for line in keep))
+    os.replace(tmp, log_path)
+    return len(old)
+
+
+def load_rollups(rollup_dir: Path = ROLLUP_DIR, since: float = 0.0) -> list[dict]:
+    """Rollup buckets starting at or after `since`; a bucket split over two compactions
+    appears twice and is merged here."""
+    merged: dict[int, dict] = {}
+    for seg in sorted(rollup_dir.glob('rollup-*.jsonl')):
+        try:
+            rows = seg.read_text().splitlines()
+        except OSError:
+            continue
+        for line in rows:
+            try:
+                b = json.loads(line)
+            except ValueError:
+                continue
+            if b['t'] < since:
+                continue
+            cur = merged.get(b['t'])
+            if cur is None:
+                merged[b['t']] = b
+            else:
+                cur['n'] += b['n']
+                cur['files'] = b.get('files', cur.get('files'))
+                for m in HISTOGRAMS:
+                    cur['m'][m] = merge_aggs(m, [cur['m'].get(m), b['m'].get(m)])
+    return [merged[t] for t in sorted(merged)]
+
+
+def parse_addr(addr: str):
+    """'unix:/path', 'host:port' or ':port' (bound to localhost)."""
+    if addr.startswith('unix:'):
+        return 'unix', addr[5:]
+    host, _, port = addr.rpartition(':')
+    return 'tcp', (host or '127.0.0.1', int(port))
+
+
+def make_handler(rollup: MetricsRollup, refresh: bool):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if refresh:
+                rollup.reload()
+            url = urlparse(self.path)
+            if url.path == '/metrics':
+                self._reply(200, 'text/plain; version=0.0.4; charset=utf-8', rollup.exposition())
+            elif url.path == '/quantile':
+                qs = parse_qs(url.query)
+                try:
+                    metric = qs.get('metric', ['duration_s'])[0]
+                    q = float(qs.get('q', ['0.5'])[0])
+                    window = float(qs['window'][0]) if 'window' in qs else None
+                    if metric not in HISTOGRAMS or not 0 <= q <= 1:
+                        raise ValueError
+                except ValueError:
+                    self._reply(400, 'application/json', json.dumps({'error': 'bad metric, q or window'}))
+                    return
+                body = {'metric': metric, 'q': q, 'window_s': window, 'value': rollup.quantile(metric, q, window)}
+                self._reply(200, 'application/json', json.dumps(body))
+            else:
+                self._reply(404, 'text/plain', 'not found\n')
+
+        def _reply(self, status: int, ctype: str, body: str) -> None:
+            data = body.encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', ctype)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def address_string(self):
+            return self.client_address[0] if isinstance(self.client_address, tuple) else 'unix'
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(addr: str, rollup: MetricsRollup, refresh: bool = False):
+    kind, target = parse_addr(addr)
+    handler = make_handler(rollup, refresh)
+    if kind == 'unix':
+        try:
+            os.unlink(target)
+        except FileNotFoundError:
+            pass
+        return UnixHTTPServer(target, handler)
+    server = ThreadingHTTPServer(target, handler)
+    server.daemon_threads = True
+    return server
+
+
+def serve_in_thread(addr: str, rollup: MetricsRollup) -> threading.Thread:
+    """Serve `rollup` from a daemon thread (used by knowledge_build.py --daemon)."""
+    server = make_server(addr, rollup)
+    thread = threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True)
+    thread.start()
+    return thread
+
+
+def main():
+    args = sys.argv[1:]
+    if args[:1] == ['serve']:
+        addr = args[1] if len(args) > 1 else os.getenv('KN_METRICS_ADDR', DEFAULT_ADDR)
+        server = make_server(addr, MetricsRollup.load(), refresh=True)
+        print(f'serving metrics on {addr}', file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    elif args[:1] == ['quantile'] and len(args) in (3, 4) and args[1] in HISTOGRAMS:
+        v = MetricsRollup.load().quantile(args[1], float(args[2]), float(args[3]) if len(args) == 4 else None)
+        print('NaN' if v is None else f'{v:.6g}')
+    elif args[:1] == ['compact']:
+        print(f'compacted {compact_log(force=True)} lines')
+    elif args[:1] == ['history'] and len(args) in (2, 3) and args[1] in HISTOGRAMS:
+        since = time.time() - float(args[2]) if len(args) == 3 else 0.0
+        for b in load_rollups(since=since):
+            agg = b['m'].get(args[1]) or new_agg(args[1])
+            p50, p95 = quantile(agg, args[1], 0.5), quantile(agg, args[1], 0.95)
+            at = datetime.fromtimestamp(b['t'], UTC).strftime('%Y-%m-%dT%H:%MZ')
+            print(f"{at}  n={b['n']:<6} p50={p50 if p50 is None else f'{p50:.4g}'}  "
+                  f"p95={p95 if p95 is None else f'{p95:.4g}'}  max={agg['max']:.4g}")
+    elif not args:
+        sys.stdout.write(MetricsRollup.load().exposition())
+    else:
+        print('usage: metrics_store.py [serve [ADDR] | quantile METRIC Q [WINDOW_S] | compact | history METRIC [SINCE_S]]\n'
+              f"  METRIC: {', '.join(HISTOGRAMS)}; ADDR: host:port or unix:/path (default {DEFAULT_ADDR})",
+              file=sys.stderr)
+        sys.exit(2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+import os
+import re
+import sys
+import json
+from pathlib import Path
+
+try:
+    import yaml
+except ImportError:  # optional: only needed for flow-style YAML specs
+    yaml = None
+
+ME_ROOT = Path(os.getenv('KN_ME_ROOT', '/workspace/me'))
+INDEX_FILE = ME_ROOT / 'openapi_index.json'
+HTTP_METHODS = {'get', 'put', 'post', 'delete', 'options', 'head', 'patch', 'trace'}
+KEY_RE = re.compile(r'''^(?:"((?:[^"\\]|\\.)*)"|'((?:[^']|'')*)'|([^\s"'#][^#]*?))\s*:(?:\s+(.*)|$)''')
+REF_RE = re.compile(r'''["']?\$ref["']?\s*:\s*["']?([^"'\s,}]+)''')
+
+
+def _scalar(value: str) -> str:
+    value = value.strip()
+    if value[:1] in ('"', "'"):
+        quote = value[0]
+        end = value.find(quote, 1)
+        return value[1:end] if end > 0 else value[1:]
+    return value.split(' #', 1)[0].strip()
+
+
+def _flow_list(value: str) -> list[str]:
+    value = value.strip()
+    if value.startswith('[') and value.endswith(']'):
+        return [_scalar(v) for v in value[1:-1].split(',') if v.strip()]
+    return [_scalar(value)] if value else []
+
+
+def scan_yaml(lines) -> dict:
+    """Extract the OpenAPI structure from block-style YAML one line at a time.
+
+    Keeps only the stack of enclosing keys, so memory does not grow with the spec.
+    """
+    info = {'title': None, 'version': None, 'openapi': None, 'operations': [], 'schemas': []}
+    stack: list[tuple[int, str]] = []
+    op = None
+    block_indent = None
+    for raw in lines:
+        line = raw.rstrip('\r\n')
+        stripped = line.lstrip(' ')
+        if not stripped or stripped.startswith('#'):
+            continue
+        indent = len(line) - len(stripped)
+        if block_indent is not None:
+            if indent > block_indent:
+                continue
+            block_indent = None
+        # A list item's content sits at the column after its dash
+        while stripped.startswith('- '):
+            stripped = stripped[2:].lstrip(' ')
+            indent = len(line) - len(stripped)
+        while stack and stack[-1][0] >= indent:
+            stack.pop()
+        keys = [k for _, k in stack]
+        if op is not None and (len(keys) < 3 or keys[0] != 'paths' or keys[1] != op['path'] or keys[2].upper() != op['method']):
+            op = None
+        if op is not None:
+            op['refs'].extend(r for r in REF_RE.findall(stripped) if r not in op['refs'])
+        m = KEY_RE.match(stripped)
+        if m is None:
+            if op is not None and keys[3:] == ['tags']:
+                op['tags'].append(_scalar(stripped))
+            continue
+        key = m.group(1) if m.group(1) is not None else m.group(2) if m.group(2) is not None else m.group(3).strip()
+        value = (m.group(4) or '').strip()
+        depth = len(keys)
+        if depth == 0 and key in ('openapi', 'swagger'):
+            info['openapi'] = _scalar(value)
+        elif keys == ['info'] and key in ('title', 'version'):
+            info[key] = _scalar(value)
+        elif depth == 2 and keys[0] == 'paths' and keys[1].startswith('/') and key.lower() in HTTP_METHODS:
+            op = {'path': keys[1], 'method': key.upper(), 'operationId': None, 'summary': None, 'tags': [], 'refs': []}
+            info['operations'].append(op)
+        elif op is not None and depth == 3:
+            if key in ('operationId', 'summary'):
+                op[key] = _scalar(value)
+            elif key == 'tags':
+                op['tags'].extend(_flow_list(value))
+        elif keys == ['components', 'schemas'] or keys == ['definitions']:
+            info['schemas'].append(key)
+        if value[:1] in ('|', '>'):
+            block_indent = indent
+        stack.append((indent, key))
+    return info
+
+
+def _from_document(doc: dict) -> dict:
+    def refs_in(node, out):
+        if isinstance(node, dict):
+            for k, v in node.items():
+                if k == '$ref' and isinstance(v, str):
+                    if v not in out:
+                        out.append(v)
+                else:
+                    refs_in(v, out)
+        elif isinstance(node, list):
+            for v in node:
+                refs_in(v, out)
+        return out
+
+    meta = doc.get('info') or {}
+    ops = []
+    for path, item in (doc.get('paths') or {}).items():
+        for method, op in (item or {}).items():
+            if str(method).lower() not in HTTP_METHODS or not isinstance(op, dict):
+                continue
+            ops.append({'path': str(path), 'method': str(method).upper(), 'operationId': op.get('operationId'),
+                        'summary': op.get('summary'), 'tags': list(op.get('tags') or []), 'refs': refs_in(op, [])})
+    schemas = (doc.get('components') or {}).get('schemas') or doc.get('definitions') or {}
+    return {'title': meta.get('title'), 'version': None if meta.get('version') is None else str(meta.get('version')),
+            'openapi': str(doc.get('openapi') or doc.get('swagger') or '') or None,
+            'operations': ops, 'schemas': list(schemas)}
+
+
+def index_openapi(path: Path) -> dict:
+    if path.suffix == '.json':
+        with path.open('r', encoding='utf-8', errors='replace') as f:
+            info, parser = _from_document(json.load(f)), 'json'
+    else:
+        with path.open('r', encoding='utf-8', errors='replace') as f:
+            info, parser = scan_yaml(f), 'stream'
+        if not info['operations'] and yaml is not None:
+            # Flow-style or otherwise unusual YAML: fall back to a full parse
+            loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+            with path.open('r', encoding='utf-8', errors='replace') as f:
+                doc = yaml.load(f, Loader=loader)
+            if isinstance(doc, dict):
+                info, parser = _from_document(doc), 'yaml'
+    info['parser'] = parser
+    info['paths'] = len({op['path'] for op in info['operations']})
+    return info
+
+
+def load_index(path: Path = INDEX_FILE) -> dict:
+    try:
+        return json.loads(path.read_text()).get('specs', {})
+    except Exception:
+        return {}
+
+
+def find_operations(specs: dict, method: str | None = None, prefix: str | None = None, operation_id: str | None = None):
+    for rel, spec in sorted(specs.items()):
+        for op in spec.get('operations', []):
+            if method and op['method'] != method.upper():
+                continue
+            if prefix and not op['path'].startswith(prefix):
+                continue
+            if operation_id and op.get('operationId') != operation_id:
+                continue
+            yield rel, op
+
+
+def main():
+    args = sys.argv[1:]
+    opts = {'--method': None, '--prefix': None, '--op': None}
+    while args and args[0] in opts and len(args) > 1:
+        opts[args[0]] = args[1]
+        args = args[2:]
+    specs = load_index()
+    if not specs:
+        print('openapi index not built yet', file=sys.stderr)
+        sys.exit(1)
+    for rel, op in find_operations(specs, opts['--method'], opts['--prefix'], opts['--op']):
+        print(f"{op['method']:7} {op['path']}  {op.get('operationId') or '-'}  [{rel}]")
+
+
+if __name__ == '__main__':
+    main()
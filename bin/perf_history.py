@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+import os
+import re
+import sys
+import json
+import time
+import statistics
+from pathlib import Path
+from datetime import datetime, timezone
+
+REPORTS_DIR = Path(os.getenv('KN_REPORTS_DIR', '/workspace/reports'))
+HISTORY_FILE = Path(os.getenv('KN_ME_ROOT', '/workspace/me')) / 'perf_history.json'
+HISTORY_VERSION = 1
+# A report directory without report.md is only trusted once measure_all.sh has
+# left it alone for this long (older runs never wrote report.md)
+SETTLE_SECS = 600
+# metric -> (unit, True if higher is better)
+METRICS = {
+    'cpu.sha256_16k': ('B/s', True),
+    'cpu.aes256cbc_16k': ('B/s', True),
+    'cpu.rsa2048_sign': ('ops/s', True),
+    'cpu.rsa2048_verify': ('ops/s', True),
+    'disk.write': ('MB/s', True),
+    'disk.read': ('MB/s', True),
+    'fs.create_5k': ('s', False),
+    'fs.stat_5k': ('s', False),
+    'fs.read_5k': ('s', False),
+    'net.download': ('B/s', True),
+    'net.http_total': ('s', False),
+}
+# knowledge_build.json (bench_build.py) fields, tracked as build.<scenario>@<files>.<field>
+BUILD_FIELDS = {
+    'wall_s': ('s', False),
+    'cpu_s': ('s', False),
+    'peak_rss_mb': ('MB', False),
+    'read_mb': ('MB', False),
+}
+DD_RE = re.compile(r'copied, [\d.]+ s, ([\d.]+) ([kMG]?B)/s')
+DD_SCALE = {'B': 1e-6, 'kB': 1e-3, 'MB': 1.0, 'GB': 1e3}
+REPORT_RE = re.compile(r'^perf-(\d{8}-\d{6})$')
+
+
+def _read(raw: Path, name: str) -> str:
+    try:
+        return (raw / name).read_text(errors='replace')
+    except OSError:
+        return ''
+
+
+def _openssl_16k(text: str, algo: str) -> float | None:
+    # Summary row: algo, then throughput in 1000s of bytes/s per block size (16 bytes .. 16 KiB)
+    m = re.search(rf'^{re.escape(algo)}\s+(.+)$', text, re.M)
+    if not m:
+        return None
+    cols = m.group(1).split()
+    return float(cols[-1].rstrip('k')) * 1000 if cols and cols[-1].endswith('k') else None
+
+
+def parse_report(raw: Path) -> dict[str, float]:
+    values: dict[str, float] = {}
+    cpu = _read(raw, 'cpu_speed.txt')
+    for metric, algo in (('cpu.sha256_16k', 'sha256'), ('cpu.aes256cbc_16k', 'aes-256-cbc')):
+        v = _openssl_16k(cpu, algo)
+        if v is not None:
+            values[metric] = v
+    m = re.search(r'^rsa\s+2048 bits(?:\s+[\d.]+s){4}\s+([\d.]+)\s+([\d.]+)', cpu, re.M)
+    if m:
+        values['cpu.rsa2048_sign'], values['cpu.rsa2048_verify'] = float(m.group(1)), float(m.group(2))
+    for metric, name in (('disk.write', 'disk_write.txt'), ('disk.read', 'disk_read.txt')):
+        m = DD_RE.search(_read(raw, name))
+        if m:
+            values[metric] = float(m.group(1)) * DD_SCALE[m.group(2)]
+    for line in _read(raw, 'fs_micro.txt').splitlines():
+        if line.startswith('{'):
+            try:
+                fs = json.loads(line)
+            except ValueError:
+                break
+            for key in ('create', 'stat', 'read'):
+                if f'{key}_s' in fs:
+                    values[f'fs.{key}_5k'] = float(fs[f'{key}_s'])
+    m = re.search(r'size: (\d+) bytes speed: ([\d.]+) B/s', _read(raw, 'net_download_cf.txt'))
+    if m and int(m.group(1)):
+        values['net.download'] = float(m.group(2))
+    m = re.search(r'total: ([\d.]+)s', _read(raw, 'net_http_timing.txt'))
+    if m and float(m.group(1)):
+        values['net.http_total'] = float(m.group(1))
+    try:
+        bench = json.loads(_read(raw, 'knowledge_build.json') or '{}')
+    except ValueError:
+        bench = {}
+    for r in bench.get('results', []):
+        for field in BUILD_FIELDS:
+            if field in r:
+                values[f"build.{r['scenario']}@{r['files']}.{field}"] = float(r[field])
+    return values
+
+
+def metric_spec(metric: str) -> tuple[str, bool] | None:
+    if metric in METRICS:
+        return METRICS[metric]
+    if metric.startswith('build.'):
+        return BUILD_FIELDS.get(metric.rsplit('.', 1)[-1])
+    return None
+
+
+def report_host(raw: Path) -> str:
+    for line in _read(raw, 'sys_uname.txt').splitlines():
+        if not line.startswith('$'):
+            parts = line.split()
+            return parts[1] if len(parts) > 1 else 'unknown'
+    return 'unknown'
+
+
+def load_history(path: Path = HISTORY_FILE) -> dict:
+    try:
+        obj = json.loads(path.read_text())
+        if obj.get('version') == HISTORY_VERSION:
+            return obj
+    except Exception:
+        pass
+    return {'version': HISTORY_VERSION, 'parsed': [], 'series': {}}
+
+
+def update_history(reports_dir: Path = REPORTS_DIR, path: Path = HISTORY_FILE) -> dict:
+    """Parse report directories not seen before into {metric: [[ts, host, value], ...]}."""
+    history = load_history(path)
+    parsed = set(history['parsed'])
+    try:
+        names = sorted(d.name for d in reports_dir.iterdir() if REPORT_RE.match(d.name) and d.name not in parsed)
+    except OSError:
+        return history
+    added = False
+    for name in names:
+        report = reports_dir / name
+        raw = report / 'raw'
+        if not (report / 'report.md').exists():
+            try:
+                newest = max(p.stat().st_mtime for p in [report, *raw.iterdir()])
+            except (OSError, ValueError):
+                continue
+            if time.time() - newest < SETTLE_SECS:
+                continue
+        ts = datetime.strptime(REPORT_RE.match(name).group(1), '%Y%m%d-%H%M%S').replace(tzinfo=timezone.utc)
+        host = report_host(raw)
+        for metric, value in parse_report(raw).items():
+            history['series'].setdefault(metric, []).append([ts.strftime('%Y-%m-%dT%H:%M:%SZ'), host, value])
+        history['parsed'].append(name)
+        added = True
+    if added:
+        for samples in history['series'].values():
+            samples.sort()
+        tmp = path.with_name(path.name + '.tmp')
+        tmp.write_text(json.dumps(history, ensure_ascii=False))
+        os.replace(tmp, path)
+    return history
+
+
+def summarize(history: dict, threshold_pct: float | None = None) -> list[dict]:
+    """Per metric, on the host of its latest sample: latest value, median of the earlier
+    samples and the change against it; `regressed` when worse by more than threshold_pct."""
+    if threshold_pct is None:
+        threshold_pct = float(os.getenv('KN_PERF_REGRESSION_PCT', '10'))
+    rows = []
+    for metric in [*METRICS, *sorted(m for m in history['series'] if m not in METRICS)]:
+        samples = history['series'].get(metric)
+        spec = metric_spec(metric)
+        if not samples or spec is None:
+            continue
+        unit, higher_better = spec
+        ts, host, latest = samples[-1]
+        earlier = [v for _, h, v in samples[:-1] if h == host]
+        row = {'metric': metric, 'unit': unit, 'host': host, 'at': ts, 'latest': latest, 'runs': len(earlier) + 1,
+               'median': None, 'delta_pct': None, 'regressed': False}
+        if earlier:
+            median = statistics.median(earlier)
+            row['median'] = median
+            if median:
+                delta = (latest - median) / median * 100
+                row['delta_pct'] = delta
+                row['regressed'] = (-delta if higher_better else delta) > threshold_pct
+        rows.append(row)
+    return rows
+
+
+def fmt_value(value: float | None, unit: str) -> str:
+    if value is None:
+        return '-'
+    if unit == 'B/s':
+        for scale, name in ((1e9, 'GB/s'), (1e6, 'MB/s'), (1e3, 'kB/s')):
+            if value >= scale:
+                return f'{value / scale:.2f} {name}'
+        return f'{value:.0f} B/s'
+    if unit == 's':
+        return f'{value:.3f} s'
+    return f'{value:,.1f} {unit}' if unit == 'ops/s' else f'{value:.0f} {unit}'
+
+
+def main():
+    rows = summarize(update_history())
+    if '--json' in sys.argv[1:]:
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+        return
+    for r in rows:
+        delta = '' if r['delta_pct'] is None else f"{r['delta_pct']:+.1f}%"
+        flag = '  REGRESSION' if r['regressed'] else ''
+        print(f"{r['metric']:32} {fmt_value(r['latest'], r['unit']):>14}  median {fmt_value(r['median'], r['unit']):>14}  {delta:>7}{flag}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import time
+import zlib
+import shutil
+import hashlib
+from pathlib import Path
+from datetime import datetime, timezone
+
+from chunk_hash import chunk_params, iter_chunks
+
+try:
+    import zstandard
+except ImportError:  # optional: zlib is used when it is missing
+    zstandard = None
+
+# Content-addressed snapshots of the build outputs:
+#   objects/ab/<sha256>    one compressed chunk per file, named by the sha256 of its raw bytes;
+#                          the first byte says how the rest is stored (CODEC_*)
+#   manifests/<id>.json    {id, created_utc, files: {name: {size, mtime_ns, sha256, chunks}}}
+#                          with chunks = [[sha256, length], ...] in file order
+# Chunks are content-defined (chunk_hash), so an edit only adds the chunks around it,
+# and an output whose size and mtime match the previous manifest is not even read.
+# A snapshot is complete once its manifest exists; pruning deletes manifests and then
+# the objects no manifest refers to, never rewriting a kept snapshot.
+ME_ROOT = Path(os.getenv('KN_ME_ROOT', '/workspace/me'))
+SNAPSHOTS_DIR = ME_ROOT / 'snapshots'
+CODEC_RAW = 0
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+UTC = timezone.utc
+
+
+def env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+CHUNK_AVG_BYTES = env_int('KN_SNAPSHOT_CHUNK_BYTES', 64 * 1024)
+INTERVAL_S = env_int('KN_SNAPSHOT_INTERVAL_S', 86400)
+KEEP = env_int('KN_SNAPSHOT_KEEP', 30)
+GC_GRACE_S = 3600
+
+
+def compress(data: bytes) -> bytes:
+    if zstandard is not None:
+        codec, packed = CODEC_ZSTD, zstandard.ZstdCompressor(level=6).compress(data)
+    else:
+        codec, packed = CODEC_ZLIB, zlib.compress(data, 6)
+    if len(packed) >= len(data):
+        codec, packed = CODEC_RAW, data
+    return bytes([codec]) + packed
+
+
+def decompress(blob: bytes) -> bytes:
+    codec, data = blob[0], blob[1:]
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(data)
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError('snapshot chunk is zstd-compressed but the zstandard module is not installed')
+        return zstandard.ZstdDecompressor().decompress(data)
+    return data
+
+
+class SnapshotStore:
+    def __init__(self, root: Path = SNAPSHOTS_DIR):
+        self.root = root
+        self.objects = root / 'objects'
+        self.manifests = root / 'manifests'
+
+    def ids(self) -> list[str]:
+        try:
+            return sorted(p.stem for p in self.manifests.glob('*.json'))
+        except OSError:
+            return []
+
+    def manifest(self, snap_id: str) -> dict:
+        return json.loads((self.manifests / f'{snap_id}.json').read_text())
+
+    def _object(self, sha: str) -> Path:
+        return self.objects / sha[:2] / sha
+
+    def _store_file(self, path: Path, prev: dict | None, stats: dict) -> dict:
+        st = path.stat()
+        if prev and prev.get('size') == st.st_size and prev.get('mtime_ns') == st.st_mtime_ns:
+            return prev
+        params = chunk_params(CHUNK_AVG_BYTES)
+        chunks = []
+        whole = hashlib.sha256()
+        with path.open('rb') as f:
+            for _, data, digest in iter_chunks(f, 0, params):
+                sha = digest.hex()
+                chunks.append([sha, len(data)])
+                whole.update(data)
+                obj = self._object(sha)
+                if obj.exists():
+                    # Refresh the mtime so a concurrent gc() treats the chunk as new
+                    os.utime(obj)
+                    continue
+                obj.parent.mkdir(parents=True, exist_ok=True)
+                blob = compress(bytes(data))
+                tmp = obj.with_name(obj.name + '.tmp')
+                tmp.write_bytes(blob)
+                os.replace(tmp, obj)
+                stats['new_chunks'] += 1
+                stats['stored_bytes'] += len(blob)
+        return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sha256': whole.hexdigest(), 'chunks': chunks}
+
+    def take(self, outputs: list[Path], now_dt: datetime) -> dict:
+        """Snapshot the existing `outputs`; returns the manifest plus chunk statistics."""
+        ids = self.ids()
+        prev_files = {}
+        if ids:
+            try:
+                prev_files = self.manifest(ids[-1])['files']
+            except Exception:
+                pass
+        stats = {'new_chunks': 0, 'stored_bytes': 0}
+        files = {}
+        for p in outputs:
+            try:
+                files[p.name] = self._store_file(p, prev_files.get(p.name), stats)
+            except OSError:
+                continue
+        snap_id = now_dt.strftime('%Y%m%d-%H%M%S')
+        manifest = {'id': snap_id, 'created_utc': now_dt.strftime('%Y-%m-%dT%H:%M:%SZ'), 'files': files}
+        self.manifests.mkdir(parents=True, exist_ok=True)
+        tmp = self.manifests / f'{snap_id}.json.tmp'
+        tmp.write_text(json.dumps(manifest, ensure_ascii=False))
+        os.replace(tmp, self.manifests / f'{snap_id}.json')
+        return {**manifest, **stats}
+
+    def due(self, now_dt: datetime, interval_s: int = INTERVAL_S) -> bool:
+        """True when no snapshot exists in the current `interval_s` period (a UTC day by default)."""
+        ids = self.ids()
+        if not ids:
+            return True
+        try:
+            last = datetime.strptime(ids[-1], '%Y%m%d-%H%M%S').replace(tzinfo=UTC)
+        except ValueError:
+            return True
+        return int(now_dt.timestamp()) // interval_s != int(last.timestamp()) // interval_s
+
+    def prune(self, keep: int = KEEP) -> int:
+        """Drop all but the newest `keep` snapshots, then their unreferenced chunks."""
+        ids = self.ids()
+        drop = ids[:-keep] if keep > 0 else []
+        for snap_id in drop:
+            (self.manifests / f'{snap_id}.json').unlink(missing_ok=True)
+        if drop:
+            self.gc()
+        return len(drop)
+
+    def gc(self) -> int:
+        """Delete chunk objects no manifest refers to; returns how many were removed."""
+        live = set()
+        for snap_id in self.ids():
+            try:
+                for rec in self.manifest(snap_id)['files'].values():
+                    live.update(sha for sha, _ in rec['chunks'])
+            except Exception:
+                # An unreadable manifest could refer to anything: keep every object
+                return 0
+        # Chunks of a snapshot still being taken have no manifest yet
+        cutoff = time.time() - GC_GRACE_S
+        removed = 0
+        for obj in self.objects.glob('*/*'):
+            try:
+                if obj.name not in live and obj.stat().st_mtime < cutoff:
+                    obj.unlink()
+                    removed += 1
+            except OSError:
+                pass
+        return removed
+
+    def stream(self, snap_id: str, name: str, out) -> int:
+        """Write file `name` of snapshot `snap_id` to the binary stream `out`, verifying each chunk."""
+        rec = self.manifest(snap_id)['files'][name]
+        written = 0
+        for sha, length in rec['chunks']:
+            data = decompress(self._object(sha).read_bytes())
+            if len(data) != length or hashlib.sha256(data).hexdigest() != sha:
+                raise RuntimeError(f'snapshot {snap_id}: chunk {sha} of {name} is corrupt')
+            out.write(data)
+            written += len(data)
+        return written
+
+    def restore(self, snap_id: str, dest: Path, names: list[str] | None = None) -> list[Path]:
+        files = self.manifest(snap_id)['files']
+        dest.mkdir(parents=True, exist_ok=True)
+        restored = []
+        for name in names or sorted(files):
+            target = dest / name
+            tmp = target.with_name(target.name + '.tmp')
+            with tmp.open('wb') as out:
+                self.stream(snap_id, name, out)
+            os.replace(tmp, target)
+            restored.append(target)
+        return restored
+
+    def import_legacy(self) -> list[str]:
+        """Move old full-copy snapshots (snapshots/YYYYMMDD/) into the store."""
+        imported = []
+        for day in sorted(p for p in self.root.glob('[0-9]' * 8) if p.is_dir()):
+            outputs = sorted(p for p in day.iterdir() if p.is_file())
+            when = datetime.strptime(day.name, '%Y%m%d').replace(tzinfo=UTC)
+            if not outputs or (self.manifests / f"{when.strftime('%Y%m%d-%H%M%S')}.json").exists():
+                continue
+            self.take(outputs, when)
+            shutil.rmtree(day, ignore_errors=True)
+            imported.append(day.name)
+        return imported
+
+
+def main():
+    args = sys.argv[1:]
+    store = SnapshotStore()
+    if args[:1] == ['list'] or not args:
+        for snap_id in store.ids():
+            files = store.manifest(snap_id)['files']
+            print(f"{snap_id}  " + '  '.join(f"{name}={rec['size']}" for name, rec in sorted(files.items())))
+    elif args[:1] == ['cat'] and len(args) == 3:
+        store.stream(args[1], args[2], sys.stdout.buffer)
+    elif args[:1] == ['restore'] and len(args) >= 3:
+        for p in store.restore(args[1], Path(args[2]), args[3:] or None):
+            print(p)
+    elif args[:1] == ['prune'] and len(args) <= 2:
+        print(f'pruned {store.prune(int(args[1]) if len(args) == 2 else KEEP)} snapshots')
+    elif args[:1] == ['gc']:
+        print(f'removed {store.gc()} chunks')
+    elif args[:1] == ['import-legacy']:
+        print('imported: ' + (', '.join(store.import_legacy()) or 'nothing'))
+    else:
+        print('usage: snapshot_store.py [list | cat ID NAME | restore ID DEST [NAME...] | prune [KEEP] | gc | import-legacy]',
+              file=sys.stderr)
+        sys.exit(2)
+
+
+if __name__ == '__main__':
+    main()
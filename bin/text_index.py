@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+import os
+import re
+import sys
+import json
+import math
+import mmap
+import time
+import heapq
+import struct
+from pathlib import Path
+from collections import Counter
+
+# Segment layout (little-endian), one immutable file per flush or merge:
+#   header | doc table (DOC per document) | term table (TERM per term, sorted by utf-8 bytes) | postings | strings
+# A term lookup is a binary search over the fixed-size term records of the mmap'd file;
+# its postings are `df` (local doc id, term frequency) pairs.  Replaced or deleted
+# documents are tombstoned in the manifest and dropped when segments are merged.
+ME_ROOT = Path(os.getenv('KN_ME_ROOT', '/workspace/me'))
+INDEX_DIR = ME_ROOT / '.knowledge_fts'
+MAGIC = b'KNFT'
+VERSION = 1
+HEADER = struct.Struct('<4sHHIIQQQ')    # magic, version, reserved, docs, terms, term table offset, postings offset, strings offset
+DOC = struct.Struct('<QII')             # path str offset, path str length, length in tokens
+TERM = struct.Struct('<QIQI')           # term str offset, term str length, postings offset, df
+POSTING = struct.Struct('<II')          # local doc id, term frequency
+TEXT_SUFFIXES = {'.md', '.txt', '.rst', '.yaml', '.yml', '.json', '.php', '.py', '.sh', '.js', '.ts',
+                 '.html', '.css', '.sql', '.ini', '.toml', '.conf', '.xml'}
+BM25_K1 = 1.2
+BM25_B = 0.75
+MAX_TOKEN_CHARS = 64
+
+WORD_RE = re.compile(r'[^\W_]+')
+ARABIC_MARKS_RE = re.compile('[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]')   # tashkeel, Quranic marks, tatweel
+ARABIC_RE = re.compile('[\u0600-\u06ff]')
+ARABIC_FOLD = [('أ', 'ا'), ('إ', 'ا'), ('آ', 'ا'), ('ٱ', 'ا'), ('ى', 'ي'), ('ة', 'ه'), ('ؤ', 'و'), ('ئ', 'ي'),
+               *((chr(0x660 + i), str(i)) for i in range(10)), *((chr(0x6f0 + i), str(i)) for i in range(10))]
+ARABIC_PREFIXES = ('وال', 'بال', 'كال', 'فال', 'لل', 'ال')
+
+
+def env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+MAX_BYTES = env_int('KN_FTS_MAX_BYTES', 1024 * 1024)
+MAX_SEGMENTS = env_int('KN_FTS_MAX_SEGMENTS', 8)
+
+
+def normalize_token(word: str) -> str:
+    if '\u0600' <= word[0] <= '\u06ff':
+        # Light Arabic stemming: drop the definite article and its attached particles
+        for prefix in ARABIC_PREFIXES:
+            if word.startswith(prefix) and len(word) - len(prefix) >= 2:
+                return word[len(prefix):]
+    return word
+
+
+def _words(text: str) -> list[str]:
+    text = text.lower()
+    if ARABIC_RE.search(text):
+        text = ARABIC_MARKS_RE.sub('', text)
+        for src, dst in ARABIC_FOLD:
+            text = text.replace(src, dst)
+    return WORD_RE.findall(text)
+
+
+def tokenize(text: str) -> list[str]:
+    """Lower-cased words; Arabic is stripped of diacritics/tatweel, hamza and alef forms
+    are folded, Arabic-Indic digits become ASCII and the definite article is removed."""
+    return [normalize_token(w) for w in _words(text) if 1 < len(w) <= MAX_TOKEN_CHARS]
+
+
+def term_counts(text: str) -> tuple[dict[str, int], int]:
+    """({term: frequency}, token count) of tokenize(text), normalising each distinct word once."""
+    counts: dict[str, int] = {}
+    length = 0
+    for w, n in Counter(_words(text)).items():
+        if 1 < len(w) <= MAX_TOKEN_CHARS:
+            t = normalize_token(w)
+            counts[t] = counts.get(t, 0) + n
+            length += n
+    return counts, length
+
+
+def indexable(rel: str, size: int) -> bool:
+    return size <= MAX_BYTES and os.path.splitext(rel)[1].lower() in TEXT_SUFFIXES
+
+
+def write_segment(path: Path, docs: list[tuple[str, int]], postings: dict[str, list[tuple[int, int]]]) -> None:
+    strings = bytearray()
+    doc_table = bytearray()
+    for rel, length in docs:
+        b = rel.encode('utf-8', 'surrogateescape')
+        doc_table += DOC.pack(len(strings), len(b), length)
+        strings += b
+    term_table = bytearray()
+    post = bytearray()
+    for tb, plist in sorted((t.encode('utf-8'), plist) for t, plist in postings.items()):
+        term_table += TERM.pack(len(strings), len(tb), len(post), len(plist))
+        strings += tb
+        post += struct.pack(f'<{2 * len(plist)}I', *(v for pair in plist for v in pair))
+    term_off = HEADER.size + len(doc_table)
+    post_off = term_off + len(term_table)
+    strings_off = post_off + len(post)
+    tmp = path.with_name(path.name + '.tmp')
+    with tmp.open('wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, 0, len(docs), len(postings), term_off, post_off, strings_off))
+        f.write(doc_table)
+        f.write(term_table)
+        f.write(post)
+        f.write(strings)
+    os.replace(tmp, path)
+
+
+class Segment:
+    """Read-only, memory-mapped view over one segment file."""
+
+    def __init__(self, path: Path):
+        with path.open('rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, self.doc_count, self.term_count, self._term_off, self._post_off, self._strings_off = \
+            HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self._mm.close()
+            raise ValueError(f'not a text index segment: {path}')
+
+    def close(self) -> None:
+        self._mm.close()
+
+    def _string(self, off: int, length: int) -> bytes:
+        start = self._strings_off + off
+        return self._mm[start:start + length]
+
+    def doc(self, i: int) -> tuple[str, int]:
+        off, length, tokens = DOC.unpack_from(self._mm, HEADER.size + i * DOC.size)
+        return self._string(off, length).decode('utf-8', 'surrogateescape'), tokens
+
+    def doc_length(self, i: int) -> int:
+        return DOC.unpack_from(self._mm, HEADER.size + i * DOC.size)[2]
+
+    def _term(self, i: int) -> tuple[bytes, int, int]:
+        off, length, post, df = TERM.unpack_from(self._mm, self._term_off + i * TERM.size)
+        return self._string(off, length), post, df
+
+    def _lower_bound(self, key: bytes) -> int:
+        lo, hi = 0, self.term_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term(mid)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _postings(self, post: int, df: int):
+        start = self._post_off + post
+        return struct.iter_unpack('<II', self._mm[start:start + df * POSTING.size])
+
+    def postings(self, term: str):
+        key = term.encode('utf-8')
+        i = self._lower_bound(key)
+        if i < self.term_count:
+            tb, post, df = self._term(i)
+            if tb == key:
+                return self._postings(post, df)
+        return iter(())
+
+    def expand(self, prefix: str) -> list[str]:
+        key = prefix.encode('utf-8')
+        out = []
+        for i in range(self._lower_bound(key), self.term_count):
+            tb = self._term(i)[0]
+            if not tb.startswith(key):
+                break
+            out.append(tb.decode('utf-8'))
+        return out
+
+    def terms(self):
+        for i in range(self.term_count):
+            tb, post, df = self._term(i)
+            yield tb.decode('utf-8'), self._postings(post, df)
+
+
+def load_manifest(directory: Path) -> dict | None:
+    try:
+        manifest = json.loads((directory / 'manifest.json').read_text())
+        return manifest if manifest.get('version') == VERSION else None
+    except Exception:
+        return None
+
+
+class TextIndex:
+    """Incrementally maintained inverted index over the text files of tran/.
+
+    `add` buffers new documents in memory; `commit` writes them as one new segment,
+    tombstones what they replace and merges all segments into one once there are
+    more than KN_FTS_MAX_SEGMENTS or tombstones outnumber live documents.
+    `docs.json` maps each path to (segment, local id, sha256, tokens) and is only
+    needed for updates; queries read the small manifest and the segments.
+    """
+
+    def __init__(self, directory: Path):
+        self.dir = directory
+        self.loaded = False
+        self.segments: list[str] = []
+        self.deleted: dict[str, list[int]] = {}
+        self.docs: dict[str, list] = {}
+        self.next = 0
+        self.dirty = False
+        self._pending_docs: list[tuple[str, str, int]] = []
+        self._pending_postings: dict[str, list[tuple[int, int]]] = {}
+        self._obsolete: list[str] = []
+
+    @classmethod
+    def load(cls, directory: Path = INDEX_DIR) -> 'TextIndex':
+        idx = cls(directory)
+        manifest = load_manifest(directory)
+        if manifest is not None:
+            try:
+                idx.docs = json.loads((directory / 'docs.json').read_text())
+                idx.segments = manifest['segments']
+                idx.deleted = manifest['deleted']
+                idx.next = manifest['next']
+                idx.loaded = True
+            except Exception:
+                idx.docs = {}
+        return idx
+
+    def reset(self) -> None:
+        self._obsolete.extend(self.segments)
+        self.segments, self.deleted, self.docs = [], {}, {}
+        self.loaded = True
+        self.dirty = True
+
+    def sha(self, rel: str) -> str:
+        doc = self.docs.get(rel)
+        return doc[2] if doc else ''
+
+    def remove(self, rel: str) -> None:
+        doc = self.docs.pop(rel, None)
+        if doc is not None:
+            self.deleted.setdefault(doc[0], []).append(doc[1])
+            self.dirty = True
+
+    def add(self, rel: str, sha: str, text: str) -> None:
+        self.remove(rel)
+        local = len(self._pending_docs)
+        counts, length = term_counts(text)
+        for t, tf in counts.items():
+            self._pending_postings.setdefault(t, []).append((local, tf))
+        self._pending_docs.append((rel, sha, length))
+        self.dirty = True
+
+    def _deleted_segment(self, name: str) -> None:
+        try:
+            os.unlink(self.dir / name)
+        except OSError:
+            pass
+
+    def _new_segment_name(self) -> str:
+        self.next += 1
+        return f'seg-{self.next:06d}.bin'
+
+    def _flush(self) -> None:
+        if not self._pending_docs:
+            return
+        name = self._new_segment_name()
+        write_segment(self.dir / name, [(rel, n) for rel, _, n in self._pending_docs], self._pending_postings)
+        for local, (rel, sha, n) in enumerate(self._pending_docs):
+            self.docs[rel] = [name, local, sha, n]
+        self.segments.append(name)
+        self._pending_docs, self._pending_postings = [], {}
+
+    def _merge(self) -> list[str]:
+        """Rewrite all segments as one without tombstoned documents; returns the replaced names."""
+        docs: list[tuple[str, int]] = []
+        postings: dict[str, list[tuple[int, int]]] = {}
+        name = self._new_segment_name()
+        for old in self.segments:
+            seg = Segment(self.dir / old)
+            try:
+                dead = set(self.deleted.get(old, ()))
+                remap = {}
+                for i in range(seg.doc_count):
+                    if i not in dead:
+                        rel, n = seg.doc(i)
+                        remap[i] = len(docs)
+                        docs.append((rel, n))
+                        self.docs[rel][:2] = [name, remap[i]]
+                for term, plist in seg.terms():
+                    kept = [(remap[d], tf) for d, tf in plist if d in remap]
+                    if kept:
+                        postings.setdefault(term, []).extend(kept)
+            finally:
+                seg.close()
+        write_segment(self.dir / name, docs, postings)
+        replaced, self.segments, self.deleted = self.segments, [name], {}
+        return replaced
+
+    def commit(self) -> bool:
+        if not self.dirty:
+            return False
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self._flush()
+        live = len(self.docs)
+        dead = sum(len(v) for v in self.deleted.values())
+        replaced, self._obsolete = self._obsolete, []
+        if len(self.segments) > MAX_SEGMENTS or (dead and dead > live):
+            replaced.extend(self._merge())
+        # Segments no document refers to any more are dropped without a merge
+        for name in [n for n in self.segments if len(self.deleted.get(n, ())) >= self._doc_count(n)]:
+            self.segments.remove(name)
+            self.deleted.pop(name, None)
+            replaced.append(name)
+        manifest = {
+            'version': VERSION,
+            'segments': self.segments,
+            'deleted': self.deleted,
+            'next': self.next,
+            'live': live,
+            'tokens': sum(d[3] for d in self.docs.values()),
+        }
+        for fname, obj in (('docs.json', self.docs), ('manifest.json', manifest)):
+            tmp = self.dir / (fname + '.tmp')
+            tmp.write_text(json.dumps(obj, ensure_ascii=False))
+            os.replace(tmp, self.dir / fname)
+        for name in replaced:
+            self._deleted_segment(name)
+        self.dirty = False
+        return True
+
+    def _doc_count(self, name: str) -> int:
+        try:
+            with (self.dir / name).open('rb') as f:
+                return HEADER.unpack(f.read(HEADER.size))[3]
+        except (OSError, struct.error):
+            return 0
+
+
+def search(query: str, limit: int = 10, directory: Path = INDEX_DIR, retry: bool = True) -> list[tuple[float, str]]:
+    """BM25-ranked (score, path) pairs; a trailing `*` on a query word matches it as a prefix."""
+    manifest = load_manifest(directory)
+    if manifest is None or not manifest['live']:
+        return []
+    segments = []
+    try:
+        for name in manifest['segments']:
+            segments.append((Segment(directory / name), set(manifest['deleted'].get(name, ()))))
+    except FileNotFoundError:
+        # A merge replaced the segments between reading the manifest and opening them
+        for seg, _ in segments:
+            seg.close()
+        if not retry:
+            raise
+        return search(query, limit, directory, retry=False)
+    try:
+        words: list[tuple[str, bool]] = []
+        for raw in query.split():
+            toks = tokenize(raw.rstrip('*'))
+            words.extend((t, False) for t in toks[:-1])
+            if toks:
+                words.append((toks[-1], raw.endswith('*')))
+        terms: dict[str, None] = {}
+        for word, is_prefix in words:
+            if is_prefix:
+                for seg, _ in segments:
+                    terms.update(dict.fromkeys(seg.expand(word)))
+            else:
+                terms[word] = None
+        n = manifest['live']
+        avgdl = max(1.0, manifest['tokens'] / n)
+        scores: dict[tuple[int, int], float] = {}
+        for term in terms:
+            hits = [(si, d, tf) for si, (seg, dead) in enumerate(segments)
+                    for d, tf in seg.postings(term) if d not in dead]
+            if not hits:
+                continue
+            idf = math.log(1 + (n - len(hits) + 0.5) / (len(hits) + 0.5))
+            for si, d, tf in hits:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * segments[si][0].doc_length(d) / avgdl)
+                scores[(si, d)] = scores.get((si, d), 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+        top = heapq.nlargest(limit, scores.items(), key=lambda kv: kv[1])
+        return [(score, segments[si][0].doc(d)[0]) for (si, d), score in top]
+    finally:
+        for seg, _ in segments:
+            seg.close()
+
+
+def main():
+    args = sys.argv[1:]
+    limit = 10
+    if len(args) > 1 and args[0] == '-n':
+        limit, args = int(args[1]), args[2:]
+    if not args:
+        print('usage: text_index.py [-n LIMIT] QUERY...', file=sys.stderr)
+        sys.exit(2)
+    if load_manifest(INDEX_DIR) is None:
+        print('text index not built yet', file=sys.stderr)
+        sys.exit(1)
+    start = time.perf_counter()
+    results = search(' '.join(args), limit)
+    for score, rel in results:
+        print(f'{score:8.3f}  {rel}')
+    print(f'{len(results)} results in {(time.perf_counter() - start) * 1000:.1f} ms', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()